@@ -7,15 +7,44 @@ from Crypto.Cipher import AES
 from Crypto.Random import get_random_bytes
 from Crypto.Util.Padding import pad, unpad
 import base64
+import key_provider
+import stream_cipher
 
 
 class AESCipher:
+    name = "AES"
+    block_size = AES.block_size
+    auth_mode = "GCM"
+    auth_nonce_size = stream_cipher.GCM_NONCE_SIZE
+    authenticated_only = False  # True for ciphers without an unauthenticated mode
+    passphrase_key_size = 32  # bytes derived from a passphrase key file
+    
     def __init__(self, key=None):
         """Initialize AES cipher with a key (16, 24, or 32 bytes)"""
         if key is None:
             self.key = get_random_bytes(16)  # AES-128
         else:
             self.key = key if isinstance(key, bytes) else key.encode()
+        self._fingerprint = None  # computed on first use; it is deliberately slow
+    
+    @classmethod
+    def from_key_file(cls, path, provider=None):
+        """Create AESCipher from a key file (raw ASCII key, or passphrase and salt)"""
+        provider = provider if provider is not None else key_provider.PROVIDER
+        key_bytes = provider.load_key(path, cls.passphrase_key_size)
+        if len(key_bytes) not in [16, 24, 32]:
+            raise ValueError(f"AES key must be 16, 24, or 32 bytes. Current: {len(key_bytes)} bytes")
+        return cls(key_bytes)
+    
+    def fingerprint(self):
+        """Short key identifier for file headers (see key_provider.key_fingerprint)"""
+        if self._fingerprint is None:
+            self._fingerprint = key_provider.key_fingerprint(self.name, self.key)
+        return self._fingerprint
+    
+    def legacy_fingerprint(self):
+        """Fingerprint that earlier versions wrote; recognised when reading their files"""
+        return key_provider.legacy_fingerprint(self.name, self.key)
     
     def encrypt(self, plaintext):
         """Encrypt plaintext using AES in CBC mode"""
@@ -27,15 +56,22 @@ class AESCipher:
     
     def decrypt(self, ciphertext):
         """Decrypt ciphertext using AES in CBC mode"""
+        try:
+            return self.decrypt_text(ciphertext)
+        except ValueError as e:
+            return str(e)
+    
+    def decrypt_text(self, ciphertext):
+        """Like decrypt(), but raises ValueError instead of returning an error message"""
         try:
             iv, ct = ciphertext.split(':')
-            iv = base64.b64decode(iv)
-            ct = base64.b64decode(ct)
+            iv = base64.b64decode(iv, validate=True)
+            ct = base64.b64decode(ct, validate=True)
             cipher = AES.new(self.key, AES.MODE_CBC, iv)
             pt = unpad(cipher.decrypt(ct), AES.block_size)
             return pt.decode('utf-8')
-        except Exception as e:
-            return f"Decryption failed: {str(e)}"
+        except (ValueError, TypeError, AttributeError) as e:
+            raise ValueError(f"Decryption failed: {e}") from None
     
     def encrypt_file(self, data):
         """Encrypt binary file data"""
@@ -52,3 +88,29 @@ class AESCipher:
         cipher = AES.new(self.key, AES.MODE_CBC, iv)
         pt = unpad(cipher.decrypt(ct), AES.block_size)
         return pt
+    
+    def encryptor(self, iv=None):
+        """Return an incremental CBC encryptor (see stream_cipher.CBCEncryptor)"""
+        return stream_cipher.CBCEncryptor(AES, self.key, iv)
+    
+    def decryptor(self, iv):
+        """Return an incremental CBC decryptor for the given IV"""
+        return stream_cipher.CBCDecryptor(AES, self.key, iv)
+    
+    def auth_encryptor(self, aad=b''):
+        """Return an incremental authenticated (GCM) encryptor; aad is authenticated too"""
+        return stream_cipher.GCMEncryptor(AES, self.key, aad)
+    
+    def auth_decryptor(self, nonce, aad=b''):
+        """Return an incremental authenticated (GCM) decryptor that verifies the trailing tag"""
+        return stream_cipher.GCMDecryptor(AES, self.key, nonce, aad)
+    
+    def encrypt_stream(self, src, dst, chunk_size=stream_cipher.DEFAULT_CHUNK_SIZE, on_chunk=None,
+                       executor=None):
+        """Encrypt a binary stream chunk by chunk (same IV||ciphertext format as encrypt_file)"""
+        return stream_cipher.encrypt_stream(AES, self.key, src, dst, chunk_size, on_chunk, executor)
+    
+    def decrypt_stream(self, src, dst, chunk_size=stream_cipher.DEFAULT_CHUNK_SIZE, on_chunk=None,
+                       executor=None):
+        """Decrypt an IV||ciphertext binary stream chunk by chunk"""
+        return stream_cipher.decrypt_stream(AES, self.key, src, dst, chunk_size, on_chunk, executor)
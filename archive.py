@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Encrypted Archives
+Packs many files into one AES-encrypted container. All member data is
+encrypted as a single AES-CTR stream (one cipher object for the whole
+archive), and an AES-GCM encrypted table of contents records each member's
+offset, size and SHA-256. Because CTR can start at any block, a single
+member can be listed or extracted without decrypting the others.
+
+Layout:
+    FileHeader (cipher AES, mode ARCHIVE)
+    member data: AES-CTR stream of all members back to back
+    sealed TOC: nonce | GCM ciphertext of the JSON table of contents | tag
+    trailer: sealed TOC length (8) | b'CTOC'
+
+The TOC is authenticated together with the header; member data is checked
+against the SHA-256 recorded in the TOC on extraction.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+
+from aes_cipher import AESCipher
+from atomic_output import PARTIAL_SUFFIX, AtomicOutput
+from file_header import FileHeader, read_header
+from file_ops import collect_files
+from stream_cipher import DEFAULT_CHUNK_SIZE
+
+ARCHIVE_MODE = "ARCHIVE"
+CTR_NONCE_SIZE = 8
+
+_TRAILER = struct.Struct('>Q4s')
+_TRAILER_MAGIC = b'CTOC'
+
+
+def _data_key(cipher):
+    """Derive the member data key, keeping it separate from the TOC key"""
+    return hashlib.sha256(b'cryptography-project archive data\x00' + cipher.key).digest()[:len(cipher.key)]
+
+
+def _ctr(cipher, nonce, offset):
+    """CTR cipher positioned at the block containing offset"""
+    return AES.new(_data_key(cipher), AES.MODE_CTR, nonce=nonce,
+                   initial_value=offset // AES.block_size)
+
+
+def _safe_name(name):
+    """Reject member names that would escape the extraction directory"""
+    parts = name.replace('\\', '/').split('/')
+    if os.path.isabs(name) or '..' in parts or not name:
+        raise ValueError(f"Unsafe member name '{name}'")
+    return os.path.join(*parts)
+
+
+def create_archive(cipher, inputs, output_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Pack files and directories into an encrypted archive; returns the member count"""
+    header = FileHeader(cipher.name, ARCHIVE_MODE).to_bytes()
+    nonce = get_random_bytes(CTR_NONCE_SIZE)
+    ctr = _ctr(cipher, nonce, 0)
+    members = []
+    sources = {}
+    offset = 0
+    output = os.path.abspath(output_path)
+    with AtomicOutput(output_path) as dst:
+        dst.write(header)
+        for path, rel in collect_files(inputs):
+            if os.path.abspath(path) == output or rel.endswith(PARTIAL_SUFFIX):
+                continue
+            name = rel.replace(os.sep, '/')
+            if name in sources:
+                raise ValueError(f"'{path}' and '{sources[name]}' would both be stored "
+                                 f"as member '{name}'")
+            sources[name] = path
+            digest = hashlib.sha256()
+            size = 0
+            with open(path, 'rb') as src:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    dst.write(ctr.encrypt(chunk))
+                    size += len(chunk)
+            stat = os.stat(path)
+            members.append({'name': name, 'offset': offset, 'size': size,
+                            'sha256': digest.hexdigest(), 'mtime': stat.st_mtime,
+                            'mode': stat.st_mode & 0o777})
+            offset += size
+
+        toc = json.dumps({'nonce': nonce.hex(), 'members': members}).encode('utf-8')
+        encryptor = cipher.auth_encryptor(aad=header)
+        sealed = encryptor.nonce + encryptor.update(toc) + encryptor.finalize()
+        dst.write(sealed + _TRAILER.pack(len(sealed), _TRAILER_MAGIC))
+    return len(members)
+
+
+class Archive:
+    """An open archive: call members() to list, extract() to pull out data"""
+    def __init__(self, cipher, path):
+        self.cipher = cipher
+        self.f = open(path, 'rb')
+        try:
+            self._load()
+        except BaseException:
+            self.f.close()
+            raise
+
+    def _load(self):
+        f = self.f
+        header = read_header(f)
+        if header is None or header.mode != ARCHIVE_MODE:
+            raise ValueError("Not an encrypted archive")
+        if header.cipher != self.cipher.name:
+            raise ValueError(f"Archive was encrypted with {header.cipher}, not {self.cipher.name}")
+        self.data_start = f.tell()
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        if end - self.data_start < _TRAILER.size:
+            raise ValueError("Truncated archive")
+        f.seek(end - _TRAILER.size)
+        toc_size, magic = _TRAILER.unpack(f.read(_TRAILER.size))
+        if magic != _TRAILER_MAGIC or toc_size > end - self.data_start - _TRAILER.size:
+            raise ValueError("Corrupt archive trailer")
+        f.seek(end - _TRAILER.size - toc_size)
+        sealed = f.read(toc_size)
+        nonce_size = self.cipher.auth_nonce_size
+        decryptor = self.cipher.auth_decryptor(sealed[:nonce_size], aad=header.raw)
+        try:
+            toc = decryptor.update(sealed[nonce_size:]) + decryptor.finalize()
+        except ValueError as e:
+            raise ValueError(f"Authentication failed, wrong key or the archive index was "
+                             f"modified ({e})") from e
+        toc = json.loads(toc.decode('utf-8'))
+        self.nonce = bytes.fromhex(toc['nonce'])
+        self._members = {m['name']: m for m in toc['members']}
+        if len(self._members) != len(toc['members']):
+            raise ValueError("Corrupt archive index: duplicate member names")
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def members(self):
+        """Return the TOC entries (name, offset, size, sha256, mtime, mode) in archive order"""
+        return list(self._members.values())
+
+    def extract(self, name, dst, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Decrypt one member into the binary stream dst, verifying its SHA-256"""
+        if name not in self._members:
+            raise KeyError(f"No member named '{name}' in the archive")
+        member = self._members[name]
+        start = member['offset']
+        skip = start % AES.block_size
+        ctr = _ctr(self.cipher, self.nonce, start)
+        self.f.seek(self.data_start + start - skip)
+        remaining = member['size'] + skip
+        digest = hashlib.sha256()
+        while remaining:
+            chunk = self.f.read(min(chunk_size, remaining))
+            if not chunk:
+                raise ValueError("Truncated archive data")
+            remaining -= len(chunk)
+            data = ctr.decrypt(chunk)[skip:]
+            skip = 0
+            digest.update(data)
+            dst.write(data)
+        if digest.hexdigest() != member['sha256']:
+            raise ValueError(f"Member '{name}' is corrupted or was modified")
+        return member['size']
+
+    def extract_to(self, name, output_dir):
+        """Extract one member below output_dir, restoring its mode and mtime"""
+        member = self._members.get(name)
+        if member is None:
+            raise KeyError(f"No member named '{name}' in the archive")
+        path = os.path.join(output_dir, _safe_name(name))
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with AtomicOutput(path) as dst:
+            self.extract(name, dst)
+        os.chmod(path, member['mode'])
+        os.utime(path, (member['mtime'], member['mtime']))
+        return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Encrypted multi-file archives (AES)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    create = sub.add_parser('create', help="Pack files and directories into an archive")
+    create.add_argument('archive')
+    create.add_argument('inputs', nargs='+')
+    listing = sub.add_parser('list', help="List archive members")
+    listing.add_argument('archive')
+    extract = sub.add_parser('extract', help="Extract all or selected members")
+    extract.add_argument('archive')
+    extract.add_argument('members', nargs='*', help="Members to extract (default: all)")
+    extract.add_argument('--output-dir', default='.')
+    for command in (create, listing, extract):
+        command.add_argument('--key', required=True, help="AES key file")
+    args = parser.parse_args(argv)
+
+    try:
+        cipher = AESCipher.from_key_file(args.key)
+        if args.command == 'create':
+            count = create_archive(cipher, args.inputs, args.archive)
+            print(f"Archived {count} file(s) into {args.archive}")
+            return 0
+        with Archive(cipher, args.archive) as archive:
+            if args.command == 'list':
+                for member in archive.members():
+                    print(f"{member['size']:>12}  {member['name']}")
+                return 0
+            names = args.members or [m['name'] for m in archive.members()]
+            for name in names:
+                print(archive.extract_to(name, args.output_dir))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
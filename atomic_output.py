@@ -0,0 +1,295 @@
+"""
+Atomic Output Files
+Every output is written to a temporary file next to its final path
+('.<name>.<random>.partial') and renamed over the final path only when it
+is complete, so a crash or a failed run never leaves a truncated file that
+looks like a valid result. Writes go through a large buffer and reach the
+file in ALIGNMENT-sized blocks; when the final size is known the file is
+preallocated. The temporary file is private (0600) while it is written and
+takes the mode of the file it replaces, or the umask default for a new
+file, just before the rename.
+
+fsync policies (when the data is forced to disk):
+    never   rename without fsync; fastest, but a power loss may lose or
+            empty recently written files
+    file    fsync each file before its rename and its directory after
+    batch   a SyncBatch collects finished files and fsyncs, renames and
+            fsyncs their directories together, every max_files files or
+            max_bytes bytes and when the batch ends. Each file still
+            appears complete or not at all.
+"""
+
+import errno
+import io
+import os
+import secrets
+import threading
+
+FSYNC_NEVER = "never"
+FSYNC_FILE = "file"
+FSYNC_BATCH = "batch"
+FSYNC_POLICIES = (FSYNC_NEVER, FSYNC_FILE, FSYNC_BATCH)
+DEFAULT_FSYNC = FSYNC_FILE
+
+PARTIAL_SUFFIX = '.partial'
+ALIGNMENT = 64 * 1024
+DEFAULT_BUFFER_SIZE = 4 * 1024 * 1024
+
+# A SyncBatch commits once this many files or bytes are pending
+DEFAULT_BATCH_FILES = 256
+DEFAULT_BATCH_BYTES = 1024 * 1024 * 1024
+
+# Read once: os.umask can only be read by setting it, which is not thread-safe
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+
+def preallocate(f, size):
+    """Reserve disk space for an output of known size, where the platform supports it
+
+    Returns True when the space was reserved.
+    """
+    if size <= 0 or not hasattr(os, 'posix_fallocate'):
+        return False
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise
+        return False  # Not supported by this file system; the writes allocate as they go
+    return True
+
+
+def fsync_directory(path):
+    """fsync a directory so that renames in it survive a crash (no-op on Windows)"""
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_path(path):
+    fd = os.open(path, os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _final_mode(path):
+    """Permission bits for the output at path: those of the file it replaces, if any"""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class AtomicOutput(io.BufferedIOBase):
+    """A writable binary file that replaces path atomically when committed
+
+    Used as a context manager it commits on success and discards the
+    temporary file on error. expected_size, if known, preallocates the
+    file. Callers that write through a memory map use fileno() and
+    truncate() instead of write().
+    """
+    def __init__(self, path, fsync=DEFAULT_FSYNC, expected_size=None,
+                 buffer_size=DEFAULT_BUFFER_SIZE, sync_batch=None):
+        super().__init__()
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync}'. Choose from: {', '.join(FSYNC_POLICIES)}")
+        if fsync == FSYNC_BATCH and sync_batch is None:
+            raise ValueError("The 'batch' fsync policy needs a SyncBatch")
+        if buffer_size < ALIGNMENT or buffer_size % ALIGNMENT:
+            raise ValueError(f"Buffer size must be a multiple of {ALIGNMENT} bytes")
+        self.path = path
+        self.policy = fsync
+        self.sync_batch = sync_batch
+        self.buffer_size = buffer_size
+        self.bytes_written = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        while True:
+            # Owner-only until commit() gives it its final mode
+            self.tmp_path = os.path.join(directory, f".{os.path.basename(path)}."
+                                                    f"{secrets.token_hex(4)}{PARTIAL_SUFFIX}")
+            try:
+                fd = os.open(self.tmp_path, os.O_RDWR | os.O_CREAT | os.O_EXCL
+                             | getattr(os, 'O_BINARY', 0), 0o600)
+                break
+            except FileExistsError:
+                continue
+        self._file = io.FileIO(fd, 'r+')
+        self._buffer = bytearray()
+        self._done = False
+        try:
+            self._preallocated = expected_size is not None and preallocate(self._file, expected_size)
+        except BaseException:
+            self.discard()
+            raise
+
+    def writable(self):
+        return True
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def write(self, data):
+        """Buffer data; full ALIGNMENT-sized blocks of large writes go straight to the file"""
+        with memoryview(data) as raw, raw.cast('B') as view:
+            size = len(view)
+            if self._buffer:
+                take = min(size, self.buffer_size - len(self._buffer))
+                self._buffer += view[:take]
+                if len(self._buffer) < self.buffer_size:
+                    return size
+                self._write_all(self._buffer)
+                self._buffer.clear()
+                view = view[take:]
+            # The file position is a multiple of ALIGNMENT here
+            if len(view) >= self.buffer_size:
+                direct = len(view) - len(view) % ALIGNMENT
+                self._write_all(view[:direct])
+                view = view[direct:]
+            self._buffer += view
+        return size
+
+    def _write_all(self, data):
+        with memoryview(data) as view:
+            while view:
+                written = self._file.write(view)
+                self.bytes_written += written
+                view = view[written:]
+
+    def flush(self):
+        if self._buffer:
+            self._write_all(self._buffer)
+            self._buffer.clear()
+
+    def truncate(self, size=None):
+        self.flush()
+        return self._file.truncate(size)
+
+    def commit(self):
+        """Move the finished file into place according to the fsync policy"""
+        if self._done:
+            return
+        try:
+            self.flush()
+            if self._preallocated:
+                # Preallocation may have reserved more than was written
+                self._file.truncate(self.bytes_written)
+            if hasattr(os, 'fchmod'):
+                os.fchmod(self._file.fileno(), _final_mode(self.path))
+            if self.policy == FSYNC_FILE:
+                os.fsync(self._file.fileno())
+            size = os.fstat(self._file.fileno()).st_size
+            self._file.close()
+            self._done = True
+            if self.policy == FSYNC_BATCH:
+                self.sync_batch.add(self.tmp_path, self.path, size)
+                return
+            os.replace(self.tmp_path, self.path)
+        except BaseException:
+            self.discard()
+            raise
+        if self.policy == FSYNC_FILE:
+            fsync_directory(os.path.dirname(os.path.abspath(self.path)))
+
+    def discard(self):
+        """Remove the temporary file; path is left untouched"""
+        self._buffer.clear()
+        self._file.close()
+        if not self._done:
+            self._done = True
+            _remove_quietly(self.tmp_path)
+
+    def close(self):
+        # Closing without commit() abandons the output
+        if not self._done:
+            self.discard()
+        super().close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+        super().close()
+
+
+class SyncBatch:
+    """Defers the fsync and rename of AtomicOutput files with fsync='batch'
+
+    Files are committed together every max_files files or max_bytes bytes,
+    and by commit() / the end of a with block. on_commit(path), if given, is
+    called for each file once it is durable and in place. Thread-safe.
+    """
+    def __init__(self, max_files=DEFAULT_BATCH_FILES, max_bytes=DEFAULT_BATCH_BYTES, on_commit=None):
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.on_commit = on_commit
+        self.committed = 0
+        self._pending = []  # (temporary path, final path)
+        self._pending_bytes = 0
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+
+    def add(self, tmp_path, path, size):
+        """Queue a finished temporary file to be renamed to path"""
+        with self._lock:
+            self._pending.append((tmp_path, path))
+            self._pending_bytes += size
+            full = len(self._pending) >= self.max_files or self._pending_bytes >= self.max_bytes
+        if full:
+            self.commit()
+
+    def commit(self):
+        """fsync and rename all pending files, then fsync their directories
+
+        If an fsync or rename fails, the files not yet in place are removed.
+        """
+        with self._commit_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._pending_bytes = 0
+            if not pending:
+                return
+            done = 0
+            try:
+                for tmp_path, _ in pending:
+                    _fsync_path(tmp_path)
+                for tmp_path, path in pending:
+                    os.replace(tmp_path, path)
+                    done += 1
+                for directory in {os.path.dirname(os.path.abspath(path)) for _, path in pending}:
+                    fsync_directory(directory)
+            except BaseException:
+                for tmp_path, _ in pending[done:]:
+                    _remove_quietly(tmp_path)
+                raise
+            self.committed += len(pending)
+            if self.on_commit is not None:
+                for _, path in pending:
+                    self.on_commit(path)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Files already finished are committed even if the batch was interrupted
+        self.commit()
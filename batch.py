@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+Batch Encryption and Decryption
+Encrypts or decrypts whole directory trees with AES, DES or ChaCha20,
+mirroring the input layout under an output directory. With a result cache,
+files whose output is already current are skipped, so repeated runs only
+process what changed.
+
+With --manifest, the SHA-256 of every input and output is computed while
+the file is processed and written to a JSON or CSV manifest (see
+manifest.py).
+
+The inspect operation reads only each file's header and reports its cipher,
+mode, key fingerprint and original size, so files can be routed without
+touching their payload:
+    python batch.py inspect --json encrypted/
+
+Example (nightly encryption of a tree):
+    python batch.py encrypt --cipher AES --key aes_key.txt \\
+        --output-dir encrypted/ --cache .crypto_cache.db data/
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from functools import partial
+
+from atomic_output import (DEFAULT_FSYNC, FSYNC_BATCH, FSYNC_POLICIES, PARTIAL_SUFFIX,
+                           SyncBatch)
+from compression import COMPRESSION_METHODS
+from file_header import peek_header
+from file_ops import (AUTO_CIPHER, CIPHERS, MEMORY_BUDGET_ENV, collect_files, decrypt_path,
+                      encrypt_path, format_size, header_cipher, load_cipher,
+                      memory_budget_from_env, parse_size)
+from manifest import STATUS_FAILED, STATUS_PROCESSED, STATUS_SKIPPED, Manifest
+from metrics import METRICS, SnapshotWriter
+from result_cache import DEFAULT_MAX_ENTRIES, UNKNOWN_HASH, ResultCache, new_content_hash
+from scheduler import (PACK_SIZE, SPLIT_CHUNK_SIZE, SPLIT_SIZE, WorkStealingPool, pack,
+                       split_job)
+
+ENCRYPTED_SUFFIX = '.enc'
+DEFAULT_CACHE = '.crypto_cache.db'
+
+
+def output_path_for(operation, rel_path, output_dir):
+    """Map a file's relative path to its output path"""
+    if operation == "encrypt":
+        return os.path.join(output_dir, rel_path + ENCRYPTED_SUFFIX)
+    if rel_path.endswith(ENCRYPTED_SUFFIX):
+        rel_path = rel_path[:-len(ENCRYPTED_SUFFIX)]
+    else:
+        rel_path += '.dec'
+    return os.path.join(output_dir, rel_path)
+
+
+def batch_options(compression=None, authenticated=False):
+    """Canonical string of the options that affect a file's output"""
+    return f"compression={compression or 'none'};authenticated={int(bool(authenticated))}"
+
+
+def process_file(cipher, operation, input_path, output_path, compression=None,
+                 authenticated=False, hash_streams=False, fsync=DEFAULT_FSYNC, sync_batch=None,
+                 memory_budget=None, input_hasher=None):
+    """Encrypt or decrypt one file; returns its OperationReport"""
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    if operation == "encrypt":
+        return encrypt_path(cipher, input_path, output_path, memory_budget, track_memory=False,
+                            compression=compression, authenticated=authenticated,
+                            hash_streams=hash_streams, fsync=fsync, sync_batch=sync_batch,
+                            input_hasher=input_hasher)
+    return decrypt_path(cipher, input_path, output_path, memory_budget, track_memory=False,
+                        require_authentication=authenticated, hash_streams=hash_streams,
+                        fsync=fsync, sync_batch=sync_batch, input_hasher=input_hasher)
+
+
+def run_batch(operation, inputs, cipher, output_dir, cache_path=None, workers=4,
+              compression=None, authenticated=False, verify_content=False,
+              cache_size=DEFAULT_MAX_ENTRIES, progress=print, metrics=METRICS,
+              manifest_path=None, skip_encrypted=False, resolve_cipher=None, fsync=FSYNC_BATCH,
+              split_size=SPLIT_SIZE, split_chunk_size=SPLIT_CHUNK_SIZE, pack_size=PACK_SIZE,
+              memory_budget=None):
+    """Process many files in parallel; returns (files_done, files_skipped, failures)
+
+    With cache_path, files whose output is recorded as current in the result
+    cache are skipped, and every processed file is recorded with the stat
+    of its input from before processing and a content hash computed while
+    it was read (split files get no hash, so touching one makes it a miss).
+    The cache keeps at most cache_size entries. verify_content
+    re-hashes inputs even when their size and mtime are unchanged. Every
+    file is recorded in metrics. With manifest_path, inputs and outputs are
+    hashed as they are processed and every file is listed in a manifest
+    written there (CSV for *.csv, JSON otherwise). skip_encrypted skips
+    inputs that already carry an encrypted file header when encrypting.
+    resolve_cipher(path), if given, returns the cipher for each input
+    instead of cipher (decrypting with --cipher auto, where every file's
+    header names its own cipher).
+
+    Outputs replace their targets atomically (see atomic_output). With
+    fsync='batch' they are forced to disk and moved into place in groups,
+    and a file is only recorded in the result cache once its group is
+    committed, so a crash never leaves a cache entry for a missing output.
+
+    Work is spread over the workers by the hybrid scheduler (see
+    scheduler.py): when decrypting, plain CBC files of split_size bytes and
+    up are split into split_chunk_size chunk tasks, files below pack_size
+    are processed in packed groups, and idle workers steal queued work.
+    Files are not split when a manifest is written or authentication is
+    required. memory_budget applies to each file (see encrypt_path): files
+    that would not fit whole are streamed in chunks.
+    """
+    if operation not in ("encrypt", "decrypt"):
+        raise ValueError(f"Unknown operation '{operation}'")
+    cache = ResultCache(cache_path, cache_size) if cache_path else None
+    options = batch_options(compression, authenticated)
+    if resolve_cipher is None:
+        manifest = Manifest(operation, cipher.name, cipher.fingerprint(), options) \
+            if manifest_path else None
+    else:
+        manifest = Manifest(operation, AUTO_CIPHER, None, options) if manifest_path else None
+
+    # Never pick up the cache database (or its journal), the manifest or
+    # leftover temporary outputs as an input
+    own_files = tuple(os.path.abspath(p) for p in (cache_path, manifest_path) if p)
+    files = [(path, output_path_for(operation, rel, output_dir), rel)
+             for path, rel in collect_files(inputs)
+             if not (own_files and os.path.abspath(path).startswith(own_files))
+             and not rel.endswith(PARTIAL_SUFFIX)]
+
+    # Final path -> cache entry (see cache_entry) of outputs waiting for their batch commit
+    uncommitted = {}
+
+    def cache_entry(path, target, file_cipher, hashed):
+        """What record() will need, taken before the input is read
+
+        hashed: the input is read in one pass that updates the entry's hash
+        object; split files are not, and are recorded with UNKNOWN_HASH.
+        """
+        if cache is None:
+            return None
+        return ((path, file_cipher.name, file_cipher.fingerprint(), operation, options, target),
+                os.stat(path), new_content_hash() if hashed else None)
+
+    def record(entry):
+        args, in_stat, hasher = entry
+        cache.record(*args, input_hash=hasher.hexdigest() if hasher is not None else UNKNOWN_HASH,
+                     input_stat=in_stat)
+
+    def committed(target):
+        with lock:
+            entry = uncommitted.pop(os.path.abspath(target))
+        record(entry)
+
+    sync_batch = None
+    if fsync == FSYNC_BATCH:
+        sync_batch = SyncBatch(on_commit=committed if cache is not None else None)
+
+    stats = {'done': 0, 'skipped': 0, 'bytes': 0}
+    failures = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+    pool = WorkStealingPool(workers)
+    # Splitting a file gives up hashing it in a single pass, so manifests
+    # and verified (authenticated) decryption keep files whole
+    split = operation == "decrypt" and manifest is None and not authenticated
+
+    def finished(path, target, rel, size=None, error=None):
+        if error is not None:
+            if manifest is not None:
+                manifest.add(path, target, STATUS_FAILED, error=error)
+            with lock:
+                failures.append((rel, error))
+                progress(f"FAILED {rel}: {error}")
+            return
+        with lock:
+            if size is None:
+                stats['skipped'] += 1
+                return
+            stats['done'] += 1
+            stats['bytes'] += size
+            elapsed = max(time.perf_counter() - start, 1e-9)
+            progress(f"[{stats['done'] + stats['skipped']}/{len(files)}] {rel} "
+                     f"({format_size(stats['bytes'])}, "
+                     f"{stats['bytes'] / elapsed / 1024 / 1024:.1f} MiB/s)")
+
+    def skip(path, target, file_cipher):
+        """Whether the file is skipped (and recorded as such)"""
+        if (skip_encrypted and operation == "encrypt" and peek_header(path) is not None) or \
+                (cache is not None and cache.lookup(path, file_cipher.name, file_cipher.fingerprint(),
+                                                    operation, options, target, verify_content)):
+            metrics.inc('crypto_skipped_total', (('cipher', file_cipher.name),
+                                                 ('operation', operation)))
+            if manifest is not None:
+                manifest.add(path, target, STATUS_SKIPPED, cipher=file_cipher)
+            return True
+        return False
+
+    def defer_record(target, entry):
+        """Register the cache entry to be written when the output's batch commits"""
+        if entry is None or sync_batch is None:
+            return False
+        # Registered first: a full batch may commit the file before it is reported
+        with lock:
+            uncommitted[os.path.abspath(target)] = entry
+        return True
+
+    def processed(path, target, file_cipher, report, entry, deferred):
+        if manifest is not None:
+            manifest.add(path, target, STATUS_PROCESSED, report, cipher=file_cipher)
+        if entry is not None and not deferred:
+            record(entry)
+
+    def forget(target):
+        with lock:
+            uncommitted.pop(os.path.abspath(target), None)
+
+    def run_file(path, target, rel, file_cipher=None):
+        try:
+            if file_cipher is None:
+                file_cipher = resolve_cipher(path) if resolve_cipher is not None else cipher
+                if skip(path, target, file_cipher):
+                    finished(path, target, rel)
+                    return
+            entry = cache_entry(path, target, file_cipher, hashed=True)
+            deferred = defer_record(target, entry)
+            try:
+                with metrics.track(file_cipher.name, operation) as tracked:
+                    report = process_file(file_cipher, operation, path, target, compression,
+                                          authenticated, hash_streams=manifest is not None,
+                                          fsync=fsync, sync_batch=sync_batch,
+                                          memory_budget=memory_budget,
+                                          input_hasher=entry[2] if entry is not None else None)
+                    tracked.bytes_in, tracked.bytes_out = report.bytes_in, report.bytes_out
+            except BaseException:
+                if deferred:
+                    forget(target)
+                raise
+            processed(path, target, file_cipher, report, entry, deferred)
+        except Exception as e:
+            finished(path, target, rel, error=str(e))
+            return
+        finished(path, target, rel, report.bytes_in)
+
+    def run_large(path, target, rel):
+        """Split the file into chunk tasks when its mode allows, else run it whole"""
+        try:
+            file_cipher = resolve_cipher(path) if resolve_cipher is not None else cipher
+            if skip(path, target, file_cipher):
+                finished(path, target, rel)
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+            entry = cache_entry(path, target, file_cipher, hashed=False)
+            deferred = defer_record(target, entry)
+
+            def done(report, error):
+                metrics.record(file_cipher.name, operation, report.elapsed, report.bytes_in,
+                               report.bytes_out, failed=error is not None)
+                if error is not None:
+                    if deferred:
+                        forget(target)
+                    finished(path, target, rel, error=str(error))
+                    return
+                processed(path, target, file_cipher, report, entry, deferred)
+                finished(path, target, rel, report.bytes_in)
+
+            try:
+                job = split_job(file_cipher, operation, path, target, done, split_chunk_size,
+                                fsync, sync_batch)
+            except BaseException:
+                if deferred:
+                    forget(target)
+                raise
+        except Exception as e:
+            finished(path, target, rel, error=str(e))
+            return
+        if job is None:
+            if deferred:
+                forget(target)
+            run_file(path, target, rel, file_cipher)
+        else:
+            job.start(pool.submit)
+
+    def run_pack(group):
+        for path, target, rel, _ in group:
+            run_file(path, target, rel)
+
+    sized = []
+    for path, target, rel in files:
+        try:
+            sized.append((path, target, rel, os.path.getsize(path)))
+        except OSError as e:
+            finished(path, target, rel, error=str(e))
+    large = split_size if split else float('inf')
+    tasks = [(size, partial(run_large if size >= large else run_file, path, target, rel))
+             for path, target, rel, size in sized if size >= pack_size]
+    tasks += [(sum(item[3] for item in group), partial(run_pack, group))
+              for group in pack((item for item in sized if item[3] < pack_size),
+                                lambda item: item[3])]
+    try:
+        pool.run(tasks)
+        for error in pool.errors:
+            raise error
+    finally:
+        try:
+            if sync_batch is not None:
+                sync_batch.commit()
+        finally:
+            if cache is not None:
+                cache.close()
+            if manifest is not None:
+                manifest.write(manifest_path)
+    return stats['done'], stats['skipped'], failures
+
+
+class HeaderCipherResolver:
+    """Loads the cipher named in each file's header, once per cipher name"""
+    def __init__(self, key_file):
+        self.key_file = key_file
+        self._ciphers = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, path):
+        name = header_cipher(path)
+        with self._lock:
+            if name not in self._ciphers:
+                self._ciphers[name] = load_cipher(name, self.key_file)
+            return self._ciphers[name]
+
+
+def inspect_file(path):
+    """Describe a file from its header alone; returns a JSON-serializable dict"""
+    try:
+        header = peek_header(path)
+    except (OSError, ValueError) as e:
+        return {'format': 'invalid', 'error': str(e)}
+    if header is None:
+        return {'format': 'none'}
+    return dict(header.describe(), format='header')
+
+
+def _format_inspection(info):
+    if info['format'] == 'none':
+        return "no header (plaintext or legacy IV||ciphertext)"
+    if info['format'] == 'invalid':
+        return f"invalid header: {info['error']}"
+    text = f"{info['cipher']} {info['mode']}"
+    if info['compression']:
+        text += f", {info['compression']}"
+    if info['key_fingerprint']:
+        text += f", key {info['key_fingerprint']}"
+    if info['original_size'] is not None:
+        text += f", {format_size(info['original_size'])} original"
+    if info['chunk_size']:
+        text += f", {format_size(info['chunk_size'])} chunks"
+    return text
+
+
+def run_inspect(inputs, as_json=False, output=print):
+    """Report the header of every file under inputs; returns the number of files"""
+    files = collect_files(inputs)
+    for path, rel in files:
+        info = inspect_file(path)
+        if as_json:
+            output(json.dumps(dict(info, path=rel)))
+        else:
+            output(f"{rel}: {_format_inspection(info)}")
+    return len(files)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Encrypt or decrypt directory trees with AES, DES "
+                                                 "or ChaCha20")
+    parser.add_argument('operation', choices=['encrypt', 'decrypt', 'inspect'])
+    parser.add_argument('inputs', nargs='+', help="Files or directories to process")
+    parser.add_argument('--cipher', choices=list(CIPHERS) + [AUTO_CIPHER],
+                        help="auto: encrypt with the faster authenticated cipher on this host; "
+                             "decrypt with the cipher named in each file's header")
+    parser.add_argument('--key', help="Key file")
+    parser.add_argument('--output-dir', help="Output directory (mirrors input layout)")
+    parser.add_argument('--json', action='store_true',
+                        help="inspect: print one JSON object per file")
+    parser.add_argument('--skip-encrypted', action='store_true',
+                        help="encrypt: skip inputs that already have an encrypted file header")
+    parser.add_argument('--cache', default=DEFAULT_CACHE,
+                        help="Result cache used to skip unchanged files (default: %(default)s)")
+    parser.add_argument('--no-cache', action='store_true', help="Process every file")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_ENTRIES,
+                        help="Maximum number of cache entries (default: %(default)s)")
+    parser.add_argument('--verify-content', action='store_true',
+                        help="Re-hash inputs even when size and mtime are unchanged")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--compression', choices=COMPRESSION_METHODS)
+    parser.add_argument('--authenticated', action='store_true',
+                        help="Encrypt: add an authentication tag; decrypt: require one")
+    parser.add_argument('--manifest',
+                        help="Write input/output sizes and SHA-256 hashes here, computed in the "
+                             "same pass (CSV for *.csv, JSON otherwise)")
+    parser.add_argument('--metrics-file',
+                        help="Write metrics here (Prometheus text for *.prom, JSON otherwise)")
+    parser.add_argument('--metrics-interval', type=float, default=10.0,
+                        help="Seconds between metrics snapshots (default: %(default)s)")
+    parser.add_argument('--memory-budget', type=parse_size, default=memory_budget_from_env(),
+                        help="Memory budget per file, e.g. 256M; files that would not fit are "
+                             f"streamed in chunks (default: ${MEMORY_BUDGET_ENV} or none)")
+    parser.add_argument('--split-size', type=parse_size, default=SPLIT_SIZE,
+                        help="Decrypt plain CBC files of this size and up in parallel chunks, "
+                             "e.g. 256M (default: 64M)")
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default=FSYNC_BATCH,
+                        help="When outputs are forced to disk: never, after each file, or in "
+                             "batches of files (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.operation == 'inspect':
+        run_inspect(args.inputs, args.json)
+        return 0
+    missing = [flag for flag, value in (('--cipher', args.cipher), ('--key', args.key),
+                                        ('--output-dir', args.output_dir)) if not value]
+    if missing:
+        parser.error(f"{args.operation} requires {', '.join(missing)}")
+
+    cipher = resolve_cipher = None
+    try:
+        if args.cipher == AUTO_CIPHER and args.operation == "decrypt":
+            resolve_cipher = HeaderCipherResolver(args.key)
+        else:
+            cipher = load_cipher(args.cipher, args.key)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 2
+    if args.cipher == AUTO_CIPHER and cipher is not None:
+        print(f"auto selected {cipher.name}")
+    # auto chooses between authenticated ciphers, so AES output is authenticated too
+    authenticated = args.authenticated or (args.cipher == AUTO_CIPHER and args.operation == "encrypt")
+
+    cache_path = None if args.no_cache else args.cache
+    writer = SnapshotWriter(METRICS, args.metrics_file, args.metrics_interval).start() \
+        if args.metrics_file else None
+    start = time.perf_counter()
+    try:
+        done, skipped, failures = run_batch(args.operation, args.inputs, cipher, args.output_dir,
+                                            cache_path, args.workers, args.compression,
+                                            authenticated, args.verify_content,
+                                            args.cache_size, manifest_path=args.manifest,
+                                            skip_encrypted=args.skip_encrypted,
+                                            resolve_cipher=resolve_cipher, fsync=args.fsync,
+                                            split_size=args.split_size,
+                                            memory_budget=args.memory_budget)
+    finally:
+        if writer is not None:
+            writer.stop()
+    print(f"{args.operation.capitalize()}ed {done} file(s), skipped {skipped} unchanged, "
+          f"{len(failures)} failure(s) in {time.perf_counter() - start:.1f}s")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
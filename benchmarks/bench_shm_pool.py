@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark the shared-memory worker pool against a plain multiprocessing pool
+that pickles each chunk to the workers and back, for AES CBC decryption and
+Vigenère encryption.
+"""
+import multiprocessing
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+THIS_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = THIS_DIR.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from Crypto.Cipher import AES
+
+from aes_cipher import AESCipher
+from file_ops import format_size
+from shm_pool import SharedMemoryPool
+from stream_cipher import DEFAULT_CHUNK_SIZE
+from vigenere_cipher import VigenereCipher
+
+AES_SIZE = 256 * 1024 * 1024
+TEXT_SIZE = 8 * 1024 * 1024
+KEY = b"0123456789abcdef0123456789abcdef"
+
+
+def _pickled_aes_chunk(args):
+    iv, chunk = args
+    return AES.new(KEY, AES.MODE_CBC, iv).decrypt(chunk)
+
+
+def pickled_aes_decrypt(pool, data):
+    """Baseline: ship each ciphertext chunk to a worker and its plaintext back"""
+    ct = memoryview(data)[16:]
+    step = DEFAULT_CHUNK_SIZE
+    tasks = [(bytes(data[:16]) if start == 0 else bytes(ct[start - 16:start]), bytes(ct[start:start + step]))
+             for start in range(0, len(ct), step)]
+    return b''.join(pool.map(_pickled_aes_chunk, tasks))
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main() -> int:
+    workers = os.cpu_count() or 1
+    print(f"Workers: {workers}")
+
+    aes = AESCipher(KEY)
+    ciphertext = aes.encrypt_file(os.urandom(AES_SIZE))
+    with multiprocessing.Pool(workers) as pool:
+        _, pickled = timed(pickled_aes_decrypt, pool, ciphertext)
+    with SharedMemoryPool(aes, workers) as pool:
+        _, shared = timed(pool.decrypt, ciphertext)
+    _, single = timed(aes.decrypt_file, ciphertext)
+    print(f"AES-CBC decrypt {format_size(AES_SIZE)}: single {single:.2f}s, "
+          f"pickling pool {pickled:.2f}s, shared memory pool {shared:.2f}s")
+
+    text = ''.join(random.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ ") for _ in range(TEXT_SIZE))
+    vigenere = VigenereCipher("LEMON")
+    with SharedMemoryPool(vigenere, workers) as pool:
+        _, shared = timed(pool.encrypt, text.encode('ascii'))
+    _, single = timed(vigenere.encrypt, text)
+    print(f"Vigenère encrypt {format_size(TEXT_SIZE)}: single {single:.2f}s, "
+          f"shared memory pool {shared:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
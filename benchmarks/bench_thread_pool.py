@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark the thread pool against the shared-memory process pool for all
+four ciphers, at 1, 2, 4, ... threads. AES/DES scale on threads in any
+build; Playfair and Vigenère scale only on a free-threaded interpreter
+(python3.13t or later with the GIL disabled).
+"""
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+THIS_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = THIS_DIR.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from aes_cipher import AESCipher
+from des_cipher import DESCipher
+from file_ops import format_size
+from playfair_cipher import PlayfairCipher
+from shm_pool import SharedMemoryPool, ThreadCipherPool, free_threaded
+from vigenere_cipher import VigenereCipher
+
+AES_SIZE = 128 * 1024 * 1024
+DES_SIZE = 32 * 1024 * 1024
+TEXT_SIZE = 16 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def thread_counts(workers):
+    counts = [1]
+    while counts[-1] * 2 < workers:
+        counts.append(counts[-1] * 2)
+    if workers > 1:
+        counts.append(workers)
+    return counts
+
+
+def bench(name, cipher, op, data, workers):
+    size = format_size(len(data))
+    results = []
+    expected = None
+    for count in thread_counts(workers):
+        with ThreadCipherPool(cipher, count, CHUNK_SIZE) as pool:
+            result, elapsed = timed(getattr(pool, op), data)
+        if expected is None:
+            expected, base = result, elapsed
+        elif result != expected:
+            raise AssertionError(f"{name}: {count} threads produced different output")
+        results.append(f"{count}T {elapsed:.2f}s ({base / elapsed:.1f}x)")
+    with SharedMemoryPool(cipher, workers, CHUNK_SIZE) as pool:
+        result, elapsed = timed(getattr(pool, op), data)
+    if result != expected:
+        raise AssertionError(f"{name}: the process pool produced different output")
+    results.append(f"{workers}P {elapsed:.2f}s ({base / elapsed:.1f}x)")
+    print(f"{name} {op} {size}: " + ", ".join(results))
+
+
+def main() -> int:
+    workers = os.cpu_count() or 1
+    print(f"Python {sys.version.split()[0]}, free-threaded: {'yes' if free_threaded() else 'no'}, "
+          f"CPUs: {workers}")
+    print("T = threads, P = processes; speedup relative to one thread")
+
+    aes = AESCipher(os.urandom(32))
+    bench("AES-CBC", aes, 'decrypt', aes.encrypt_file(os.urandom(AES_SIZE)), workers)
+    des = DESCipher(os.urandom(8))
+    bench("DES-CBC", des, 'decrypt', des.encrypt_file(os.urandom(DES_SIZE)), workers)
+
+    text = ''.join(random.choices("ABCDEFGHIJKLMNOPQRSTUVWXYZ \n", k=TEXT_SIZE)).encode('ascii')
+    bench("Vigenère", VigenereCipher("LEMON"), 'encrypt', text, workers)
+    letters = ''.join(random.choices("ABCDEFGHIKLMNOPQRSTUVWXYZ", k=TEXT_SIZE)).encode('ascii')
+    bench("Playfair", PlayfairCipher("PLAYFAIR EXAMPLE"), 'decrypt', letters, workers)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,73 @@
+"""
+ChaCha20-Poly1305 Implementation
+Uses PyCryptodome's ChaCha20-Poly1305 AEAD. It is fast in software, so it
+beats AES-GCM on hosts without AES instructions (older VMs, many ARM
+boards). There is no unauthenticated mode: every file is authenticated.
+"""
+
+from Crypto.Cipher import ChaCha20_Poly1305
+from Crypto.Random import get_random_bytes
+import key_provider
+import stream_cipher
+
+
+class ChaCha20Cipher:
+    name = "CHACHA20"
+    auth_mode = "CHACHA20-POLY1305"
+    auth_nonce_size = stream_cipher.GCM_NONCE_SIZE
+    authenticated_only = True
+    key_size = 32
+    passphrase_key_size = 32  # bytes derived from a passphrase key file
+    
+    def __init__(self, key=None):
+        """Initialize ChaCha20-Poly1305 with a 32-byte key"""
+        if key is None:
+            self.key = get_random_bytes(self.key_size)
+        else:
+            self.key = key if isinstance(key, bytes) else key.encode()
+            if len(self.key) != self.key_size:
+                raise ValueError("ChaCha20 key must be exactly 32 bytes")
+        self._fingerprint = None  # computed on first use; it is deliberately slow
+    
+    @classmethod
+    def from_key_file(cls, path, provider=None):
+        """Create ChaCha20Cipher from a key file (raw ASCII key, or passphrase and salt)"""
+        provider = provider if provider is not None else key_provider.PROVIDER
+        key_bytes = provider.load_key(path, cls.passphrase_key_size)
+        if len(key_bytes) != cls.key_size:
+            raise ValueError(f"ChaCha20 key must be exactly 32 bytes. Current: {len(key_bytes)} bytes")
+        return cls(key_bytes)
+    
+    def fingerprint(self):
+        """Short key identifier for file headers (see key_provider.key_fingerprint)"""
+        if self._fingerprint is None:
+            self._fingerprint = key_provider.key_fingerprint(self.name, self.key)
+        return self._fingerprint
+    
+    def legacy_fingerprint(self):
+        """Fingerprint that earlier versions wrote; recognised when reading their files"""
+        return key_provider.legacy_fingerprint(self.name, self.key)
+    
+    def encrypt_file(self, data):
+        """Encrypt binary file data; returns nonce||ciphertext||tag"""
+        cipher = ChaCha20_Poly1305.new(key=self.key, nonce=get_random_bytes(self.auth_nonce_size))
+        ct_bytes, tag = cipher.encrypt_and_digest(data)
+        return cipher.nonce + ct_bytes + tag
+    
+    def decrypt_file(self, data):
+        """Decrypt and verify nonce||ciphertext||tag; raises ValueError if it was modified"""
+        if len(data) < self.auth_nonce_size + stream_cipher.GCM_TAG_SIZE:
+            raise ValueError("Input is too short to contain a nonce and authentication tag")
+        nonce = data[:self.auth_nonce_size]
+        ct = data[self.auth_nonce_size:-stream_cipher.GCM_TAG_SIZE]
+        tag = data[-stream_cipher.GCM_TAG_SIZE:]
+        cipher = ChaCha20_Poly1305.new(key=self.key, nonce=bytes(nonce))
+        return cipher.decrypt_and_verify(ct, tag)
+    
+    def auth_encryptor(self, aad=b''):
+        """Return an incremental ChaCha20-Poly1305 encryptor; aad is authenticated too"""
+        return stream_cipher.ChaCha20Poly1305Encryptor(ChaCha20_Poly1305, self.key, aad)
+    
+    def auth_decryptor(self, nonce, aad=b''):
+        """Return an incremental ChaCha20-Poly1305 decryptor that verifies the trailing tag"""
+        return stream_cipher.ChaCha20Poly1305Decryptor(ChaCha20_Poly1305, self.key, nonce, aad)
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Chunked Encrypted Files with Incremental Updates
+Encrypts a file as independently authenticated fixed-size chunks, so a file
+that grows or changes in a few places can be brought up to date by
+re-encrypting only the chunks that differ.
+
+Layout:
+    FileHeader (mode CHUNKED, chunk size field)
+    chunk slots: nonce | ciphertext | tag, one per plaintext chunk
+    sealed index: nonce | encrypted (length, count, chunk hashes) | tag
+    trailer: sealed index length (4) | b'CIDX'
+
+Every full chunk occupies a slot of the same size, so chunk i always starts
+at the same offset and can be rewritten in place. The index holds a keyed
+BLAKE2b hash of each plaintext chunk; an update hashes the new plaintext,
+compares it with the index and only seals and writes the chunks whose hash
+changed, then rewrites the index. Chunks are authenticated with their
+position (AES-GCM, ChaCha20-Poly1305, or DES CBC + HMAC-SHA256) so they
+cannot be reordered.
+
+An update rewrites the file in place and is not atomic: if it is
+interrupted, decryption reports the file as corrupted until the update is
+run again. The previous index is kept intact until the new one is written,
+so re-running the update always works.
+"""
+
+import argparse
+import hashlib
+import os
+import struct
+import sys
+
+from atomic_output import AtomicOutput
+from file_header import FileHeader, read_header
+from file_ops import CIPHERS, load_cipher
+from stream_cipher import DEFAULT_CHUNK_SIZE, GCM_TAG_SIZE, HMAC_TAG_SIZE
+
+CHUNKED_MODE = "CHUNKED"
+CHUNK_HASH_SIZE = 16
+
+_INDEX_PREFIX = struct.Struct('>QI')  # plaintext length, chunk count
+_TRAILER = struct.Struct('>I4s')
+_TRAILER_MAGIC = b'CIDX'
+
+
+def _hash_key(cipher):
+    """Derive the chunk hash key from the cipher key"""
+    return hashlib.sha256(b'cryptography-project chunk hash\x00' + cipher.key).digest()
+
+
+def _sealed_size(cipher, length):
+    """Size of a sealed chunk holding length plaintext bytes"""
+    if cipher.auth_mode != "CBC-HMAC":
+        # AEAD modes (GCM, ChaCha20-Poly1305) do not pad
+        return cipher.auth_nonce_size + length + GCM_TAG_SIZE
+    padded = (length // cipher.block_size + 1) * cipher.block_size
+    return cipher.auth_nonce_size + padded + HMAC_TAG_SIZE
+
+
+def _seal(cipher, data, aad):
+    encryptor = cipher.auth_encryptor(aad)
+    return encryptor.nonce + encryptor.update(data) + encryptor.finalize()
+
+
+def _open_sealed(cipher, sealed, aad):
+    nonce, body = sealed[:cipher.auth_nonce_size], sealed[cipher.auth_nonce_size:]
+    decryptor = cipher.auth_decryptor(nonce, aad)
+    return decryptor.update(body) + decryptor.finalize()
+
+
+def _chunk_aad(header_raw, index):
+    return header_raw + index.to_bytes(8, 'big')
+
+
+class ChunkedFile:
+    """An open chunked file: header, chunk size, plaintext length and chunk hashes"""
+    def __init__(self, cipher, f):
+        self.cipher = cipher
+        self.f = f
+        self.header = read_header(f)
+        if self.header is None or self.header.mode != CHUNKED_MODE:
+            raise ValueError("Not a chunked encrypted file")
+        if self.header.cipher != cipher.name:
+            raise ValueError(f"File was encrypted with {self.header.cipher}, not {cipher.name}")
+        self.data_start = f.tell()
+        if not self.header.chunk_size:
+            raise ValueError("Chunked file header does not record a chunk size")
+        self.chunk_size = self.header.chunk_size
+        self.slot_size = _sealed_size(cipher, self.chunk_size)
+        self.length, self.hashes = self._read_index()
+
+    def _read_index(self):
+        f = self.f
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        if end - self.data_start < _TRAILER.size:
+            raise ValueError("Truncated chunked file")
+        f.seek(end - _TRAILER.size)
+        index_size, magic = _TRAILER.unpack(f.read(_TRAILER.size))
+        if magic != _TRAILER_MAGIC or index_size > end - self.data_start - _TRAILER.size:
+            raise ValueError("Corrupt chunked file trailer")
+        self.index_start = end - _TRAILER.size - index_size
+        f.seek(self.index_start)
+        self.sealed_index = f.read(index_size)
+        try:
+            index = _open_sealed(self.cipher, self.sealed_index, self.header.raw + b'index')
+        except ValueError as e:
+            raise ValueError(f"Authentication failed, the file index is corrupted or was "
+                             f"modified ({e})") from e
+        length, count = _INDEX_PREFIX.unpack_from(index)
+        body = index[_INDEX_PREFIX.size:]
+        hashes = [body[i * CHUNK_HASH_SIZE:(i + 1) * CHUNK_HASH_SIZE] for i in range(count)]
+        # The index may sit further out than the data end while an update
+        # that grows the file is in progress
+        if count != -(-length // self.chunk_size) or self.index_start < self.data_end(length):
+            raise ValueError("Chunked file index does not match its data")
+        return length, hashes
+
+    def chunk_offset(self, i):
+        return self.data_start + i * self.slot_size
+
+    def data_end(self, length):
+        """Offset just past the last chunk of a file with length plaintext bytes"""
+        count = -(-length // self.chunk_size)
+        if not count:
+            return self.data_start
+        return self.chunk_offset(count - 1) + self.sealed_size(count - 1, length)
+
+    def sealed_size(self, i, length):
+        """Sealed size of chunk i of a file with length plaintext bytes"""
+        return _sealed_size(self.cipher, min(self.chunk_size, length - i * self.chunk_size))
+
+    def read_chunk(self, i):
+        """Decrypt and verify chunk i"""
+        self.f.seek(self.chunk_offset(i))
+        sealed = self.f.read(self.sealed_size(i, self.length))
+        try:
+            data = _open_sealed(self.cipher, sealed, _chunk_aad(self.header.raw, i))
+        except ValueError as e:
+            raise ValueError(f"Authentication failed, chunk {i} is corrupted or was "
+                             f"modified ({e})") from e
+        if chunk_hash(self.cipher, data) != self.hashes[i]:
+            raise ValueError(f"Chunk {i} does not match the file index")
+        return data
+
+
+def chunk_hash(cipher, data, key=None):
+    """Keyed hash of a plaintext chunk, as stored in the index"""
+    return hashlib.blake2b(data, key=key or _hash_key(cipher),
+                           digest_size=CHUNK_HASH_SIZE).digest()
+
+
+def _index_record(cipher, header_raw, length, hashes):
+    """The sealed index followed by its trailer"""
+    index = _INDEX_PREFIX.pack(length, len(hashes)) + b''.join(hashes)
+    sealed = _seal(cipher, index, header_raw + b'index')
+    return sealed + _TRAILER.pack(len(sealed), _TRAILER_MAGIC)
+
+
+def _write_index(cipher, f, header_raw, position, length, hashes):
+    """Write the sealed index and trailer at position and truncate after them"""
+    f.seek(position)
+    f.write(_index_record(cipher, header_raw, length, hashes))
+    f.truncate()
+
+
+def encrypt_chunked(cipher, input_path, output_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Encrypt input_path into the chunked format; returns the number of chunks"""
+    if chunk_size <= 0:
+        raise ValueError("Chunk size must be positive")
+    header = FileHeader(cipher.name, CHUNKED_MODE, chunk_size=chunk_size).to_bytes()
+    # Fill in an empty file in the temporary path, so an interrupted run
+    # never leaves a truncated file at output_path
+    with AtomicOutput(output_path) as out:
+        out.write(header + _index_record(cipher, header, 0, []))
+        out.flush()
+        count = update_chunked(cipher, input_path, out.tmp_path)[1]
+    return count
+
+
+def update_chunked(cipher, input_path, encrypted_path, assume_append=False):
+    """Bring encrypted_path up to date with input_path; returns (rewritten, total) chunks
+
+    Each chunk of input_path is hashed and compared with the index; only
+    changed or new chunks are encrypted and written. With assume_append=True
+    the chunks before the last previously stored one are trusted to be
+    unchanged and not even read, so an append costs only the appended data
+    (it is ignored if the file shrank).
+    """
+    key = _hash_key(cipher)
+    with open(encrypted_path, 'r+b') as f, open(input_path, 'rb') as src:
+        chunked = ChunkedFile(cipher, f)
+        chunk_size = chunked.chunk_size
+        length = os.fstat(src.fileno()).st_size
+        count = -(-length // chunk_size)
+        old_hashes = chunked.hashes
+        hashes = list(old_hashes[:count])
+
+        start = 0
+        if assume_append and length >= chunked.length:
+            start = max(len(old_hashes) - 1, 0)
+        src.seek(start * chunk_size)
+        rewritten = 0
+        if chunked.data_end(length) > chunked.index_start:
+            # New chunks will overwrite the current index: move it past the
+            # new data end first, so an interrupted update can be re-run
+            f.seek(chunked.data_end(length))
+            f.write(chunked.sealed_index + _TRAILER.pack(len(chunked.sealed_index), _TRAILER_MAGIC))
+        for i in range(start, count):
+            data = src.read(chunk_size)
+            if len(data) != min(chunk_size, length - i * chunk_size):
+                raise ValueError(f"'{input_path}' changed while it was being read")
+            digest = chunk_hash(cipher, data, key)
+            if i < len(old_hashes) and old_hashes[i] == digest:
+                continue
+            f.seek(chunked.chunk_offset(i))
+            f.write(_seal(cipher, data, _chunk_aad(chunked.header.raw, i)))
+            if i < len(hashes):
+                hashes[i] = digest
+            else:
+                hashes.append(digest)
+            rewritten += 1
+
+        if rewritten or length != chunked.length:
+            _write_index(cipher, f, chunked.header.raw, chunked.data_end(length), length, hashes)
+    return rewritten, count
+
+
+def decrypt_chunked(cipher, input_path, output_path):
+    """Decrypt a chunked file, verifying every chunk; returns the plaintext size"""
+    with open(input_path, 'rb') as f:
+        chunked = ChunkedFile(cipher, f)
+        with AtomicOutput(output_path, expected_size=chunked.length) as dst:
+            for i in range(len(chunked.hashes)):
+                dst.write(chunked.read_chunk(i))
+    return chunked.length
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chunked encryption with incremental updates")
+    parser.add_argument('operation', choices=['encrypt', 'update', 'decrypt'])
+    parser.add_argument('input', help="Plaintext (encrypt/update) or chunked file (decrypt)")
+    parser.add_argument('output', help="Chunked file (encrypt/update) or plaintext (decrypt)")
+    parser.add_argument('--cipher', choices=list(CIPHERS), required=True)
+    parser.add_argument('--key', required=True, help="Key file")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--append-only', action='store_true',
+                        help="Update: assume only the end of the file changed")
+    args = parser.parse_args(argv)
+
+    try:
+        cipher = load_cipher(args.cipher, args.key)
+        if args.operation == "encrypt":
+            count = encrypt_chunked(cipher, args.input, args.output, args.chunk_size)
+            print(f"Encrypted {count} chunk(s)")
+        elif args.operation == "update":
+            rewritten, count = update_chunked(cipher, args.input, args.output, args.append_only)
+            print(f"Re-encrypted {rewritten} of {count} chunk(s)")
+        else:
+            size = decrypt_chunked(cipher, args.input, args.output)
+            print(f"Decrypted {size} bytes")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
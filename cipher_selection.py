@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Automatic Cipher Selection
+Picks the faster authenticated file cipher for this host. AES-GCM wins by
+a wide margin on CPUs with AES instructions, while ChaCha20-Poly1305 wins
+on hosts without them (older VMs, many ARM boards). Both are timed on a few
+MiB of data, and the result is cached per host in a small JSON file, so the
+measurement runs once rather than on every start. The chosen cipher is
+recorded in each file's header, so decryption needs no selection.
+
+    python cipher_selection.py            # show the cached choice
+    python cipher_selection.py --refresh  # measure again
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+import Crypto
+
+from aes_cipher import AESCipher
+from chacha_cipher import ChaCha20Cipher
+
+# Candidates for "auto", in order of preference when they are equally fast
+AUTO_CIPHERS = {"AES": AESCipher, "CHACHA20": ChaCha20Cipher}
+
+# Overrides the cache file location, e.g. for read-only home directories
+CACHE_ENV = "CRYPTO_CIPHER_CACHE"
+CACHE_VERSION = 1
+BENCHMARK_SIZE = 4 * 1024 * 1024
+BENCHMARK_ROUNDS = 3
+
+_results = None
+_lock = threading.Lock()
+
+
+def cache_path():
+    """Location of the per-user benchmark cache"""
+    if os.environ.get(CACHE_ENV):
+        return os.environ[CACHE_ENV]
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'cryptography-project', 'cipher_benchmark.json')
+
+
+def host_id():
+    """Identifies the conditions a measurement is valid for"""
+    return '|'.join([platform.node(), platform.machine(), platform.python_implementation(),
+                     platform.python_version(), Crypto.__version__])
+
+
+def benchmark(size=BENCHMARK_SIZE, rounds=BENCHMARK_ROUNDS):
+    """Authenticated encryption throughput of each candidate; returns {name: bytes/s}"""
+    data = os.urandom(size)
+    out = bytearray(size)
+    results = {}
+    for name, cls in AUTO_CIPHERS.items():
+        cipher = cls(os.urandom(32))
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            encryptor = cipher.auth_encryptor()
+            encryptor.update_into(data, out)
+            encryptor.finalize()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = size / max(best, 1e-9)
+    return results
+
+
+def _read_cache(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get('version') != CACHE_VERSION or \
+            cached.get('host') != host_id():
+        return None
+    results = cached.get('results')
+    if not isinstance(results, dict) or set(results) != set(AUTO_CIPHERS):
+        return None
+    return results
+
+
+def _write_cache(path, results):
+    """Write atomically; a cache that cannot be written only costs a re-measurement"""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': CACHE_VERSION, 'host': host_id(),
+                           'measured': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                           'results': results}, f, indent=1)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except OSError:
+        pass
+
+
+def measurements(refresh=False):
+    """Throughput of each candidate ({name: bytes/s}); measured once per host and cached"""
+    global _results
+    with _lock:
+        if _results is None or refresh:
+            path = cache_path()
+            results = None if refresh else _read_cache(path)
+            if results is None:
+                results = benchmark()
+                _write_cache(path, results)
+            _results = results
+        return dict(_results)
+
+
+def cipher_ranking(refresh=False):
+    """Candidate names, fastest first"""
+    results = measurements(refresh)
+    names = list(AUTO_CIPHERS)
+    return sorted(names, key=lambda name: (-results[name], names.index(name)))
+
+
+def fastest_cipher():
+    """Name of the fastest authenticated cipher on this host"""
+    return cipher_ranking()[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show which authenticated cipher 'auto' "
+                                                 "selects on this host")
+    parser.add_argument('--refresh', action='store_true', help="Measure again, ignoring the cache")
+    args = parser.parse_args(argv)
+
+    results = measurements(args.refresh)
+    for name in cipher_ranking():
+        print(f"{name:<10} {results[name] / 1024 / 1024:8.1f} MiB/s")
+    print(f"auto selects {fastest_cipher()} (cache: {cache_path()})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Streaming Compression Stage
+zlib/bz2/lzma compressors usable in front of AES/DES file encryption
+
+A small compressed chunk can expand without limit, so decompression output
+is produced in pieces of at most max_length bytes: run_transform and the
+pipeline consume transforms through pieces() / finalize_pieces() where a
+transform offers them, and never hold more than one piece per stage.
+"""
+
+import bz2
+import lzma
+import zlib
+
+COMPRESSION_METHODS = ('zlib', 'bz2', 'lzma')
+# Largest piece a Decompressor produces at a time, unless told otherwise
+DEFAULT_MAX_LENGTH = 1024 * 1024
+
+# Approximate fixed working memory of each (de)compressor at the levels used
+# below, on top of the data chunks themselves (bz2 also emits its output a
+# whole 900 kB block at a time, whatever the chunk size)
+MEMORY_OVERHEAD = {
+    'zlib': 1024 * 1024,
+    'bz2': 11 * 1024 * 1024,
+    'lzma': 96 * 1024 * 1024,
+}
+
+
+def _compressor(method):
+    if method == 'zlib':
+        return zlib.compressobj(6)
+    if method == 'bz2':
+        return bz2.BZ2Compressor(9)
+    if method == 'lzma':
+        return lzma.LZMACompressor()
+    raise ValueError(f"Unknown compression method '{method}'. Choose from: {', '.join(COMPRESSION_METHODS)}")
+
+
+def _decompressor(method):
+    if method == 'zlib':
+        return zlib.decompressobj()
+    if method == 'bz2':
+        return bz2.BZ2Decompressor()
+    if method == 'lzma':
+        return lzma.LZMADecompressor()
+    raise ValueError(f"Unknown compression method '{method}'")
+
+
+class Compressor:
+    """Incremental compressor with the update/finalize transform interface"""
+    def __init__(self, method):
+        self.method = method
+        self._obj = _compressor(method)
+
+    def update(self, data):
+        return self._obj.compress(data)
+
+    def finalize(self):
+        return self._obj.flush()
+
+
+def transform_pieces(transform, data):
+    """The output of transform.update(data), in bounded pieces if the transform supports it"""
+    pieces = getattr(transform, 'pieces', None)
+    if pieces is not None:
+        yield from pieces(data)
+        return
+    out = transform.update(data)
+    if out:
+        yield out
+
+
+def finalize_pieces(transform):
+    """The output of transform.finalize(), in bounded pieces if the transform supports it"""
+    pieces = getattr(transform, 'finalize_pieces', None)
+    if pieces is not None:
+        yield from pieces()
+        return
+    out = transform.finalize()
+    if out:
+        yield out
+
+
+class Decompressor:
+    """Incremental decompressor with the update/finalize transform interface
+
+    pieces(data) yields the output of data in pieces of at most max_length
+    bytes; update() joins them, for callers that want it all at once.
+    """
+    def __init__(self, method, max_length=DEFAULT_MAX_LENGTH):
+        if max_length <= 0:
+            raise ValueError("max_length must be positive")
+        self.method = method
+        self.max_length = max_length
+        self._obj = _decompressor(method)
+
+    def pieces(self, data):
+        obj = self._obj
+        out = obj.decompress(data, self.max_length)
+        while True:
+            if out:
+                yield out
+            if self.method == 'zlib':
+                # Input zlib could not expand within max_length is kept aside
+                if not obj.unconsumed_tail:
+                    return
+                out = obj.decompress(obj.unconsumed_tail, self.max_length)
+            else:
+                # bz2 and lzma buffer unprocessed input themselves
+                if obj.eof or obj.needs_input:
+                    return
+                out = obj.decompress(b'', self.max_length)
+
+    def update(self, data):
+        return b''.join(self.pieces(data))
+
+    def finalize(self):
+        out = self._obj.flush() if self.method == 'zlib' else b''
+        if not self._obj.eof:
+            raise ValueError("Compressed data is truncated")
+        return out
+
+
+class TransformChain:
+    """Feed the output of each transform into the next one"""
+    def __init__(self, transforms):
+        self.transforms = list(transforms)
+
+    def update(self, data):
+        return b''.join(self.pieces(data))
+
+    def finalize(self):
+        return b''.join(self.finalize_pieces())
+
+    def pieces(self, data):
+        return self._feed(0, data)
+
+    def finalize_pieces(self):
+        for i, transform in enumerate(self.transforms):
+            for piece in finalize_pieces(transform):
+                yield from self._feed(i + 1, piece)
+
+    def _feed(self, i, data):
+        """Pass data through transforms i.. one piece at a time"""
+        if i == len(self.transforms):
+            yield data
+            return
+        for piece in transform_pieces(self.transforms[i], data):
+            yield from self._feed(i + 1, piece)
@@ -0,0 +1,228 @@
+"""
+Envelope Encryption
+Encrypts a file once under a random data key and stores that key wrapped
+(AES key wrap, RFC 3394) for each recipient AES key in the file header.
+Recipients can be added or removed by rewriting the header only.
+
+Layout:
+    FileHeader (cipher AES, mode GCM-ENVELOPE)
+    slot table: capacity (2) | count (2) | capacity * (key id (8) | wrapped key (40))
+    nonce (12) | payload ciphertext | GCM tag (16)
+
+The payload is AES-256-GCM with the FileHeader as associated data. The slot
+table is deliberately not part of the associated data so it can change
+without touching the payload; each wrapped key carries its own integrity
+check from the key wrap.
+"""
+
+import struct
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+
+from aes_cipher import AESCipher
+from atomic_output import AtomicOutput
+from compression import Compressor, Decompressor, TransformChain
+from file_header import FileHeader, read_header
+from pipeline import PipelineExecutor
+from stream_cipher import GCM_NONCE_SIZE, GCMDecryptor, GCMEncryptor, run_transform
+
+ENVELOPE_MODE = "GCM-ENVELOPE"
+DATA_KEY_SIZE = 32
+DEFAULT_CAPACITY = 16
+
+_KEY_ID_SIZE = 8
+_WRAPPED_SIZE = DATA_KEY_SIZE + 8
+_SLOT_SIZE = _KEY_ID_SIZE + _WRAPPED_SIZE
+_TABLE_PREFIX = struct.Struct('>HH')
+_KW_IV = b'\xa6' * 8
+
+
+def aes_key_wrap(kek, key):
+    """Wrap key (a multiple of 8 bytes) under kek using RFC 3394 AES key wrap"""
+    if len(key) % 8 or len(key) < 16:
+        raise ValueError("Key to wrap must be a multiple of 8 bytes and at least 16 bytes")
+    ecb = AES.new(kek, AES.MODE_ECB)
+    n = len(key) // 8
+    a = _KW_IV
+    r = [key[i * 8:(i + 1) * 8] for i in range(n)]
+    for j in range(6):
+        for i in range(n):
+            b = ecb.encrypt(a + r[i])
+            t = (n * j + i + 1).to_bytes(8, 'big')
+            a = bytes(x ^ y for x, y in zip(b[:8], t))
+            r[i] = b[8:]
+    return a + b''.join(r)
+
+
+def aes_key_unwrap(kek, wrapped):
+    """Unwrap an RFC 3394 wrapped key; raises ValueError if kek is wrong or data was modified"""
+    if len(wrapped) % 8 or len(wrapped) < 24:
+        raise ValueError("Wrapped key has an invalid length")
+    ecb = AES.new(kek, AES.MODE_ECB)
+    n = len(wrapped) // 8 - 1
+    a = wrapped[:8]
+    r = [wrapped[(i + 1) * 8:(i + 2) * 8] for i in range(n)]
+    for j in range(5, -1, -1):
+        for i in range(n - 1, -1, -1):
+            t = (n * j + i + 1).to_bytes(8, 'big')
+            b = ecb.decrypt(bytes(x ^ y for x, y in zip(a, t)) + r[i])
+            a = b[:8]
+            r[i] = b[8:]
+    if a != _KW_IV:
+        raise ValueError("Key unwrap failed: wrong key or corrupted data")
+    return b''.join(r)
+
+
+def _as_cipher(key):
+    """Accept an AESCipher or raw AES key bytes"""
+    return key if isinstance(key, AESCipher) else AESCipher(key)
+
+
+def _key_ids(cipher):
+    """(key id written for cipher, key id that earlier versions wrote)"""
+    return (bytes.fromhex(cipher.fingerprint())[:_KEY_ID_SIZE],
+            bytes.fromhex(cipher.legacy_fingerprint())[:_KEY_ID_SIZE])
+
+
+def _pack_slots(slots, capacity):
+    """Serialize [(key_id, wrapped_key)] into a fixed-size slot table"""
+    if len(slots) > capacity:
+        raise ValueError("More recipients than slot capacity")
+    table = _TABLE_PREFIX.pack(capacity, len(slots))
+    table += b''.join(key_id + wrapped for key_id, wrapped in slots)
+    return table + bytes(_SLOT_SIZE * (capacity - len(slots)))
+
+
+def _read_envelope_header(f):
+    """Read the FileHeader and slot table; returns (header, capacity, slots)"""
+    header = read_header(f)
+    if header is None or header.mode != ENVELOPE_MODE:
+        raise ValueError("Not an envelope-encrypted file")
+    prefix = f.read(_TABLE_PREFIX.size)
+    if len(prefix) != _TABLE_PREFIX.size:
+        raise ValueError("Truncated envelope header")
+    capacity, count = _TABLE_PREFIX.unpack(prefix)
+    table = f.read(capacity * _SLOT_SIZE)
+    if len(table) != capacity * _SLOT_SIZE or count > capacity:
+        raise ValueError("Corrupt envelope header")
+    slots = []
+    for i in range(count):
+        slot = table[i * _SLOT_SIZE:(i + 1) * _SLOT_SIZE]
+        slots.append((slot[:_KEY_ID_SIZE], slot[_KEY_ID_SIZE:]))
+    return header, capacity, slots
+
+
+def _unwrap_data_key(slots, cipher):
+    """Find the recipient slot for cipher and unwrap the data key"""
+    key_ids = _key_ids(cipher)
+    for slot_id, wrapped in slots:
+        if slot_id in key_ids:
+            return aes_key_unwrap(cipher.key, wrapped)
+    raise ValueError("This key is not a recipient of the file")
+
+
+def encrypt_envelope(input_path, output_path, recipients, capacity=DEFAULT_CAPACITY,
+                     compression=None):
+    """Encrypt input_path once for several recipients (AESCipher objects or AES keys)
+
+    capacity reserves header slots so recipients can later be added without
+    moving the payload. Returns the number of bytes written.
+    """
+    ciphers = [_as_cipher(r) for r in recipients]
+    if not ciphers:
+        raise ValueError("At least one recipient key is required")
+    capacity = max(capacity, len(ciphers))
+    data_key = get_random_bytes(DATA_KEY_SIZE)
+    slots = [(_key_ids(c)[0], aes_key_wrap(c.key, data_key)) for c in ciphers]
+
+    header = FileHeader("AES", ENVELOPE_MODE, compression).to_bytes()
+    encryptor = GCMEncryptor(AES, data_key, aad=header)
+    transform = encryptor
+    if compression:
+        transform = TransformChain([Compressor(compression), encryptor])
+    prefix = header + _pack_slots(slots, capacity) + encryptor.nonce
+    with open(input_path, 'rb') as src:
+        with AtomicOutput(output_path) as dst:
+            dst.write(prefix)
+            _, bytes_out = run_transform(transform, src, dst, executor=PipelineExecutor())
+    return len(prefix) + bytes_out
+
+
+def decrypt_envelope(input_path, output_path, key):
+    """Decrypt an envelope file with any recipient's key; returns the plaintext size"""
+    cipher = _as_cipher(key)
+    with open(input_path, 'rb') as src:
+        header, _, slots = _read_envelope_header(src)
+        data_key = _unwrap_data_key(slots, cipher)
+        nonce = src.read(GCM_NONCE_SIZE)
+        transform = GCMDecryptor(AES, data_key, nonce, aad=header.raw)
+        if header.compression:
+            transform = TransformChain([transform, Decompressor(header.compression)])
+        # Never leave unverified plaintext behind: output_path is only
+        # replaced once the tag has been checked
+        with AtomicOutput(output_path) as dst:
+            _, bytes_out = run_transform(transform, src, dst, executor=PipelineExecutor())
+    return bytes_out
+
+
+def list_recipients(path):
+    """Return the key ids (hex) of a file's recipients"""
+    with open(path, 'rb') as f:
+        _, _, slots = _read_envelope_header(f)
+    return [key_id.hex() for key_id, _ in slots]
+
+
+def _write_slots(path, slots):
+    """Rewrite the slot table in place, or grow it if it is full"""
+    with open(path, 'r+b') as f:
+        header, capacity, _ = _read_envelope_header(f)
+        if len(slots) <= capacity:
+            f.seek(len(header.raw))
+            f.write(_pack_slots(slots, capacity))
+            return
+        payload_start = f.tell()
+
+    # Out of reserved slots: write a copy with a larger table. The payload
+    # bytes are copied as-is, never decrypted or re-encrypted.
+    new_capacity = max(capacity * 2, len(slots))
+    with open(path, 'rb') as src, AtomicOutput(path) as dst:
+        dst.write(header.raw + _pack_slots(slots, new_capacity))
+        src.seek(payload_start)
+        while True:
+            chunk = src.read(1024 * 1024)
+            if not chunk:
+                break
+            dst.write(chunk)
+
+
+def add_recipient(path, existing_key, new_key):
+    """Give new_key access to an envelope file, using a current recipient's key"""
+    existing, new = _as_cipher(existing_key), _as_cipher(new_key)
+    with open(path, 'rb') as f:
+        _, _, slots = _read_envelope_header(f)
+    data_key = _unwrap_data_key(slots, existing)
+    new_ids = _key_ids(new)
+    slots = [slot for slot in slots if slot[0] not in new_ids]
+    slots.append((new_ids[0], aes_key_wrap(new.key, data_key)))
+    _write_slots(path, slots)
+
+
+def remove_recipient(path, key):
+    """Revoke a recipient's slot (an AESCipher, AES key or hex key id)
+
+    Note that this only stops the key from unwrapping the data key from this
+    file; anyone who already decrypted the data key could still read it.
+    """
+    if isinstance(key, str):
+        key_ids = (bytes.fromhex(key)[:_KEY_ID_SIZE],)
+    else:
+        key_ids = _key_ids(_as_cipher(key))
+    with open(path, 'rb') as f:
+        _, _, slots = _read_envelope_header(f)
+    remaining = [slot for slot in slots if slot[0] not in key_ids]
+    if len(remaining) == len(slots):
+        raise ValueError("Key is not a recipient of the file")
+    if not remaining:
+        raise ValueError("Cannot remove the last recipient")
+    _write_slots(path, remaining)
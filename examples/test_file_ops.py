@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Round-trip and error-path checks for the file tools: memory budgets, file
+headers (legacy and current), chunked files, archives, the encryption
+service and split (parallel) decryption.
+
+Each check takes a scratch directory and raises AssertionError (or the
+unexpected exception) on failure. Run this file directly, or let pytest
+collect it; the exit status is non-zero if any check fails.
+"""
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Ensure project root is on sys.path so we can import cipher modules when running this file
+THIS_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = THIS_DIR.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from aes_cipher import AESCipher
+from archive import Archive, create_archive
+from chunked_file import decrypt_chunked, encrypt_chunked, update_chunked
+from des_cipher import DESCipher
+from file_header import FileHeader, peek_header
+from file_ops import MemoryBudgetError, decrypt_path, encrypt_path, plan_file
+from scheduler import WorkStealingPool, split_job
+from service_client import ServiceClient, ServiceError
+from vigenere_cipher import VigenereCipher
+
+AES_KEY_FILE = THIS_DIR / "aes" / "key_256.txt"
+DES_KEY_FILE = THIS_DIR / "des" / "key_08.txt"
+VIGENERE_KEY_FILE = THIS_DIR / "vigenere_key.txt"
+VIGENERE_TABLE_FILE = THIS_DIR / "vigenere_table.txt"
+
+
+def sample_data(size: int) -> bytes:
+    """Half random, half repetitive bytes, so compression has something to do"""
+    return (os.urandom(size // 2) + b"attack at dawn\n" * (size // 30 + 1))[:size]
+
+
+def expect_error(error, function, *args, **kwargs) -> Exception:
+    try:
+        function(*args, **kwargs)
+    except error as e:
+        return e
+    raise AssertionError(f"{function.__name__} did not raise {error.__name__}")
+
+
+def flip_byte(path: Path, offset: int) -> None:
+    data = bytearray(path.read_bytes())
+    data[offset] ^= 0x01
+    path.write_bytes(bytes(data))
+
+
+def test_memory_budget(tmp_path: Path) -> None:
+    aes = AESCipher.from_key_file(str(AES_KEY_FILE))
+    data = sample_data(3 * 1024 * 1024)
+    src, enc, dec = tmp_path / "in.bin", tmp_path / "in.enc", tmp_path / "in.dec"
+    src.write_bytes(data)
+    budget = 2 * 1024 * 1024
+    for pipelined in (True, False):
+        for compression in (None, "zlib"):
+            report = encrypt_path(aes, str(src), str(enc), memory_budget=budget,
+                                  pipelined=pipelined, compression=compression)
+            assert report.mode != "whole", report.summary()
+            assert report.peak_memory <= budget, report.summary()
+            report = decrypt_path(aes, str(enc), str(dec), memory_budget=budget, pipelined=pipelined)
+            assert report.peak_memory <= budget, report.summary()
+            assert dec.read_bytes() == data
+            estimate = plan_file(len(data), budget, pipelined=pipelined, compression=compression)[2]
+            assert estimate <= budget, estimate
+
+    # Budgets too small to run in are refused before any output is written
+    enc.unlink()
+    expect_error(MemoryBudgetError, encrypt_path, aes, str(src), str(enc), memory_budget=64 * 1024)
+    expect_error(MemoryBudgetError, encrypt_path, aes, str(src), str(enc),
+                 memory_budget=budget, compression="lzma")
+    assert not enc.exists()
+
+
+def test_file_header(tmp_path: Path) -> None:
+    aes = AESCipher.from_key_file(str(AES_KEY_FILE))
+    data = sample_data(100 * 1024)
+    src, enc, dec = tmp_path / "in.bin", tmp_path / "in.enc", tmp_path / "in.dec"
+    src.write_bytes(data)
+
+    # Current format: the header names the cipher, mode, key and size
+    encrypt_path(aes, str(src), str(enc))
+    header = peek_header(str(enc))
+    assert (header.cipher, header.mode) == ("AES", "CBC")
+    assert header.key_fingerprint == aes.fingerprint()
+    assert header.original_size == len(data)
+    decrypt_path(aes, str(enc), str(dec))
+    assert dec.read_bytes() == data
+
+    # Unknown fields survive a round trip through the serialized form
+    header = FileHeader("AES", "GCM", "zlib", extra={200: b"future"}, original_size=7)
+    parsed = FileHeader.from_bytes(header.to_bytes())
+    assert (parsed.cipher, parsed.mode, parsed.compression) == ("AES", "GCM", "zlib")
+    assert parsed.extra == {200: b"future"} and parsed.original_size == 7
+
+    # Legacy headerless IV||ciphertext files still decrypt
+    legacy = tmp_path / "legacy.enc"
+    legacy.write_bytes(aes.encrypt_file(data))
+    assert peek_header(str(legacy)) is None
+    decrypt_path(aes, str(legacy), str(dec))
+    assert dec.read_bytes() == data
+
+    # Wrong cipher, wrong key and damaged headers are rejected
+    dec.unlink()
+    des = DESCipher.from_key_file(str(DES_KEY_FILE))
+    assert "not DES" in str(expect_error(ValueError, decrypt_path, des, str(enc), str(dec)))
+    other = AESCipher(os.urandom(32))
+    assert "different key" in str(expect_error(ValueError, decrypt_path, other, str(enc), str(dec)))
+    assert not dec.exists()
+    raw = header.to_bytes()
+    expect_error(ValueError, FileHeader.from_bytes, raw[:-1])
+    expect_error(ValueError, FileHeader.from_bytes, raw[:4] + bytes([99]) + raw[5:])
+
+
+def test_chunked(tmp_path: Path) -> None:
+    aes = AESCipher.from_key_file(str(AES_KEY_FILE))
+    data = bytearray(sample_data(40 * 1024))
+    src, enc, dec = tmp_path / "in.bin", tmp_path / "in.cenc", tmp_path / "in.dec"
+    src.write_bytes(data)
+    assert encrypt_chunked(aes, str(src), str(enc), chunk_size=4096) == 10
+    assert decrypt_chunked(aes, str(enc), str(dec)) == len(data)
+    assert dec.read_bytes() == data
+
+    # Only the changed and appended chunks are rewritten
+    data[5000] ^= 0xFF
+    data += b"appended" * 1000
+    src.write_bytes(data)
+    assert update_chunked(aes, str(src), str(enc)) == (3, 12)
+    assert update_chunked(aes, str(src), str(enc)) == (0, 12)
+    decrypt_chunked(aes, str(enc), str(dec))
+    assert dec.read_bytes() == data
+
+    # A modified chunk fails authentication and leaves no output
+    dec.unlink()
+    flip_byte(enc, len(peek_header(str(enc)).raw) + 100)
+    expect_error(ValueError, decrypt_chunked, aes, str(enc), str(dec))
+    assert not dec.exists()
+
+
+def test_archive(tmp_path: Path) -> None:
+    aes = AESCipher.from_key_file(str(AES_KEY_FILE))
+    tree = tmp_path / "tree"
+    (tree / "sub").mkdir(parents=True)
+    files = {"a.txt": b"first member\n" * 100, "sub/b.bin": sample_data(50 * 1024),
+             "empty": b""}
+    for name, content in files.items():
+        (tree / name).write_bytes(content)
+    arc = tmp_path / "tree.arc"
+    assert create_archive(aes, [str(tree)], str(arc), chunk_size=4096) == len(files)
+
+    out = tmp_path / "out"
+    with Archive(aes, str(arc)) as archive:
+        assert sorted(m["name"] for m in archive.members()) == sorted(files)
+        for name, content in files.items():
+            assert Path(archive.extract_to(name, str(out))).read_bytes() == content
+        expect_error(KeyError, archive.extract, "missing", None)
+
+    # Wrong key, damaged member data
+    expect_error(ValueError, Archive, AESCipher(os.urandom(32)), str(arc))
+    flip_byte(arc, len(peek_header(str(arc)).raw) + 10)
+    with Archive(aes, str(arc)) as archive:
+        err = expect_error(ValueError, archive.extract_to, "a.txt", str(tmp_path / "damaged"))
+        assert "corrupted" in str(err)
+    assert not (tmp_path / "damaged" / "a.txt").exists()
+
+
+def test_service(tmp_path: Path) -> None:
+    key_dir = tmp_path / "keys"
+    key_dir.mkdir()
+    for source in (AES_KEY_FILE, VIGENERE_KEY_FILE, VIGENERE_TABLE_FILE):
+        (key_dir / source.name).write_bytes(source.read_bytes())
+    outside = tmp_path / "outside.txt"
+    outside.write_bytes(AES_KEY_FILE.read_bytes())
+    address = str(tmp_path / "service.sock")
+    server = subprocess.Popen([sys.executable, str(PROJECT_ROOT / "service.py"),
+                               "--key-dir", str(key_dir), "--socket", address],
+                              stdout=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            if os.path.exists(address):
+                break
+            time.sleep(0.1)
+        aes_key = str(key_dir / AES_KEY_FILE.name)
+        with ServiceClient(address) as client:
+            payload = sample_data(200 * 1024)
+            encrypted = client.encrypt("AES", payload, key_file=aes_key)
+            assert client.decrypt("AES", encrypted, key_file=aes_key) == payload
+            assert AESCipher.from_key_file(str(AES_KEY_FILE)).decrypt_file(encrypted) == payload
+
+            text = b"Meet me at the usual place"
+            vigenere = {"key_file": str(key_dir / VIGENERE_KEY_FILE.name),
+                        "table_file": str(key_dir / VIGENERE_TABLE_FILE.name)}
+            encrypted = client.encrypt("Vigenere", text, **vigenere)
+            assert client.decrypt("Vigenere", encrypted, **vigenere) == text.upper()
+
+            # Unknown ciphers, keys outside the key directory, bad ciphertext
+            for cipher in ("NOPE", None):
+                expect_error(ServiceError, client.encrypt, cipher, b"x", key_file=aes_key)
+            expect_error(ServiceError, client.encrypt, "AES", b"x", key_file=str(outside))
+            expect_error(ServiceError, client.decrypt, "AES", b"short", key_file=aes_key)
+            # The connection survives refused requests, which add no metric labels
+            client.ping()
+            assert "NOPE" not in client.metrics()
+    finally:
+        # SIGINT lets asyncio.run() cancel the server cleanly
+        server.send_signal(signal.SIGINT)
+        server.wait()
+
+
+def test_split_decrypt(tmp_path: Path) -> None:
+    def run(cipher, operation, src, dst, chunk_size):
+        results = []
+        job = split_job(cipher, operation, str(src), str(dst),
+                        lambda report, error: results.append((report, error)),
+                        chunk_size=chunk_size)
+        assert job is not None
+        pool = WorkStealingPool(3)
+        job.start(pool.submit)
+        assert not pool.run()
+        return results[0]
+
+    for cipher in (AESCipher.from_key_file(str(AES_KEY_FILE)),
+                   DESCipher.from_key_file(str(DES_KEY_FILE))):
+        data = sample_data(300 * 1024 + 5)
+        src, enc, dec = tmp_path / "in.bin", tmp_path / "in.enc", tmp_path / "in.dec"
+        src.write_bytes(data)
+        for path in (enc, tmp_path / "legacy.enc"):
+            if path == enc:
+                encrypt_path(cipher, str(src), str(path))
+            else:
+                path.write_bytes(cipher.encrypt_file(data))
+            report, error = run(cipher, "decrypt", path, dec, 64 * 1024)
+            assert error is None, error
+            assert report.bytes_out == len(data) and dec.read_bytes() == data
+
+        # Bad padding in the last block fails the job and leaves no output
+        dec.unlink()
+        flip_byte(enc, enc.stat().st_size - 1)
+        report, error = run(cipher, "decrypt", enc, dec, 64 * 1024)
+        assert isinstance(error, ValueError)
+        assert not dec.exists()
+
+    vigenere = VigenereCipher.from_table(VIGENERE_KEY_FILE.read_text(encoding="ascii").strip(),
+                                         VIGENERE_TABLE_FILE.read_text(encoding="ascii"))
+    text = b"The quick brown fox, jumps over the lazy dog!\n" * 5000
+    src, enc, dec = tmp_path / "in.txt", tmp_path / "in.vig", tmp_path / "in.vig.txt"
+    src.write_bytes(text)
+    assert run(vigenere, "encrypt", src, enc, 10007)[1] is None
+    assert enc.read_bytes() == vigenere.encrypt_bytes(text)
+    assert run(vigenere, "decrypt", enc, dec, 4093)[1] is None
+    assert dec.read_bytes() == text.upper()
+
+
+CHECKS = [test_memory_budget, test_file_header, test_chunked, test_archive, test_service,
+          test_split_decrypt]
+
+
+def main() -> int:
+    print("=== Running file tool checks ===")
+    failed = 0
+    for check in CHECKS:
+        name = check.__name__[len("test_"):]
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                check(Path(tmp))
+                print(f"{name} OK")
+            except Exception as e:
+                failed += 1
+                print(f"{name} FAILED: {type(e).__name__}: {e}")
+    print(f"{len(CHECKS) - failed}/{len(CHECKS)} checks passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
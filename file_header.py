@@ -0,0 +1,121 @@
+"""
+Encrypted File Header
+Small extensible header placed in front of IV||ciphertext. It names the
+cipher and mode, compression, the key fingerprint, the original (plaintext)
+length and the chunk size, so tools can identify, check and route a file
+from its first few bytes. Files without it are legacy raw output.
+
+Layout: MAGIC (4) | version (1) | fields length (2) | fields
+Each field is: tag (1) | value length (1) | value
+Unknown tags are kept and ignored, so newer writers stay readable.
+"""
+
+import struct
+
+MAGIC = b'CRYP'
+VERSION = 1
+
+FIELD_CIPHER = 1
+FIELD_MODE = 2
+FIELD_COMPRESSION = 3
+FIELD_CHUNK_SIZE = 4
+FIELD_KEY_FINGERPRINT = 5
+FIELD_ORIGINAL_SIZE = 6
+
+_PREFIX = struct.Struct('>4sBH')
+MAX_HEADER_SIZE = _PREFIX.size + 0xFFFF
+
+
+class FileHeader:
+    """Metadata describing how an encrypted file was produced"""
+    def __init__(self, cipher, mode="CBC", compression=None, extra=None, key_fingerprint=None,
+                 original_size=None, chunk_size=None):
+        self.cipher = cipher
+        self.mode = mode
+        self.compression = compression
+        self.key_fingerprint = key_fingerprint
+        self.original_size = original_size
+        self.chunk_size = chunk_size
+        self.extra = dict(extra or {})
+        self.raw = None  # serialized form, set when parsed from a file
+
+    def to_bytes(self):
+        """Serialize the header"""
+        fields = {FIELD_CIPHER: self.cipher, FIELD_MODE: self.mode}
+        if self.compression:
+            fields[FIELD_COMPRESSION] = self.compression
+        if self.chunk_size is not None:
+            fields[FIELD_CHUNK_SIZE] = self.chunk_size.to_bytes(4, 'big')
+        if self.key_fingerprint:
+            fields[FIELD_KEY_FINGERPRINT] = self.key_fingerprint
+        if self.original_size is not None:
+            fields[FIELD_ORIGINAL_SIZE] = self.original_size.to_bytes(8, 'big')
+        body = b''
+        for tag, value in list(fields.items()) + list(self.extra.items()):
+            if isinstance(value, str):
+                value = value.encode('ascii')
+            if len(value) > 255:
+                raise ValueError(f"Header field {tag} is too long")
+            body += bytes([tag, len(value)]) + value
+        return _PREFIX.pack(MAGIC, VERSION, len(body)) + body
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Parse a complete serialized header"""
+        magic, version, length = _PREFIX.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not an encrypted file header")
+        if version > VERSION:
+            raise ValueError(f"Unsupported header version {version}")
+        body = data[_PREFIX.size:_PREFIX.size + length]
+        if len(body) != length:
+            raise ValueError("Truncated file header")
+        fields = {}
+        pos = 0
+        while pos < len(body):
+            if pos + 2 > len(body):
+                raise ValueError("Corrupt file header")
+            tag, size = body[pos], body[pos + 1]
+            fields[tag] = body[pos + 2:pos + 2 + size]
+            pos += 2 + size
+        if FIELD_CIPHER not in fields:
+            raise ValueError("File header does not name a cipher")
+        header = cls(fields.pop(FIELD_CIPHER).decode('ascii'),
+                     fields.pop(FIELD_MODE, b'CBC').decode('ascii'))
+        compression = fields.pop(FIELD_COMPRESSION, None)
+        header.compression = compression.decode('ascii') if compression else None
+        fingerprint = fields.pop(FIELD_KEY_FINGERPRINT, None)
+        header.key_fingerprint = fingerprint.decode('ascii') if fingerprint else None
+        for tag, name in ((FIELD_ORIGINAL_SIZE, 'original_size'), (FIELD_CHUNK_SIZE, 'chunk_size')):
+            if tag in fields:
+                setattr(header, name, int.from_bytes(fields.pop(tag), 'big'))
+        header.extra = fields
+        header.raw = bytes(data[:_PREFIX.size + length])
+        return header
+
+    def describe(self):
+        """Header fields as a JSON-serializable dict"""
+        return {'cipher': self.cipher, 'mode': self.mode, 'compression': self.compression,
+                'key_fingerprint': self.key_fingerprint, 'original_size': self.original_size,
+                'chunk_size': self.chunk_size, 'header_size': len(self.raw or self.to_bytes())}
+
+
+def read_header(f):
+    """Read a header from a binary stream positioned at its start
+
+    Returns the FileHeader, or None for a legacy headerless file, in which
+    case the stream is rewound to where it was.
+    """
+    start = f.tell()
+    prefix = f.read(_PREFIX.size)
+    if len(prefix) < _PREFIX.size or prefix[:4] != MAGIC:
+        f.seek(start)
+        return None
+    length = _PREFIX.unpack(prefix)[2]
+    return FileHeader.from_bytes(prefix + f.read(length))
+
+
+def peek_header(path):
+    """Return the FileHeader of a file, or None if it has none"""
+    with open(path, 'rb') as f:
+        return read_header(f)
@@ -0,0 +1,650 @@
+"""
+File Operations with Memory Budgeting
+Chooses whole-file or chunked processing for AES, DES and ChaCha20 files, optionally
+compresses and/or authenticates, and reports peak memory
+"""
+
+import hashlib
+import lzma
+import mmap
+import os
+import time
+import tracemalloc
+import zlib
+
+from aes_cipher import AESCipher
+from atomic_output import ALIGNMENT, DEFAULT_BUFFER_SIZE, DEFAULT_FSYNC, FSYNC_BATCH, AtomicOutput
+from chacha_cipher import ChaCha20Cipher
+from cipher_selection import cipher_ranking
+from compression import COMPRESSION_METHODS, MEMORY_OVERHEAD, Compressor, Decompressor, TransformChain
+from des_cipher import DESCipher
+from file_header import FileHeader, peek_header, read_header
+from pipeline import PipelineExecutor
+from stream_cipher import DEFAULT_CHUNK_SIZE, run_transform
+
+# Environment variable read by the CLI and GUI, e.g. "256M" or "1G"
+MEMORY_BUDGET_ENV = "CRYPTO_MEMORY_BUDGET"
+
+# Files up to this size are processed in one piece when no budget is set
+WHOLE_FILE_LIMIT = 64 * 1024 * 1024
+MIN_CHUNK_SIZE = 64 * 1024
+
+# Approximate peak memory as a multiple of the data size:
+# whole-file AES/DES holds the input, a padded or sliced copy, the cipher
+# output and the IV-prefixed result at once, chunked processing holds the
+# previous and the next read buffer plus their cipher output, and Playfair
+# holds the letters, their digraph-split copy, the encrypted pieces and the
+# result. Vigenère runs on memory maps, one bytes chunk at a time.
+# Compressed and DES-authenticated decryption runs produce their output in
+# pieces, and a compressed piece and its ciphertext are alive together.
+# The output's write buffer (see output_buffer_size) comes on top.
+WHOLE_FILE_FACTOR = 4
+CHUNK_FACTOR = 4
+PIECES_CHUNK_FACTOR = 6
+TEXT_FACTOR = 4
+# Small allocations of every run on top of that: the header, held-back
+# blocks and tags, and the pipeline's queues
+RUN_OVERHEAD = 64 * 1024
+
+_SIZE_UNITS = {'': 1, 'B': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+# File ciphers by name, for tools that select the cipher from the command line
+CIPHERS = {"AES": AESCipher, "DES": DESCipher, "CHACHA20": ChaCha20Cipher}
+# Selects the faster authenticated cipher on this host (see cipher_selection)
+AUTO_CIPHER = "auto"
+
+
+class MemoryBudgetError(Exception):
+    """Raised when an operation cannot run within the configured memory budget"""
+
+
+class OperationReport:
+    """Summary of a single file operation"""
+    def __init__(self, operation, mode, chunk_size=None, memory_budget=None):
+        self.operation = operation
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.memory_budget = memory_budget
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.peak_memory = None
+        self.elapsed = 0.0
+        # Hex SHA-256 of the input and output files, set when hash_streams=True
+        self.input_sha256 = None
+        self.output_sha256 = None
+
+    def summary(self):
+        """Return a one-line human readable summary"""
+        text = f"{self.operation}: {self.bytes_in} bytes -> {self.bytes_out} bytes ({self.mode}"
+        if self.chunk_size:
+            text += f", {format_size(self.chunk_size)} chunks"
+        text += f") in {self.elapsed:.2f}s"
+        if self.peak_memory is not None:
+            text += f", peak memory {format_size(self.peak_memory)}"
+        if self.memory_budget is not None:
+            text += f" of {format_size(self.memory_budget)} budget"
+        return text
+
+
+def parse_size(text):
+    """Parse a size such as '512K', '256M' or '1G' into bytes"""
+    value = text.strip().upper()
+    if value.endswith('IB'):
+        value = value[:-2]
+    elif value.endswith('B') and len(value) > 1 and not value[-2].isdigit():
+        value = value[:-1]
+    unit = value[-1] if value and value[-1] in _SIZE_UNITS else ''
+    number = value[:-1] if unit else value
+    try:
+        size = int(float(number) * _SIZE_UNITS[unit])
+    except ValueError:
+        raise ValueError(f"Invalid size: '{text}'")
+    if size <= 0:
+        raise ValueError(f"Size must be positive: '{text}'")
+    return size
+
+
+def format_size(size):
+    """Format a byte count for display"""
+    for unit in ('B', 'KiB', 'MiB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def memory_budget_from_env():
+    """Return the memory budget configured through the environment, or None"""
+    value = os.environ.get(MEMORY_BUDGET_ENV, "").strip()
+    return parse_size(value) if value else None
+
+
+def load_cipher(name, key_file, input_path=None):
+    """Create the named file cipher from a key file
+
+    name may be 'auto'. To encrypt, this is the fastest authenticated cipher
+    on this host that accepts the key (ChaCha20 needs a 32-byte key). To
+    decrypt (input_path given), it is the cipher named in the file's header.
+    """
+    if name == AUTO_CIPHER:
+        if input_path is not None:
+            return load_cipher(header_cipher(input_path), key_file)
+        errors = []
+        for candidate in cipher_ranking():
+            try:
+                return CIPHERS[candidate].from_key_file(key_file)
+            except ValueError as e:
+                errors.append(str(e))
+        raise ValueError(f"No authenticated cipher accepts this key ({'; '.join(errors)})")
+    if name not in CIPHERS:
+        raise ValueError(f"Unknown cipher '{name}'. Choose from: {', '.join(CIPHERS)}, {AUTO_CIPHER}")
+    return CIPHERS[name].from_key_file(key_file)
+
+
+def header_cipher(input_path):
+    """Name of the cipher recorded in a file's header"""
+    header = peek_header(input_path)
+    if header is None:
+        raise ValueError(f"'{os.path.basename(input_path)}' has no file header naming its cipher")
+    if header.cipher not in CIPHERS:
+        raise ValueError(f"'{os.path.basename(input_path)}' was encrypted with unsupported "
+                         f"cipher '{header.cipher}'")
+    return header.cipher
+
+
+def collect_files(inputs):
+    """Expand files and directories into [(path, path relative to its input root)]"""
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, names in os.walk(item):
+                for name in sorted(names):
+                    path = os.path.join(root, name)
+                    files.append((path, os.path.relpath(path, item)))
+        else:
+            files.append((item, os.path.basename(item)))
+    return files
+
+
+def output_buffer_size(chunk_size=None, memory_budget=None):
+    """Write buffer of the output file (see AtomicOutput) for a run
+
+    Without a budget this is atomic_output's default. Within a budget it is
+    at most one chunk (ALIGNMENT for whole-file runs), which plan_processing
+    counts as one more chunk of the run's peak memory.
+    """
+    if memory_budget is None:
+        return DEFAULT_BUFFER_SIZE
+    size = min(chunk_size or 0, DEFAULT_BUFFER_SIZE)
+    return max(ALIGNMENT, size - size % ALIGNMENT)
+
+
+def plan_processing(input_size, memory_budget=None, chunk_size=None, chunk_factor=CHUNK_FACTOR,
+                    overhead=RUN_OVERHEAD):
+    """Decide between 'whole' and 'chunked' processing; returns (mode, chunk_size)
+
+    chunk_factor is the peak memory of chunked processing as a multiple of
+    the chunk size (larger for pipelined runs, which keep several chunks in
+    flight), not counting the write buffer. overhead is the memory the run
+    needs besides its data.
+    """
+    if memory_budget is None:
+        if chunk_size is None and input_size <= WHOLE_FILE_LIMIT:
+            return "whole", None
+        return "chunked", chunk_size or DEFAULT_CHUNK_SIZE
+
+    available = memory_budget - overhead
+    if chunk_size is None and input_size * WHOLE_FILE_FACTOR + ALIGNMENT <= available:
+        return "whole", None
+
+    # The write buffer is at most one chunk
+    chunk_factor += 1
+    max_chunk = max(available, 0) // chunk_factor
+    chunk_size = min(chunk_size or DEFAULT_CHUNK_SIZE, max_chunk)
+    chunk_size -= chunk_size % 16  # keep chunks block aligned for AES and DES
+    if chunk_size < MIN_CHUNK_SIZE:
+        raise MemoryBudgetError(
+            f"Memory budget of {format_size(memory_budget)} is too small; at least "
+            f"{format_size(MIN_CHUNK_SIZE * chunk_factor + overhead)} is required for chunked processing")
+    return "chunked", chunk_size
+
+
+def plan_file(input_size, memory_budget=None, chunk_size=None, pipelined=True, compression=None,
+              authenticated=False, header=None):
+    """How encrypt_path / decrypt_path will process a file of input_size bytes
+
+    Returns (mode, chunk_size, estimated peak memory); mode is 'whole',
+    'chunked' or 'pipelined'. header is the header of a file to decrypt.
+    The estimate includes the write buffer of output_buffer_size().
+    """
+    if compression or authenticated or (header is not None and header.mode != "CBC"):
+        # Compressed and authenticated files are always streamed
+        chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+
+    # Leave room for the compressor's own working memory
+    overhead = RUN_OVERHEAD + (MEMORY_OVERHEAD[compression] if compression else 0)
+    if memory_budget is not None and compression and memory_budget <= overhead:
+        raise MemoryBudgetError(
+            f"Memory budget of {format_size(memory_budget)} is too small for {compression} "
+            f"compression, which needs about {format_size(overhead)}")
+    # Transforms without update_into(): compression chains and HMAC decryption
+    pieces = bool(compression) or (header is not None and header.mode == "CBC-HMAC")
+    if pipelined:
+        chunk_factor = PipelineExecutor.memory_factor(pieces=pieces)
+    else:
+        chunk_factor = PIECES_CHUNK_FACTOR if pieces else CHUNK_FACTOR
+    mode, chunk_size = plan_processing(input_size, memory_budget, chunk_size, chunk_factor, overhead)
+    # The write buffer fills up to the output's size (the input's, plus a
+    # header, IV and padding or tag)
+    buffered = min(output_buffer_size(chunk_size, memory_budget), input_size + ALIGNMENT)
+    if mode == "whole":
+        return mode, chunk_size, input_size * WHOLE_FILE_FACTOR + buffered + overhead
+    if pipelined:
+        # The pipeline's buffers are allocated whole, however short the input
+        return "pipelined", chunk_size, chunk_size * chunk_factor + buffered + overhead
+    return mode, chunk_size, min(chunk_size, input_size) * chunk_factor + buffered + overhead
+
+
+def check_text_budget(input_size, memory_budget):
+    """Fail early if a whole-file Playfair run would exceed the budget"""
+    if memory_budget is None:
+        return
+    needed = input_size * TEXT_FACTOR + output_buffer_size(None, memory_budget)
+    if needed > memory_budget:
+        raise MemoryBudgetError(
+            f"Input of {format_size(input_size)} needs about {format_size(needed)} for a "
+            f"classical cipher run, which exceeds the {format_size(memory_budget)} budget")
+
+
+def process_text_file(cipher, operation, input_path, output_path, memory_budget=None,
+                      fsync=DEFAULT_FSYNC, sync_batch=None, index_interval=None):
+    """Run a Vigenère or Playfair cipher over an ASCII file; returns (bytes_in, bytes_out)
+
+    The input is memory-mapped and never decoded into a str. Vigenère output
+    has the input's length and is written straight into a memory-mapped
+    output file; Playfair output, whose length differs, is built in memory
+    within memory_budget. The output replaces output_path atomically (which
+    may be the input itself) as for encrypt_path.
+
+    With index_interval, a Vigenère run also writes the output's letter-count
+    index (see vigenere_index) in the same pass.
+    """
+    input_size = os.path.getsize(input_path)
+    transform = cipher.encrypt_bytes if operation == "encrypt" else cipher.decrypt_bytes
+    if index_interval is not None:
+        if not cipher.preserves_length:
+            raise ValueError("Only Vigenère files can be indexed")
+        if fsync == FSYNC_BATCH:
+            raise ValueError("An indexed output must be in place when it is indexed; "
+                             "use the 'file' or 'never' fsync policy")
+    if not cipher.preserves_length:
+        check_text_budget(input_size, memory_budget)
+        with open(input_path, 'rb') as src:
+            if input_size:  # zero-length files cannot be mapped
+                with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    result = transform(data)
+            else:
+                result = transform(b'')
+        with AtomicOutput(output_path, fsync, len(result), output_buffer_size(None, memory_budget),
+                          sync_batch) as dst:
+            dst.write(result)
+        return input_size, len(result)
+
+    builder = None
+    if index_interval is not None:
+        from vigenere_index import IndexBuilder, index_path
+        builder = IndexBuilder(index_interval)
+    with AtomicOutput(output_path, fsync, sync_batch=sync_batch) as dst:
+        dst.truncate(input_size)
+        if input_size:
+            with open(input_path, 'rb') as src, \
+                    mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as data, \
+                    mmap.mmap(dst.fileno(), input_size) as out:
+                if builder is None:
+                    transform(data, out=out)
+                else:
+                    _transform_indexed(transform, data, out, builder)
+    if builder is not None:
+        builder.finish(output_path).write(index_path(output_path), fsync)
+    return input_size, input_size
+
+
+def _transform_indexed(transform, data, out, builder):
+    """Transform data into out one index interval at a time, counting its letters"""
+    with memoryview(data) as src, memoryview(out) as dst:
+        for start in range(0, len(src), builder.interval):
+            piece = src[start:start + builder.interval]
+            transform(piece, out=dst[start:start + len(piece)], key_offset=builder.letters)
+            builder.update(piece)
+            piece.release()
+
+
+class _MemoryTracker:
+    """Track peak Python heap usage of an operation with tracemalloc"""
+    def __init__(self, memory_budget=None):
+        self.memory_budget = memory_budget
+        self._owns_tracing = not tracemalloc.is_tracing()
+        if self._owns_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._baseline = tracemalloc.get_traced_memory()[0]
+
+    def check(self):
+        """Abort the operation if its peak so far has exceeded the budget
+
+        The peak, not the current usage, is compared, so an overrun between
+        two checks is still caught.
+        """
+        if self.memory_budget is None:
+            return
+        peak = tracemalloc.get_traced_memory()[1] - self._baseline
+        if peak > self.memory_budget:
+            raise MemoryBudgetError(
+                f"Memory budget of {format_size(self.memory_budget)} exceeded "
+                f"(peak {format_size(peak)})")
+
+    def stop(self):
+        """Stop tracking and return the peak usage above the baseline"""
+        peak = max(0, tracemalloc.get_traced_memory()[1] - self._baseline)
+        if self._owns_tracing:
+            tracemalloc.stop()
+        return peak
+
+
+def encrypt_path(cipher, input_path, output_path, memory_budget=None, chunk_size=None,
+                 track_memory=True, pipelined=True, compression=None, authenticated=False,
+                 hash_streams=False, fsync=DEFAULT_FSYNC, sync_batch=None, input_hasher=None):
+    """Encrypt input_path into output_path with a file cipher (see CIPHERS)
+
+    compression ('zlib', 'bz2' or 'lzma') compresses the data before
+    encryption. authenticated=True appends an authentication tag computed in
+    the same pass (AES-GCM for AES, encrypt-then-HMAC-SHA256 for DES);
+    ChaCha20 files are always authenticated. Both are recorded in a file
+    header. hash_streams=True also computes the
+    SHA-256 of the input and output files as they are read and written (see
+    OperationReport.input_sha256 / output_sha256). input_hasher, a hashlib
+    object, is updated with every input byte in the same pass.
+
+    The output is written to a temporary file and renamed to output_path on
+    success; fsync selects the durability policy and sync_batch collects
+    the files of the 'batch' policy (see atomic_output).
+    """
+    if compression and compression not in COMPRESSION_METHODS:
+        raise ValueError(f"Unknown compression method '{compression}'. "
+                         f"Choose from: {', '.join(COMPRESSION_METHODS)}")
+    authenticated = authenticated or cipher.authenticated_only
+    return _run(cipher, "encrypt", input_path, output_path, memory_budget, chunk_size,
+                track_memory, pipelined, compression=compression, authenticated=authenticated,
+                hash_streams=hash_streams, fsync=fsync, sync_batch=sync_batch,
+                input_hasher=input_hasher)
+
+
+def decrypt_path(cipher, input_path, output_path, memory_budget=None, chunk_size=None,
+                 track_memory=True, pipelined=True, require_authentication=False,
+                 hash_streams=False, fsync=DEFAULT_FSYNC, sync_batch=None, input_hasher=None):
+    """Decrypt input_path into output_path with a file cipher (see CIPHERS)
+
+    Compressed files are decompressed and authenticated files verified
+    transparently based on their header. With require_authentication=True,
+    only verified plaintext is ever released: files without an
+    authentication tag are rejected, and since the output only replaces
+    output_path once the whole file has been read, that happens after the
+    tag checks out. hash_streams, fsync, sync_batch and input_hasher work
+    as for encrypt_path.
+    """
+    header = peek_header(input_path)
+    if require_authentication and (header is None or header.mode != cipher.auth_mode):
+        raise ValueError(f"'{os.path.basename(input_path)}' is not an authenticated "
+                         f"{cipher.name} file; refusing to release unverified plaintext")
+    return _run(cipher, "decrypt", input_path, output_path, memory_budget, chunk_size,
+                track_memory, pipelined, header=header,
+                hash_streams=hash_streams, fsync=fsync, sync_batch=sync_batch,
+                input_hasher=input_hasher)
+
+
+def file_header(cipher, mode="CBC", compression=None, original_size=None, chunk_size=None):
+    """Serialized FileHeader for a file encrypted with cipher"""
+    return FileHeader(cipher.name, mode, compression, key_fingerprint=cipher.fingerprint(),
+                      original_size=original_size, chunk_size=chunk_size).to_bytes()
+
+
+def open_encryptor(cipher, compression=None, authenticated=False, original_size=None,
+                   chunk_size=None):
+    """Build the encryption transform for a file; returns (prefix, transform)
+
+    prefix (header and IV/nonce) must be written before the transform output.
+    The header records the cipher, mode, compression and key fingerprint,
+    plus original_size (the plaintext length) and chunk_size when given.
+    Headerless IV||ciphertext files are legacy; they are read but no longer
+    written.
+    """
+    if authenticated or cipher.authenticated_only:
+        header = file_header(cipher, cipher.auth_mode, compression, original_size, chunk_size)
+        encryptor = cipher.auth_encryptor(aad=header)
+        prefix = header + encryptor.nonce
+    else:
+        encryptor = cipher.encryptor()
+        prefix = file_header(cipher, "CBC", compression, original_size, chunk_size) + encryptor.iv
+    if compression:
+        return prefix, TransformChain([Compressor(compression), encryptor])
+    return prefix, encryptor
+
+
+def open_decryptor(cipher, src, max_length=DEFAULT_CHUNK_SIZE):
+    """Read the header and IV/nonce from src and build the decryption transform
+
+    Decompression output comes in pieces of at most max_length bytes.
+
+    Returns (header, transform); header is None for legacy IV||ciphertext
+    files (or headerless nonce||ciphertext||tag, for authenticated-only
+    ciphers). src is left positioned at the start of the ciphertext.
+    """
+    header = read_header(src)
+    if header is None:
+        iv_size = cipher.auth_nonce_size if cipher.authenticated_only else cipher.block_size
+        iv = src.read(iv_size)
+        if len(iv) != iv_size:
+            raise ValueError("Input is too short to contain an IV")
+        return None, cipher.auth_decryptor(iv) if cipher.authenticated_only else cipher.decryptor(iv)
+    check_header(cipher, header)
+    if header.mode == "CBC" and not cipher.authenticated_only:
+        nonce_size = cipher.block_size
+    elif header.mode == cipher.auth_mode:
+        nonce_size = cipher.auth_nonce_size
+    else:
+        raise ValueError(f"Unsupported cipher mode '{header.mode}'")
+    nonce = src.read(nonce_size)
+    if len(nonce) != nonce_size:
+        raise ValueError("Input is too short to contain an IV")
+    if header.mode == "CBC":
+        transform = cipher.decryptor(nonce)
+    else:
+        # The header is authenticated along with the ciphertext
+        transform = cipher.auth_decryptor(nonce, aad=header.raw)
+    if header.compression:
+        transform = TransformChain([transform, Decompressor(header.compression, max_length)])
+    return header, transform
+
+
+def check_header(cipher, header):
+    """Reject a file whose header names another cipher or key, before reading its payload"""
+    if header.cipher != cipher.name:
+        raise ValueError(f"File was encrypted with {header.cipher}, not {cipher.name}")
+    if header.key_fingerprint and header.key_fingerprint not in (cipher.fingerprint(),
+                                                                 cipher.legacy_fingerprint()):
+        raise ValueError(f"File was encrypted with a different key (fingerprint "
+                         f"{header.key_fingerprint}, this key is {cipher.fingerprint()})")
+
+
+def _check_original_size(header, size):
+    if header is not None and header.original_size is not None and size != header.original_size:
+        raise ValueError(f"Decrypted {size} bytes but the header records {header.original_size}; "
+                         f"the file is truncated or corrupted")
+
+
+def _encrypt_stream(cipher, src, dst, chunk_size, on_chunk, executor, compression, authenticated,
+                    original_size=None):
+    """Encrypt src into dst, optionally compressing first; returns (bytes_in, bytes_out)"""
+    prefix, transform = open_encryptor(cipher, compression, authenticated, original_size, chunk_size)
+    dst.write(prefix)
+    bytes_in, bytes_out = run_transform(transform, src, dst, chunk_size, on_chunk, executor)
+    if original_size is not None and bytes_in != original_size:
+        raise ValueError("Input changed size while it was being encrypted")
+    return bytes_in, bytes_out + len(prefix)
+
+
+def _decrypt_stream(cipher, src, dst, chunk_size, on_chunk, executor):
+    """Decrypt src into dst, honouring its header if present; returns (bytes_in, bytes_out)"""
+    header, transform = open_decryptor(cipher, src, chunk_size)
+    prefix_len = src.tell()
+    try:
+        bytes_in, bytes_out = run_transform(transform, src, dst, chunk_size, on_chunk, executor)
+    except (ValueError, OSError, zlib.error, lzma.LZMAError) as e:
+        if header is None or header.mode == "CBC":
+            raise
+        # Tampering may surface as a decompression error before the tag is
+        # reached; report it as what it is
+        raise ValueError(f"Authentication failed, the file is corrupted or was modified ({e})") from e
+    _check_original_size(header, bytes_out)
+    return bytes_in + prefix_len, bytes_out
+
+
+class _HashingReader:
+    """Binary reader that hashes each byte of the file once, as it is first read
+
+    Callers may seek back (read_header rewinds headerless files); bytes that
+    were already hashed are not hashed again. Every hashlib object in hashes
+    is updated.
+    """
+    def __init__(self, f, hashes):
+        self._f = f
+        self._pos = f.tell()
+        self._hashed = self._pos
+        self.hashes = hashes
+
+    def _feed(self, data):
+        end = self._pos + len(data)
+        if end > self._hashed:
+            for h in self.hashes:
+                h.update(data[self._hashed - self._pos:])
+            self._hashed = end
+        self._pos = end
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self._feed(data)
+        return data
+
+    def readinto(self, buf):
+        n = self._f.readinto(buf)
+        self._feed(memoryview(buf)[:n])
+        return n
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self._pos = self._f.seek(offset, whence)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+class _HashingWriter:
+    """Binary writer that hashes everything written through it"""
+    def __init__(self, f):
+        self._f = f
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        self.hash.update(data)
+        return self._f.write(data)
+
+
+def _run(cipher, operation, input_path, output_path, memory_budget, chunk_size, track_memory,
+         pipelined, compression=None, authenticated=False, header=None, hash_streams=False,
+         fsync=DEFAULT_FSYNC, sync_batch=None, input_hasher=None):
+    """Run one file operation and return its OperationReport
+
+    The output is written through an AtomicOutput, so output_path is only
+    replaced once the operation has succeeded. With track_memory, a run
+    whose peak memory goes over memory_budget fails with MemoryBudgetError.
+    """
+    input_size = os.path.getsize(input_path)
+    if header is not None:
+        compression = header.compression
+    mode, chunk_size, _ = plan_file(input_size, memory_budget, chunk_size, pipelined, compression,
+                                    authenticated, header)
+    buffer_size = output_buffer_size(chunk_size, memory_budget)
+    # Overlap disk reads and writes with the cipher work
+    executor = PipelineExecutor(chunk_size) if mode == "pipelined" else None
+    report = OperationReport(operation, mode, chunk_size, memory_budget)
+
+    tracker = _MemoryTracker(memory_budget) if track_memory else None
+    check = tracker.check if tracker is not None else None
+    start = time.perf_counter()
+    try:
+        if mode == "whole":
+            with open(input_path, 'rb') as f:
+                data = f.read()
+            if input_hasher is not None:
+                input_hasher.update(data)
+            prefix = b''
+            if operation == "encrypt":
+                prefix = file_header(cipher, original_size=len(data))
+                result = cipher.encrypt_file(data)
+            elif header is not None:
+                check_header(cipher, header)
+                result = cipher.decrypt_file(memoryview(data)[len(header.raw):])
+                _check_original_size(header, len(result))
+            else:
+                result = cipher.decrypt_file(data)
+            with AtomicOutput(output_path, fsync, len(prefix) + len(result),
+                              buffer_size, sync_batch) as dst:
+                dst.write(prefix)
+                dst.write(result)
+                if check is not None:
+                    check()
+            report.bytes_in, report.bytes_out = len(data), len(prefix) + len(result)
+            if hash_streams:
+                report.input_sha256 = hashlib.sha256(data).hexdigest()
+                output_hash = hashlib.sha256(prefix)
+                output_hash.update(result)
+                report.output_sha256 = output_hash.hexdigest()
+        else:
+            # Reserve the output's space up front when its size is known:
+            # uncompressed ciphertext is at least as long as the input, and
+            # a header's original size bounds the plaintext
+            expected_size = None
+            if operation == "encrypt" and not compression:
+                expected_size = input_size
+            elif (operation == "decrypt" and header is not None and not compression
+                  and header.original_size is not None and header.original_size <= input_size):
+                expected_size = header.original_size
+            with open(input_path, 'rb') as src, \
+                    AtomicOutput(output_path, fsync, expected_size, buffer_size, sync_batch) as dst:
+                # Hash in the same pass; with the pipeline this runs on its
+                # reader and writer threads
+                input_hashes = [hashlib.sha256()] if hash_streams else []
+                if input_hasher is not None:
+                    input_hashes.append(input_hasher)
+                if input_hashes:
+                    src = _HashingReader(src, input_hashes)
+                if hash_streams:
+                    dst = _HashingWriter(dst)
+                if operation == "encrypt":
+                    counts = _encrypt_stream(cipher, src, dst, chunk_size, check, executor,
+                                             compression, authenticated, input_size)
+                else:
+                    counts = _decrypt_stream(cipher, src, dst, chunk_size, check, executor)
+                report.bytes_in, report.bytes_out = counts
+                if check is not None:
+                    # Covers the end of the run, after the last chunk's check
+                    check()
+                if hash_streams:
+                    report.input_sha256 = input_hashes[0].hexdigest()
+                    report.output_sha256 = dst.hash.hexdigest()
+    finally:
+        report.elapsed = time.perf_counter() - start
+        if tracker is not None:
+            report.peak_memory = tracker.stop()
+    return report
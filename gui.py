@@ -6,6 +6,7 @@ Professional interface for AES, DES, Playfair, and Vigenère ciphers
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
+from file_ops import encrypt_path, decrypt_path, memory_budget_from_env, process_text_file
 from aes_cipher import AESCipher
 from des_cipher import DESCipher
 from playfair_cipher import PlayfairCipher
@@ -56,6 +57,8 @@ class CryptographyApp:
         self.output_file_path = tk.StringVar()
         self.cipher_type = tk.StringVar(value="AES")
         self.operation_type = tk.StringVar(value="encrypt")
+        self.compression_type = tk.StringVar(value="none")
+        self.authenticated = tk.BooleanVar(value=False)
         self.theme_mode = tk.StringVar(value="dark")
         
         # Configure style
@@ -146,6 +149,15 @@ class CryptographyApp:
                  background=[("active", bg_main)],
                  foreground=[("active", accent_color)])
         
+        # Checkbutton styles
+        style.configure("TCheckbutton", font=("Segoe UI", 10),
+                       background=bg_main, foreground=fg_primary,
+                       indicatorbackground=bg_input,
+                       indicatorforeground=accent_color)
+        style.map("TCheckbutton",
+                 background=[("active", bg_main)],
+                 foreground=[("active", accent_color)])
+        
         # Store colors for later use
         self.current_colors = {
             'log_bg': log_bg,
@@ -226,6 +238,28 @@ class CryptographyApp:
         ttk.Radiobutton(frame, text="🔓 Decrypt", variable=self.operation_type, 
                        value="decrypt").grid(row=0, column=1, padx=20, pady=5)
         
+        # Compression (AES/DES encryption only; decryption reads it from the file header)
+        self.compression_label = ttk.Label(frame, text="Compression: ⓘ", style="Header.TLabel")
+        self.compression_label.grid(row=0, column=2, padx=(40, 5), pady=5)
+        ToolTip(self.compression_label, "Compress data before AES/DES encryption.\n" +
+                                        "zlib: fast, good for text and logs\n" +
+                                        "bz2/lzma: smaller output, much slower\n" +
+                                        "Decryption detects it automatically")
+        
+        self.compression_combo = ttk.Combobox(frame, textvariable=self.compression_type,
+                                              values=["none", "zlib", "bz2", "lzma"],
+                                              state="readonly", width=8)
+        self.compression_combo.grid(row=0, column=3, pady=5)
+        
+        # Authentication (encrypt: add a tag; decrypt: only release verified plaintext)
+        self.auth_check = ttk.Checkbutton(frame, text="🛡 Authenticated",
+                                          variable=self.authenticated)
+        self.auth_check.grid(row=0, column=4, padx=(20, 5), pady=5)
+        ToolTip(self.auth_check, "Encrypt: append an authentication tag\n" +
+                                 "(AES-GCM, or HMAC-SHA256 for DES).\n" +
+                                 "Decrypt: refuse files without a valid tag;\n" +
+                                 "tags are always checked when present.")
+        
     def create_file_inputs(self, parent, row):
         """Create file input section"""
         frame = ttk.LabelFrame(parent, text="File Configuration", padding="15")
@@ -240,6 +274,7 @@ class CryptographyApp:
         ToolTip(self.key_label, "Text file containing encryption key.\n" +
                                 "AES: 16, 24, or 32 bytes\n" +
                                 "DES: Exactly 8 bytes\n" +
+                                "AES/DES: or 'passphrase:' and 'salt:' lines\n" +
                                 "Vigenère: Any alphabetic key")
         
         self.key_entry = ttk.Entry(frame, textvariable=self.key_file_path, state="readonly")
@@ -253,7 +288,8 @@ class CryptographyApp:
         # Table file (for classical ciphers)
         self.table_label = ttk.Label(frame, text="Table File: ⓘ", style="Header.TLabel")
         self.table_label.grid(row=current_row, column=0, sticky=tk.W, pady=5)
-        ToolTip(self.table_label, "Text file containing cipher table.\n" +
+        ToolTip(self.table_label, "Text file containing cipher table,\n" +
+                                  "or a table compiled by table_artifact.py.\n" +
                                   "Playfair: 5x5 matrix (25 chars, no J)\n" +
                                   "Vigenère: 26x26 table (676 chars)")
         
@@ -381,6 +417,16 @@ class CryptographyApp:
         """Handle cipher type change by showing/hiding relevant file choosers"""
         cipher = self.cipher_type.get()
         
+        # Compression and authentication only apply to the modern ciphers
+        if cipher in ["AES", "DES"]:
+            self.compression_label.grid()
+            self.compression_combo.grid()
+            self.auth_check.grid()
+        else:
+            self.compression_label.grid_remove()
+            self.compression_combo.grid_remove()
+            self.auth_check.grid_remove()
+        
         # AES and DES: Show key, hide table
         if cipher in ["AES", "DES"]:
             self.show_key_row()
@@ -416,7 +462,7 @@ class CryptographyApp:
         """Browse for table file"""
         filename = filedialog.askopenfilename(
             title="Select Table File",
-            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+            filetypes=[("Table files", "*.txt *.ctab"), ("All files", "*.*")]
         )
         if filename:
             self.table_file_path.set(filename)
@@ -499,86 +545,62 @@ class CryptographyApp:
         if not self.key_file_path.get():
             raise ValueError("Please select a key file")
             
-        # Read key
-        with open(self.key_file_path.get(), 'r', encoding='ascii') as f:
-            key = f.read().strip()
-        
-        key_bytes = key.encode('ascii')
-        if len(key_bytes) not in [16, 24, 32]:
-            raise ValueError(f"AES key must be 16, 24, or 32 bytes. Current: {len(key_bytes)} bytes")
-        
-        # Read input file
-        with open(self.input_file_path.get(), 'rb') as f:
-            data = f.read()
-        
-        aes = AESCipher(key_bytes)
+        # Raw key, or passphrase and salt (derived keys are cached by key_provider)
+        aes = AESCipher.from_key_file(self.key_file_path.get())
+        memory_budget = memory_budget_from_env()
         
+        # Process input -> output (chunked when over the memory budget)
         if self.operation_type.get() == "encrypt":
-            result = aes.encrypt_file(data)
-            self.log(f"Encrypted {len(data)} bytes -> {len(result)} bytes")
+            compression = self.compression_type.get()
+            report = encrypt_path(aes, self.input_file_path.get(), self.output_file_path.get(),
+                                  memory_budget=memory_budget,
+                                  compression=None if compression == "none" else compression,
+                                  authenticated=self.authenticated.get())
+            self.log(f"Encrypted {report.bytes_in} bytes -> {report.bytes_out} bytes")
         else:
-            result = aes.decrypt_file(data)
-            self.log(f"Decrypted {len(data)} bytes -> {len(result)} bytes")
-        
-        # Write output
-        with open(self.output_file_path.get(), 'wb') as f:
-            f.write(result)
+            report = decrypt_path(aes, self.input_file_path.get(), self.output_file_path.get(),
+                                  memory_budget=memory_budget,
+                                  require_authentication=self.authenticated.get())
+            self.log(f"Decrypted {report.bytes_in} bytes -> {report.bytes_out} bytes")
+        self.log(report.summary())
             
     def execute_des(self):
         """Execute DES encryption/decryption"""
         if not self.key_file_path.get():
             raise ValueError("Please select a key file")
             
-        # Read key
-        with open(self.key_file_path.get(), 'r', encoding='ascii') as f:
-            key = f.read().strip()
-        
-        key_bytes = key.encode('ascii')
-        if len(key_bytes) != 8:
-            raise ValueError(f"DES key must be exactly 8 bytes. Current: {len(key_bytes)} bytes")
-        
-        # Read input file
-        with open(self.input_file_path.get(), 'rb') as f:
-            data = f.read()
-        
-        des = DESCipher(key_bytes)
+        # Raw key, or passphrase and salt (derived keys are cached by key_provider)
+        des = DESCipher.from_key_file(self.key_file_path.get())
+        memory_budget = memory_budget_from_env()
         
+        # Process input -> output (chunked when over the memory budget)
         if self.operation_type.get() == "encrypt":
-            result = des.encrypt_file(data)
-            self.log(f"Encrypted {len(data)} bytes -> {len(result)} bytes")
+            compression = self.compression_type.get()
+            report = encrypt_path(des, self.input_file_path.get(), self.output_file_path.get(),
+                                  memory_budget=memory_budget,
+                                  compression=None if compression == "none" else compression,
+                                  authenticated=self.authenticated.get())
+            self.log(f"Encrypted {report.bytes_in} bytes -> {report.bytes_out} bytes")
         else:
-            result = des.decrypt_file(data)
-            self.log(f"Decrypted {len(data)} bytes -> {len(result)} bytes")
-        
-        # Write output
-        with open(self.output_file_path.get(), 'wb') as f:
-            f.write(result)
+            report = decrypt_path(des, self.input_file_path.get(), self.output_file_path.get(),
+                                  memory_budget=memory_budget,
+                                  require_authentication=self.authenticated.get())
+            self.log(f"Decrypted {report.bytes_in} bytes -> {report.bytes_out} bytes")
+        self.log(report.summary())
             
     def execute_playfair(self):
         """Execute Playfair encryption/decryption"""
         if not self.table_file_path.get():
             raise ValueError("Please select a table file")
             
-        # Read table
-        with open(self.table_file_path.get(), 'r', encoding='ascii') as f:
-            table_content = f.read().strip()
-        
-        # Read input
-        with open(self.input_file_path.get(), 'r', encoding='ascii') as f:
-            message = f.read()
-        
-        playfair = PlayfairCipher.from_matrix(table_content)
-        
-        if self.operation_type.get() == "encrypt":
-            result = playfair.encrypt(message)
-            self.log(f"Encrypted {len(message)} characters -> {len(result)} characters")
-        else:
-            result = playfair.decrypt(message)
-            self.log(f"Decrypted {len(message)} characters -> {len(result)} characters")
+        # Load table (text or compiled artifact); validates it before any work
+        playfair = PlayfairCipher.from_matrix_file(self.table_file_path.get())
         
-        # Write output
-        with open(self.output_file_path.get(), 'w', encoding='ascii') as f:
-            f.write(result)
+        # ASCII bytes straight from a memory map; never decoded into a str
+        operation = self.operation_type.get()
+        size_in, size_out = process_text_file(playfair, operation, self.input_file_path.get(),
+                                              self.output_file_path.get(), memory_budget_from_env())
+        self.log(f"{operation.capitalize()}ed {size_in} characters -> {size_out} characters")
             
     def execute_vigenere(self):
         """Execute Vigenère encryption/decryption"""
@@ -587,30 +609,18 @@ class CryptographyApp:
         if not self.key_file_path.get():
             raise ValueError("Please select a key file")
             
-        # Read table
-        with open(self.table_file_path.get(), 'r', encoding='ascii') as f:
-            table_content = f.read().strip()
-        
         # Read key
         with open(self.key_file_path.get(), 'r', encoding='ascii') as f:
             key = f.read().strip()
         
-        # Read input
-        with open(self.input_file_path.get(), 'r', encoding='ascii') as f:
-            message = f.read()
-        
-        vigenere = VigenereCipher.from_table(key, table_content)
+        # Load table (text or compiled artifact); validates it before any work
+        vigenere = VigenereCipher.from_table_file(key, self.table_file_path.get())
         
-        if self.operation_type.get() == "encrypt":
-            result = vigenere.encrypt(message)
-            self.log(f"Encrypted {len(message)} characters -> {len(result)} characters")
-        else:
-            result = vigenere.decrypt(message)
-            self.log(f"Decrypted {len(message)} characters -> {len(result)} characters")
-        
-        # Write output
-        with open(self.output_file_path.get(), 'w', encoding='ascii') as f:
-            f.write(result)
+        # ASCII bytes straight from a memory map; never decoded into a str
+        operation = self.operation_type.get()
+        size_in, size_out = process_text_file(vigenere, operation, self.input_file_path.get(),
+                                              self.output_file_path.get(), memory_budget_from_env())
+        self.log(f"{operation.capitalize()}ed {size_in} characters -> {size_out} characters")
 
 
 def main():
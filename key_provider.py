@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Key Provider
+Loads AES/DES keys from key files, which hold either the raw ASCII key or a
+passphrase and salt:
+
+    passphrase: correct horse battery staple
+    salt: 3f1c9a0e5b7d2c4e8a6f1b3d5c7e9a0b
+    kdf: scrypt            (optional; scrypt or pbkdf2)
+
+Passphrase keys are derived with a deliberately slow KDF, so derived keys are
+cached in memory (bounded LRU with a time-to-live) and a batch pays for the
+derivation once per key file rather than once per file. The cache is wiped
+when the process exits. The batch runner, the GUI, the CLI and the service
+all share the process-wide PROVIDER.
+
+    python key_provider.py create my_key.txt     # prompts for the passphrase
+"""
+
+import argparse
+import atexit
+import getpass
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+PASSPHRASE_FIELD = 'passphrase'
+SALT_FIELD = 'salt'
+KDF_FIELD = 'kdf'
+DEFAULT_KDF = 'scrypt'
+SALT_SIZE = 16
+MIN_SALT_SIZE = 8
+
+SCRYPT_N = 2 ** 15
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_MAXMEM = 64 * 1024 * 1024
+PBKDF2_ITERATIONS = 600000
+
+# Key fingerprints: scrypt cost, and the length in hex digits
+FINGERPRINT_SCRYPT_N = 2 ** 14
+FINGERPRINT_LENGTH = 16
+
+DEFAULT_TTL = 15 * 60.0
+DEFAULT_MAX_ENTRIES = 32
+
+
+def derive_key(passphrase, salt, key_size, kdf=DEFAULT_KDF):
+    """Derive key_size bytes from a passphrase (uncached)
+
+    The key size is mixed into the salt, so AES and DES keys derived from the
+    same key file are unrelated (scrypt and PBKDF2 outputs of different
+    lengths otherwise share a prefix).
+    """
+    secret = passphrase.encode('utf-8')
+    salt = salt + key_size.to_bytes(2, 'big')
+    if kdf == 'scrypt':
+        return hashlib.scrypt(secret, salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P,
+                              maxmem=SCRYPT_MAXMEM, dklen=key_size)
+    if kdf == 'pbkdf2':
+        return hashlib.pbkdf2_hmac('sha256', secret, salt, PBKDF2_ITERATIONS, dklen=key_size)
+    raise ValueError(f"Unknown KDF '{kdf}'. Choose from: scrypt, pbkdf2")
+
+
+def key_fingerprint(cipher_name, key):
+    """Short identifier of a key, stored in file headers and envelope slots
+
+    Derived with scrypt rather than a plain hash, so a stored fingerprint
+    is expensive to test key guesses against. It still identifies the key:
+    it does not make a weak key safe.
+    """
+    salt = b'cryptography-project key fingerprint\x00' + cipher_name.encode('ascii')
+    return hashlib.scrypt(key, salt=salt, n=FINGERPRINT_SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P,
+                          maxmem=SCRYPT_MAXMEM, dklen=FINGERPRINT_LENGTH // 2).hex()
+
+
+def legacy_fingerprint(cipher_name, key):
+    """The unsalted SHA-256 fingerprint of earlier versions; only used to recognise their files"""
+    return hashlib.sha256(cipher_name.encode('ascii') + b' key fingerprint\x00'
+                          + key).hexdigest()[:FINGERPRINT_LENGTH]
+
+
+def parse_key_file(content):
+    """Parse key file content; returns the fields of a passphrase file, or None for a raw key"""
+    fields = {}
+    for line in content.splitlines():
+        name, sep, value = line.partition(':')
+        name = name.strip().lower()
+        if sep and name in (PASSPHRASE_FIELD, SALT_FIELD, KDF_FIELD):
+            fields[name] = value.strip()
+    if PASSPHRASE_FIELD not in fields:
+        return None
+    if not fields[PASSPHRASE_FIELD]:
+        raise ValueError("Key file has an empty passphrase")
+    try:
+        salt = bytes.fromhex(fields.get(SALT_FIELD, ''))
+    except ValueError:
+        raise ValueError("Key file salt must be hexadecimal") from None
+    if len(salt) < MIN_SALT_SIZE:
+        raise ValueError(f"Key file needs a salt of at least {MIN_SALT_SIZE} bytes (hex)")
+    fields[SALT_FIELD] = salt
+    fields.setdefault(KDF_FIELD, DEFAULT_KDF)
+    fields[KDF_FIELD] = fields[KDF_FIELD].lower()
+    return fields
+
+
+class KeyProvider:
+    """Reads key files and caches passphrase-derived keys
+
+    Entries expire ttl seconds after derivation (ttl=0 disables the cache);
+    the least recently used entry is dropped beyond max_entries. Cache
+    entries are indexed by a keyed hash, never by the passphrase itself.
+    """
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # digest -> (expires, bytearray key)
+        self._index_key = os.urandom(32)
+        self._lock = threading.Lock()
+
+    def load_key(self, path, key_size):
+        """Key bytes from a key file; passphrase files derive key_size bytes"""
+        with open(path, 'r', encoding='ascii') as f:
+            content = f.read()
+        fields = parse_key_file(content)
+        if fields is None:
+            return content.strip().encode('ascii')
+        return self.derive(fields[PASSPHRASE_FIELD], fields[SALT_FIELD], key_size, fields[KDF_FIELD])
+
+    def derive(self, passphrase, salt, key_size, kdf=DEFAULT_KDF):
+        """derive_key, served from the cache when possible"""
+        digest = hashlib.blake2b(b'\x00'.join([kdf.encode('ascii'), salt, str(key_size).encode('ascii'),
+                                               passphrase.encode('utf-8')]),
+                                 key=self._index_key).digest()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return bytes(entry[1])
+                self._drop(digest)
+            self.misses += 1
+        key = derive_key(passphrase, salt, key_size, kdf)
+        if self.ttl > 0 and self.max_entries > 0:
+            with self._lock:
+                if digest in self._entries:
+                    self._drop(digest)
+                self._entries[digest] = (time.monotonic() + self.ttl, bytearray(key))
+                while len(self._entries) > self.max_entries:
+                    self._drop(next(iter(self._entries)))
+        return key
+
+    def _drop(self, digest):
+        _, key = self._entries.pop(digest)
+        key[:] = bytes(len(key))
+
+    def clear(self):
+        """Overwrite and forget all cached keys"""
+        with self._lock:
+            for digest in list(self._entries):
+                self._drop(digest)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Process-wide provider shared by the batch runner, the GUI, the CLI and the service
+PROVIDER = KeyProvider()
+atexit.register(PROVIDER.clear)
+
+
+def write_passphrase_file(path, passphrase, kdf=DEFAULT_KDF):
+    """Write a passphrase key file with a fresh random salt, readable only by the owner"""
+    if kdf not in ('scrypt', 'pbkdf2'):
+        raise ValueError(f"Unknown KDF '{kdf}'. Choose from: scrypt, pbkdf2")
+    content = (f"{PASSPHRASE_FIELD}: {passphrase}\n{SALT_FIELD}: {os.urandom(SALT_SIZE).hex()}\n"
+               f"{KDF_FIELD}: {kdf}\n")
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w', encoding='ascii') as f:
+        f.write(content)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create passphrase key files for AES/DES")
+    sub = parser.add_subparsers(dest='command', required=True)
+    create = sub.add_parser('create', help="Write a new passphrase key file with a random salt")
+    create.add_argument('key_file')
+    create.add_argument('--kdf', choices=['scrypt', 'pbkdf2'], default=DEFAULT_KDF)
+    args = parser.parse_args(argv)
+
+    passphrase = getpass.getpass("Passphrase: ")
+    if not passphrase.strip():
+        print("Error: Passphrase must not be empty")
+        return 1
+    if getpass.getpass("Repeat passphrase: ") != passphrase:
+        print("Error: Passphrases do not match")
+        return 1
+    try:
+        write_passphrase_file(args.key_file, passphrase.strip(), args.kdf)
+    except (OSError, UnicodeEncodeError, ValueError) as e:
+        print(f"Error: {e}")
+        return 1
+    print(f"Key file written to '{args.key_file}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
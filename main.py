@@ -4,6 +4,8 @@ Implements AES, DES, Playfair, and Vigenère ciphers
 """
 
 import os
+import envelope
+from file_ops import encrypt_path, decrypt_path, memory_budget_from_env, process_text_file
 from aes_cipher import AESCipher
 from des_cipher import DESCipher
 from playfair_cipher import PlayfairCipher
@@ -17,17 +19,15 @@ def run_aes():
     # Read key from file
     key_file = input("Enter key file path: ")
     try:
-        with open(key_file, 'r', encoding='ascii') as f:
-            key = f.read().strip()
-        
-        # Validate key length (16, 24, or 32 bytes for AES-128, AES-192, AES-256)
-        key_bytes = key.encode('ascii')
-        if len(key_bytes) not in [16, 24, 32]:
-            print(f"Error: Key must be 16, 24, or 32 bytes (128, 192, or 256 bits). Current length: {len(key_bytes)} bytes")
-            return
+        # Raw key, or passphrase and salt (derived keys are cached by key_provider);
+        # validates the key length
+        aes = AESCipher.from_key_file(key_file)
     except FileNotFoundError:
         print(f"Error: Key file '{key_file}' not found")
         return
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
     except Exception as e:
         print(f"Error reading key file: {e}")
         return
@@ -44,32 +44,35 @@ def run_aes():
     # Get output file
     output_file = input("Enter output file path: ")
     
+    # Optional compression and authentication (decryption detects both from the file header)
+    compression = None
+    authenticated = False
+    require_authentication = False
+    if operation == "1":
+        choice = input("Compress before encrypting? (none/zlib/bz2/lzma) [none]: ").strip().lower()
+        if choice not in ("", "none"):
+            compression = choice
+        authenticated = input("Add an authentication tag (GCM)? (y/N): ").strip().lower() == "y"
+    elif operation == "2":
+        choice = input("Only release verified (authenticated) plaintext? (y/N): ")
+        require_authentication = choice.strip().lower() == "y"
+    
     try:
-        aes = AESCipher(key_bytes)
+        memory_budget = memory_budget_from_env()
         
         if operation == "1":
-            # Encrypt - read binary, write binary
-            with open(input_file, 'rb') as f:
-                data = f.read()
-            
-            encrypted = aes.encrypt_file(data)
-            
-            with open(output_file, 'wb') as f:
-                f.write(encrypted)
-            
+            # Encrypt - binary in, binary out (chunked when over the memory budget)
+            report = encrypt_path(aes, input_file, output_file, memory_budget=memory_budget,
+                                  compression=compression, authenticated=authenticated)
             print(f"File encrypted successfully to '{output_file}'")
+            print(report.summary())
         
         elif operation == "2":
-            # Decrypt - read binary, write binary
-            with open(input_file, 'rb') as f:
-                data = f.read()
-            
-            decrypted = aes.decrypt_file(data)
-            
-            with open(output_file, 'wb') as f:
-                f.write(decrypted)
-            
+            # Decrypt - binary in, binary out (chunked when over the memory budget)
+            report = decrypt_path(aes, input_file, output_file, memory_budget=memory_budget,
+                                  require_authentication=require_authentication)
             print(f"File decrypted successfully to '{output_file}'")
+            print(report.summary())
         else:
             print("Invalid operation")
     
@@ -84,17 +87,15 @@ def run_des():
     # Read key from file
     key_file = input("Enter key file path: ")
     try:
-        with open(key_file, 'r', encoding='ascii') as f:
-            key = f.read().strip()
-        
-        # Validate key length (8 bytes for DES)
-        key_bytes = key.encode('ascii')
-        if len(key_bytes) != 8:
-            print(f"Error: DES key must be exactly 8 bytes. Current length: {len(key_bytes)} bytes")
-            return
+        # Raw key, or passphrase and salt (derived keys are cached by key_provider);
+        # validates the key length
+        des = DESCipher.from_key_file(key_file)
     except FileNotFoundError:
         print(f"Error: Key file '{key_file}' not found")
         return
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
     except Exception as e:
         print(f"Error reading key file: {e}")
         return
@@ -111,32 +112,35 @@ def run_des():
     # Get output file
     output_file = input("Enter output file path: ")
     
+    # Optional compression and authentication (decryption detects both from the file header)
+    compression = None
+    authenticated = False
+    require_authentication = False
+    if operation == "1":
+        choice = input("Compress before encrypting? (none/zlib/bz2/lzma) [none]: ").strip().lower()
+        if choice not in ("", "none"):
+            compression = choice
+        authenticated = input("Add an authentication tag (HMAC-SHA256)? (y/N): ").strip().lower() == "y"
+    elif operation == "2":
+        choice = input("Only release verified (authenticated) plaintext? (y/N): ")
+        require_authentication = choice.strip().lower() == "y"
+    
     try:
-        des = DESCipher(key_bytes)
+        memory_budget = memory_budget_from_env()
         
         if operation == "1":
-            # Encrypt - read binary, write binary
-            with open(input_file, 'rb') as f:
-                data = f.read()
-            
-            encrypted = des.encrypt_file(data)
-            
-            with open(output_file, 'wb') as f:
-                f.write(encrypted)
-            
+            # Encrypt - binary in, binary out (chunked when over the memory budget)
+            report = encrypt_path(des, input_file, output_file, memory_budget=memory_budget,
+                                  compression=compression, authenticated=authenticated)
             print(f"File encrypted successfully to '{output_file}'")
+            print(report.summary())
         
         elif operation == "2":
-            # Decrypt - read binary, write binary
-            with open(input_file, 'rb') as f:
-                data = f.read()
-            
-            decrypted = des.decrypt_file(data)
-            
-            with open(output_file, 'wb') as f:
-                f.write(decrypted)
-            
+            # Decrypt - binary in, binary out (chunked when over the memory budget)
+            report = decrypt_path(des, input_file, output_file, memory_budget=memory_budget,
+                                  require_authentication=require_authentication)
             print(f"File decrypted successfully to '{output_file}'")
+            print(report.summary())
         else:
             print("Invalid operation")
     
@@ -149,10 +153,9 @@ def run_playfair():
     print("\n=== Playfair Cipher ===")
     
     # Read table/matrix from file
-    table_file = input("Enter table file path (5x5 matrix): ")
+    table_file = input("Enter table file path (5x5 matrix or compiled .ctab): ")
     try:
-        with open(table_file, 'r', encoding='ascii') as f:
-            table_content = f.read().strip()
+        playfair = PlayfairCipher.from_matrix_file(table_file)
     except FileNotFoundError:
         print(f"Error: Table file '{table_file}' not found")
         return
@@ -172,26 +175,14 @@ def run_playfair():
     # Get output file
     output_file = input("Enter output file path: ")
     
+    if operation not in ("1", "2"):
+        print("Invalid operation")
+        return
+    
     try:
-        # Read message from file (ASCII only)
-        with open(input_file, 'r', encoding='ascii') as f:
-            message = f.read()
-        
-        playfair = PlayfairCipher.from_matrix(table_content)
-        
-        if operation == "1":
-            # Encrypt
-            result = playfair.encrypt(message)
-        elif operation == "2":
-            # Decrypt
-            result = playfair.decrypt(message)
-        else:
-            print("Invalid operation")
-            return
-        
-        # Write result to file (ASCII only)
-        with open(output_file, 'w', encoding='ascii') as f:
-            f.write(result)
+        # ASCII bytes straight from a memory map; never decoded into a str
+        process_text_file(playfair, "encrypt" if operation == "1" else "decrypt",
+                          input_file, output_file, memory_budget_from_env())
         
         operation_name = "encrypted" if operation == "1" else "decrypted"
         print(f"File {operation_name} successfully to '{output_file}'")
@@ -205,16 +196,10 @@ def run_vigenere():
     print("\n=== Vigenère Cipher ===")
     
     # Read table from file
-    table_file = input("Enter table file path: ")
-    try:
-        with open(table_file, 'r', encoding='ascii') as f:
-            table_content = f.read().strip()
-    except FileNotFoundError:
+    table_file = input("Enter table file path (26x26 table or compiled .ctab): ")
+    if not os.path.exists(table_file):
         print(f"Error: Table file '{table_file}' not found")
         return
-    except Exception as e:
-        print(f"Error reading table file: {e}")
-        return
     
     # Read key from file
     key_file = input("Enter key file path: ")
@@ -228,6 +213,12 @@ def run_vigenere():
         print(f"Error reading key file: {e}")
         return
     
+    try:
+        vigenere = VigenereCipher.from_table_file(key, table_file)
+    except Exception as e:
+        print(f"Error reading table file: {e}")
+        return
+    
     # Choose operation
     operation = input("Choose operation (1-Encrypt / 2-Decrypt): ")
     
@@ -240,30 +231,70 @@ def run_vigenere():
     # Get output file
     output_file = input("Enter output file path: ")
     
+    if operation not in ("1", "2"):
+        print("Invalid operation")
+        return
+    
     try:
-        # Read message from file (ASCII only)
-        with open(input_file, 'r', encoding='ascii') as f:
-            message = f.read()
-        
-        vigenere = VigenereCipher.from_table(key, table_content)
+        # ASCII bytes straight from a memory map; never decoded into a str
+        process_text_file(vigenere, "encrypt" if operation == "1" else "decrypt",
+                          input_file, output_file, memory_budget_from_env())
         
+        operation_name = "encrypted" if operation == "1" else "decrypted"
+        print(f"File {operation_name} successfully to '{output_file}'")
+    
+    except Exception as e:
+        print(f"Error: {e}")
+
+
+def run_envelope():
+    """Run multi-recipient envelope encryption with AES key files"""
+    print("\n=== Envelope Encryption (multi-recipient AES) ===")
+    print("1. Encrypt for one or more recipients")
+    print("2. Decrypt")
+    print("3. Add recipient")
+    print("4. Remove recipient")
+    print("5. List recipients")
+    operation = input("Choose operation (1-5): ")
+    
+    try:
         if operation == "1":
-            # Encrypt
-            result = vigenere.encrypt(message)
+            key_files = input("Enter recipient key file paths (comma separated): ")
+            recipients = [AESCipher.from_key_file(p.strip()) for p in key_files.split(",") if p.strip()]
+            input_file = input("Enter input file path: ")
+            output_file = input("Enter output file path: ")
+            written = envelope.encrypt_envelope(input_file, output_file, recipients)
+            print(f"File encrypted for {len(recipients)} recipient(s) to '{output_file}' ({written} bytes)")
+        
         elif operation == "2":
-            # Decrypt
-            result = vigenere.decrypt(message)
-        else:
-            print("Invalid operation")
-            return
+            key = AESCipher.from_key_file(input("Enter your key file path: "))
+            input_file = input("Enter input file path: ")
+            output_file = input("Enter output file path: ")
+            size = envelope.decrypt_envelope(input_file, output_file, key)
+            print(f"File decrypted successfully to '{output_file}' ({size} bytes)")
         
-        # Write result to file (ASCII only)
-        with open(output_file, 'w', encoding='ascii') as f:
-            f.write(result)
+        elif operation == "3":
+            target = input("Enter envelope file path: ")
+            existing = AESCipher.from_key_file(input("Enter an existing recipient's key file path: "))
+            new = AESCipher.from_key_file(input("Enter the new recipient's key file path: "))
+            envelope.add_recipient(target, existing, new)
+            print(f"Recipient {new.fingerprint()} added")
         
-        operation_name = "encrypted" if operation == "1" else "decrypted"
-        print(f"File {operation_name} successfully to '{output_file}'")
+        elif operation == "4":
+            target = input("Enter envelope file path: ")
+            key = AESCipher.from_key_file(input("Enter the key file path of the recipient to remove: "))
+            envelope.remove_recipient(target, key)
+            print(f"Recipient {key.fingerprint()} removed")
+        
+        elif operation == "5":
+            target = input("Enter envelope file path: ")
+            for key_id in envelope.list_recipients(target):
+                print(f"  {key_id}")
+        else:
+            print("Invalid operation")
     
+    except FileNotFoundError as e:
+        print(f"Error: File '{e.filename}' not found")
     except Exception as e:
         print(f"Error: {e}")
 
@@ -275,8 +306,9 @@ def main():
     print("2. DES (Data Encryption Standard)")
     print("3. Playfair Cipher")
     print("4. Vigenère Cipher")
+    print("5. Envelope Encryption (multi-recipient AES)")
     
-    choice = input("\nSelect cipher (1-4): ")
+    choice = input("\nSelect cipher (1-5): ")
     
     if choice == "1":
         run_aes()
@@ -286,6 +318,8 @@ def main():
         run_playfair()
     elif choice == "4":
         run_vigenere()
+    elif choice == "5":
+        run_envelope()
     else:
         print("Invalid choice!")
 
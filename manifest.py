@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Hash Manifests
+Records, for every file of a batch, the input and output sizes and SHA-256
+hashes (computed while the file was processed, see file_ops hash_streams),
+the cipher, the key fingerprint and the time taken. Verification re-hashes
+the files named in a manifest, so ciphertext can be audited for integrity
+without the key and without decrypting it.
+
+    python batch.py encrypt ... --manifest run.json
+    python manifest.py verify run.json             # check the outputs
+    python manifest.py verify run.csv --inputs     # and the inputs
+
+Paths are stored relative to the manifest's directory.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from stream_cipher import DEFAULT_CHUNK_SIZE
+
+FIELDS = ('input', 'output', 'status', 'operation', 'cipher', 'key_fingerprint', 'options',
+          'input_size', 'input_sha256', 'output_size', 'output_sha256', 'seconds', 'error')
+_INT_FIELDS = ('input_size', 'output_size')
+_FLOAT_FIELDS = ('seconds',)
+
+STATUS_PROCESSED = 'processed'
+STATUS_SKIPPED = 'skipped'  # output already current (result cache); not re-hashed
+STATUS_FAILED = 'failed'
+
+
+class Manifest:
+    """Entries for one batch run; add() may be called from worker threads"""
+    def __init__(self, operation, cipher, key_fingerprint, options=''):
+        self.operation = operation
+        self.cipher = cipher
+        self.key_fingerprint = key_fingerprint
+        self.options = options
+        self.created = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+        self.entries = []
+        self._lock = threading.Lock()
+
+    def add(self, input_path, output_path, status, report=None, error=None, cipher=None):
+        """Record one file; report is the file's OperationReport when it was processed
+
+        cipher, if given, is the file cipher used for this file when it
+        differs between files (batch --cipher auto).
+        """
+        entry = dict.fromkeys(FIELDS)
+        entry.update(input=os.path.abspath(input_path), output=os.path.abspath(output_path),
+                     status=status, operation=self.operation, cipher=self.cipher,
+                     key_fingerprint=self.key_fingerprint, options=self.options, error=error)
+        if cipher is not None:
+            entry.update(cipher=cipher.name, key_fingerprint=cipher.fingerprint())
+        if report is not None:
+            entry.update(input_size=report.bytes_in, input_sha256=report.input_sha256,
+                         output_size=report.bytes_out, output_sha256=report.output_sha256,
+                         seconds=round(report.elapsed, 6))
+        with self._lock:
+            self.entries.append(entry)
+
+    def write(self, path):
+        """Write atomically; CSV for *.csv, JSON otherwise"""
+        base = os.path.dirname(os.path.abspath(path))
+        with self._lock:
+            entries = sorted(self.entries, key=lambda e: e['input'])
+        entries = [dict(e, input=_relative(e['input'], base), output=_relative(e['output'], base))
+                   for e in entries]
+        fd, tmp_path = tempfile.mkstemp(dir=base, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                if path.endswith('.csv'):
+                    writer = csv.DictWriter(f, fieldnames=FIELDS)
+                    writer.writeheader()
+                    writer.writerows(entries)
+                else:
+                    json.dump({'created': self.created, 'operation': self.operation,
+                               'cipher': self.cipher, 'key_fingerprint': self.key_fingerprint,
+                               'options': self.options, 'files': entries}, f, indent=1)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+def _relative(path, base):
+    try:
+        return os.path.relpath(path, base)
+    except ValueError:
+        return path  # different drive on Windows
+
+
+def read_manifest(path):
+    """Return the entries of a JSON or CSV manifest, with paths resolved"""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.endswith('.csv'):
+            entries = list(csv.DictReader(f))
+            for entry in entries:
+                for name in FIELDS:
+                    if entry.get(name) == '':
+                        entry[name] = None
+                for name in _INT_FIELDS:
+                    if entry.get(name) is not None:
+                        entry[name] = int(entry[name])
+                for name in _FLOAT_FIELDS:
+                    if entry.get(name) is not None:
+                        entry[name] = float(entry[name])
+        else:
+            entries = json.load(f)['files']
+    for entry in entries:
+        for name in ('input', 'output'):
+            entry[name] = os.path.join(base, entry[name])
+    return entries
+
+
+def sha256_file(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Return (size, hex SHA-256) of a file"""
+    digest = hashlib.sha256()
+    size = 0
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(path, 'rb') as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            digest.update(view[:n])
+            size += n
+    return size, digest.hexdigest()
+
+
+def verify_manifest(path, check_inputs=False, progress=None):
+    """Re-hash the files of a manifest; returns [(path, problem)] for mismatches
+
+    Only outputs are checked unless check_inputs is set. Entries that were
+    skipped or failed during the batch carry no hashes and are ignored.
+    """
+    sides = ('output', 'input') if check_inputs else ('output',)
+    problems = []
+    for entry in read_manifest(path):
+        if entry['status'] != STATUS_PROCESSED:
+            continue
+        for side in sides:
+            target = entry[side]
+            try:
+                size, digest = sha256_file(target)
+            except OSError as e:
+                problems.append((target, f"cannot read ({e.strerror or e})"))
+                continue
+            if size != entry[f'{side}_size']:
+                problems.append((target, f"size {size} != {entry[f'{side}_size']}"))
+            elif digest != entry[f'{side}_sha256']:
+                problems.append((target, "SHA-256 mismatch"))
+            elif progress is not None:
+                progress(f"OK {target}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify files against a hash manifest")
+    sub = parser.add_subparsers(dest='command', required=True)
+    verify = sub.add_parser('verify', help="Re-hash outputs (and optionally inputs) and compare")
+    verify.add_argument('manifest')
+    verify.add_argument('--inputs', action='store_true', help="Also check the input files")
+    verify.add_argument('--verbose', action='store_true', help="List files that match")
+    args = parser.parse_args(argv)
+
+    try:
+        problems = verify_manifest(args.manifest, args.inputs, print if args.verbose else None)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: cannot read manifest: {e}")
+        return 2
+    for target, problem in problems:
+        print(f"FAILED {target}: {problem}")
+    print(f"{len(problems)} problem(s) found" if problems else "All files match the manifest")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""
+Metrics for Long-Running Workloads
+Counters, gauges and latency histograms per cipher and operation, exported
+as Prometheus text or JSON snapshots.
+
+Each thread records into its own shard without taking a lock; shards are
+merged only when metrics are read, so recording costs a dictionary update
+and can stay on at full throughput. When a thread exits its shard is folded
+into a shared total, so short-lived threads do not accumulate shards.
+
+Recorded by batch.py and service.py:
+    crypto_operations_total{cipher,operation}    finished operations
+    crypto_errors_total{cipher,operation}        failed operations
+    crypto_bytes_in_total / crypto_bytes_out_total
+    crypto_operation_seconds{cipher,operation}   latency histogram
+    crypto_active_workers{cipher,operation}      operations in progress
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds in seconds; an implicit +Inf bucket follows
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0, 30.0, 60.0)
+
+_HELP = {
+    'crypto_operations_total': ('counter', "Finished encrypt/decrypt operations"),
+    'crypto_errors_total': ('counter', "Failed encrypt/decrypt operations"),
+    'crypto_bytes_in_total': ('counter', "Bytes read by operations"),
+    'crypto_bytes_out_total': ('counter', "Bytes written by operations"),
+    'crypto_skipped_total': ('counter', "Files skipped because their output was current"),
+    'crypto_operation_seconds': ('histogram', "Operation latency in seconds"),
+    'crypto_active_workers': ('gauge', "Operations currently in progress"),
+}
+
+
+class _Shard:
+    """One thread's metrics; only the owning thread writes to it"""
+    def __init__(self):
+        self.values = {}      # (name, labels) -> number (counters and gauge deltas)
+        self.histograms = {}  # (name, labels) -> [bucket counts..., +Inf, sum]
+
+
+class _Owner:
+    """Held only in the owning thread's local storage; freed when the thread exits"""
+    __slots__ = ('shard', '__weakref__')
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+class Metrics:
+    """Registry of metrics recorded in per-thread shards"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._local = threading.local()
+        self._shards = set()
+        self._retired = _Shard()  # totals of the shards of exited threads
+        self._lock = threading.Lock()  # guards the shard set and the retired totals
+
+    def _shard(self):
+        owner = getattr(self._local, 'owner', None)
+        if owner is None:
+            shard = _Shard()
+            owner = self._local.owner = _Owner(shard)
+            with self._lock:
+                self._shards.add(shard)
+            weakref.finalize(owner, self._retire, shard)
+        return owner.shard
+
+    def _retire(self, shard):
+        """Fold an exited thread's shard into the retired totals"""
+        with self._lock:
+            self._shards.discard(shard)
+            _merge(self._retired, shard.values, shard.histograms)
+
+    def inc(self, name, labels=(), value=1):
+        """Add value to a counter (or, with a negative value, a gauge)"""
+        values = self._shard().values
+        key = (name, labels)
+        values[key] = values.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        """Record value in a histogram"""
+        histograms = self._shard().histograms
+        key = (name, labels)
+        counts = histograms.get(key)
+        if counts is None:
+            counts = histograms[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @contextmanager
+    def track(self, cipher, operation):
+        """Record one operation; set .bytes_in / .bytes_out on the yielded object"""
+        labels = (('cipher', cipher), ('operation', operation))
+        record = _Operation()
+        self.inc('crypto_active_workers', labels)
+        start = time.perf_counter()
+        failed = True
+        try:
+            yield record
+            failed = False
+        finally:
+            self.inc('crypto_active_workers', labels, -1)
+            self.record(cipher, operation, time.perf_counter() - start, record.bytes_in,
+                        record.bytes_out, failed)
+
+    def record(self, cipher, operation, seconds, bytes_in=0, bytes_out=0, failed=False):
+        """Record one finished operation, for work that track() cannot wrap
+
+        (e.g. a file split into chunks that run on several workers)
+        """
+        labels = (('cipher', cipher), ('operation', operation))
+        if failed:
+            self.inc('crypto_errors_total', labels)
+        else:
+            self.inc('crypto_operations_total', labels)
+            if bytes_in:
+                self.inc('crypto_bytes_in_total', labels, bytes_in)
+            if bytes_out:
+                self.inc('crypto_bytes_out_total', labels, bytes_out)
+        self.observe('crypto_operation_seconds', labels, seconds)
+
+    def collect(self):
+        """Merge all shards; returns (values, histograms) keyed on (name, labels)"""
+        total = _Shard()
+        with self._lock:
+            shards = list(self._shards)
+            _merge(total, self._retired.values, self._retired.histograms)
+        for shard in shards:
+            # dict() copies are atomic with respect to the owning thread
+            _merge(total, dict(shard.values), dict(shard.histograms))
+        return total.values, total.histograms
+
+    def snapshot(self):
+        """JSON-serializable view of all metrics"""
+        values, histograms = self.collect()
+        out = {'timestamp': time.time(), 'metrics': []}
+        for (name, labels), value in sorted(values.items()):
+            out['metrics'].append({'name': name, 'labels': dict(labels), 'value': value})
+        for (name, labels), counts in sorted(histograms.items()):
+            out['metrics'].append({'name': name, 'labels': dict(labels),
+                                   'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'],
+                                                       _cumulative(counts[:-1]))),
+                                   'count': sum(counts[:-1]), 'sum': counts[-1]})
+        return out
+
+    def prometheus_text(self):
+        """Metrics in the Prometheus text exposition format"""
+        values, histograms = self.collect()
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described:
+                described.add(name)
+                kind, text = _HELP.get(name, ('untyped', name))
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in sorted(values.items()):
+            describe(name)
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), counts in sorted(histograms.items()):
+            describe(name)
+            bounds = [str(b) for b in self.buckets] + ['+Inf']
+            for bound, total in zip(bounds, _cumulative(counts[:-1])):
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {total}")
+            lines.append(f"{name}_sum{_labels(labels)} {counts[-1]}")
+            lines.append(f"{name}_count{_labels(labels)} {sum(counts[:-1])}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Write metrics atomically; Prometheus text for *.prom, JSON otherwise"""
+        if path.endswith('.prom'):
+            data = self.prometheus_text()
+        else:
+            data = json.dumps(self.snapshot(), indent=1)
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+class _Operation:
+    __slots__ = ('bytes_in', 'bytes_out')
+
+    def __init__(self):
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+
+def _merge(total, values, histograms):
+    """Add values and histograms into the shard total"""
+    for key, value in values.items():
+        total.values[key] = total.values.get(key, 0) + value
+    for key, counts in histograms.items():
+        merged = total.histograms.get(key)
+        total.histograms[key] = list(counts) if merged is None else [a + b for a, b in zip(merged, counts)]
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+def _cumulative(counts):
+    total = 0
+    out = []
+    for count in counts:
+        total += count
+        out.append(total)
+    return out
+
+
+class SnapshotWriter:
+    """Background thread writing metrics to a file every interval seconds"""
+    def __init__(self, metrics, path, interval=10.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.metrics.write(self.path)
+
+    def stop(self):
+        """Stop the thread and write a final snapshot"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.metrics.write(self.path)
+
+
+# Process-wide registry used by the batch runner and the service
+METRICS = Metrics()
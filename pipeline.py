@@ -0,0 +1,167 @@
+"""
+Pipelined File Processing
+Overlaps reading, encryption/decryption and writing in separate threads
+"""
+
+import queue
+import threading
+
+from compression import finalize_pieces, transform_pieces
+from stream_cipher import DEFAULT_CHUNK_SIZE
+
+DEFAULT_DEPTH = 3  # triple buffering
+_POLL_INTERVAL = 0.1
+
+
+class PipelineAborted(Exception):
+    """Raised inside a stage when another stage has failed"""
+
+
+class PipelineExecutor:
+    """Reader -> cipher -> writer pipeline with bounded, reused buffers
+
+    The reader fills preallocated bytearrays with readinto(), the cipher
+    stage transforms them into a second pool of preallocated output buffers
+    and the writer (the calling thread) writes them out. Each pool holds
+    `depth` buffers, so at most 2 * depth chunks are ever in memory.
+    PyCryptodome releases the GIL inside its C core, so the cipher stage
+    runs while the other two threads are blocked on disk I/O.
+    """
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, depth=DEFAULT_DEPTH):
+        if depth < 2:
+            raise ValueError("Pipeline depth must be at least 2")
+        self.chunk_size = chunk_size
+        self.depth = depth
+
+    @staticmethod
+    def memory_factor(depth=DEFAULT_DEPTH, pieces=False):
+        """Peak memory of a pipeline run as a multiple of its chunk size
+
+        pieces: the transform has no update_into() and its output goes
+        through transform_pieces(). Then depth pieces wait for the writer,
+        the writer holds one, and the cipher stage holds the piece it is
+        producing and the one before it (a TransformChain's intermediate).
+        """
+        if pieces:
+            return 3 * depth
+        return 2 * depth + 1
+
+    def run(self, transform, src, dst, on_chunk=None):
+        """Stream src through transform into dst, returning (bytes_in, bytes_out)
+
+        transform provides update(data) and finalize(); if it also provides
+        update_into(data, out) -> int, its output goes into a second pool of
+        reused buffers sized chunk_size plus a spare block (room for a block
+        carried over from the previous chunk). Transforms whose output size
+        is not bounded by their input (e.g. decompression) go through
+        transform_pieces(), and at most depth of their pieces wait for the
+        writer.
+        """
+        update_into = getattr(transform, 'update_into', None)
+        free_in = queue.Queue()
+        free_out = queue.Queue()
+        for _ in range(self.depth):
+            free_in.put(bytearray(self.chunk_size))
+            if update_into is not None:
+                free_out.put(bytearray(self.chunk_size + 64))
+        to_cipher = queue.Queue()
+        to_writer = queue.Queue(self.depth)
+        abort = threading.Event()
+        writer_done = threading.Event()
+        errors = []
+        counts = {'in': 0}
+
+        def get(q):
+            while True:
+                try:
+                    return q.get(timeout=_POLL_INTERVAL)
+                except queue.Empty:
+                    if abort.is_set():
+                        raise PipelineAborted()
+
+        def put(q, item):
+            while True:
+                try:
+                    return q.put(item, timeout=_POLL_INTERVAL)
+                except queue.Full:
+                    if abort.is_set():
+                        raise PipelineAborted()
+
+        def finish(q):
+            # The end marker must reach a writer that is still waiting for it
+            while not writer_done.is_set():
+                try:
+                    return q.put(None, timeout=_POLL_INTERVAL)
+                except queue.Full:
+                    pass
+
+        def reader():
+            try:
+                while True:
+                    buf = get(free_in)
+                    n = src.readinto(buf)
+                    if not n:
+                        break
+                    counts['in'] += n
+                    to_cipher.put((buf, n))
+            except PipelineAborted:
+                pass
+            except BaseException as e:
+                errors.append(e)
+                abort.set()
+            to_cipher.put(None)
+
+        def cipher_stage():
+            try:
+                while True:
+                    item = get(to_cipher)
+                    if item is None:
+                        break
+                    buf, n = item
+                    if update_into is not None:
+                        out = get(free_out)
+                        written = update_into(memoryview(buf)[:n], out)
+                        put(to_writer, (memoryview(out)[:written], out))
+                    else:
+                        for piece in transform_pieces(transform, memoryview(buf)[:n]):
+                            put(to_writer, (piece, None))
+                    free_in.put(buf)
+                if not abort.is_set():
+                    for piece in finalize_pieces(transform):
+                        put(to_writer, (piece, None))
+            except PipelineAborted:
+                pass
+            except BaseException as e:
+                errors.append(e)
+                abort.set()
+            finish(to_writer)
+
+        threads = [threading.Thread(target=reader, name="pipeline-reader", daemon=True),
+                   threading.Thread(target=cipher_stage, name="pipeline-cipher", daemon=True)]
+        for thread in threads:
+            thread.start()
+
+        bytes_out = 0
+        try:
+            while True:
+                item = to_writer.get()
+                if item is None:
+                    break
+                data, buf = item
+                dst.write(data)
+                bytes_out += len(data)
+                if buf is not None:
+                    free_out.put(buf)
+                if on_chunk is not None:
+                    on_chunk()
+        except BaseException:
+            abort.set()
+            raise
+        finally:
+            writer_done.set()
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            raise errors[0]
+        return counts['in'], bytes_out
@@ -0,0 +1,609 @@
+#!/usr/bin/env python3
+"""
+Job Planner
+Estimates, before anything runs, how long an encrypt or decrypt job will
+take, how much memory it will need and how large its outputs will be. The
+inputs are walked (decryption reads only the file headers), each file is
+matched to the path the tools would take for it, and the time is predicted
+from a throughput profile of this host: every cipher mode, compression
+method, classical cipher path and the disk write speed are timed once and
+cached per host, like the cipher_selection benchmark.
+
+The planner warns when the chosen path will exceed the memory budget or
+the time window (whole-file reads of large files, Playfair on large texts,
+the pure-Python str API of the classical ciphers) and suggests a streaming
+or parallel mode that fits.
+
+    python planner.py calibrate                 # measure this host (cached)
+    python planner.py encrypt data/ --cipher AES --compression zlib \\
+        --workers 8 --memory 2G --window 30m
+    python planner.py decrypt big.enc --cipher AES --path whole --memory 512M
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+from aes_cipher import AESCipher
+from atomic_output import FSYNC_FILE, FSYNC_NEVER, AtomicOutput
+from chacha_cipher import ChaCha20Cipher
+from cipher_selection import fastest_cipher, host_id
+from compression import COMPRESSION_METHODS, Compressor, Decompressor
+from des_cipher import DESCipher
+from file_header import FileHeader, peek_header
+from file_ops import (AUTO_CIPHER, CIPHERS, MEMORY_BUDGET_ENV, TEXT_FACTOR, WHOLE_FILE_FACTOR,
+                      MemoryBudgetError, collect_files, format_size, memory_budget_from_env,
+                      parse_size, plan_file)
+from playfair_cipher import PlayfairCipher
+from scheduler import SPLIT_CHUNK_SIZE, SPLIT_SIZE
+from stream_cipher import DEFAULT_CHUNK_SIZE, GCM_TAG_SIZE, HMAC_TAG_SIZE
+from vigenere_cipher import BYTES_CHUNK_SIZE, VigenereCipher
+
+CLASSICAL_CIPHERS = ("VIGENERE", "PLAYFAIR")
+
+# Processing paths; 'auto' is what encrypt_path / process_text_file choose
+PATH_AUTO = "auto"
+PATH_WHOLE = "whole"        # the file is read whole (f.read() / one memory map)
+PATH_STREAM = "stream"      # chunked, pipelined streaming
+PATH_PARALLEL = "parallel"  # split into chunks processed by several workers (scheduler)
+PATH_TEXT = "text"          # classical cipher str API (pure Python, as service.py uses)
+PATHS = (PATH_AUTO, PATH_WHOLE, PATH_STREAM, PATH_PARALLEL, PATH_TEXT)
+
+# Overrides the profile location, e.g. for read-only home directories
+PROFILE_ENV = "CRYPTO_PROFILE_CACHE"
+PROFILE_VERSION = 1
+CIPHER_SAMPLE = 4 * 1024 * 1024
+COMPRESSION_SAMPLE = 2 * 1024 * 1024
+TEXT_SAMPLE = 256 * 1024
+WRITE_SAMPLE = 16 * 1024 * 1024
+ROUNDS = 3
+
+# Compression ratios are measured on the start of at most this many inputs
+RATIO_SAMPLE = 1024 * 1024
+RATIO_FILES = 16
+
+# Peak memory of the classical paths: Vigenère's bytes API holds a chunk,
+# its upper-case and letters-only copies and the result; the str API holds
+# the text, its upper-case copy, the extended key and the result
+VIGENERE_PEAK = 4 * BYTES_CHUNK_SIZE
+STR_FACTOR = 4
+# A split chunk holds the ciphertext read and the plaintext written
+SPLIT_FACTOR = 2
+
+_profile = None
+_lock = threading.Lock()
+
+
+def profile_path():
+    """Location of the per-user throughput profile"""
+    if os.environ.get(PROFILE_ENV):
+        return os.environ[PROFILE_ENV]
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'cryptography-project', 'throughput_profile.json')
+
+
+def parse_duration(text):
+    """Parse a duration such as '90', '90s', '15m' or '2h' into seconds"""
+    value = text.strip().lower()
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    scale = units.get(value[-1:], None)
+    if scale is not None:
+        value = value[:-1]
+    try:
+        seconds = float(value) * (scale or 1)
+    except ValueError:
+        raise ValueError(f"Invalid duration '{text}' (use e.g. 90s, 15m or 2h)") from None
+    if seconds <= 0:
+        raise ValueError("Duration must be positive")
+    return seconds
+
+
+def format_duration(seconds):
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}m{int(seconds % 60):02d}s"
+    return f"{int(seconds // 3600)}h{int(seconds % 3600 // 60):02d}m"
+
+
+def _size_arg(size):
+    """A size as a command-line value, rounded down (e.g. '150M')"""
+    if size >= 1024 * 1024:
+        return f"{size // (1024 * 1024)}M"
+    return f"{max(size // 1024, 1)}K"
+
+
+def _best_of(function, rounds=ROUNDS):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return max(best, 1e-9)
+
+
+_LOG_LINE = b"2026-10-19 12:00:00 INFO worker-3 request served in 12 ms for /status\n"
+# The str API of Playfair only accepts letters and spaces
+_PROSE_LINE = b"The quick brown fox jumps over the lazy dog while the planner keeps time "
+
+
+def _sample_text(size, line=_LOG_LINE):
+    """Repeated ASCII text: compressible, like logs and other typical inputs"""
+    return (line * (size // len(line) + 1))[:size]
+
+
+def _auth_key(cls):
+    """Profile key of an authenticated mode, e.g. 'AES-GCM' or 'CHACHA20-POLY1305'"""
+    return cls.auth_mode if cls.auth_mode.startswith(cls.name) else f"{cls.name}-{cls.auth_mode}"
+
+
+def calibrate():
+    """Measure this host; returns {profile key: bytes/s}"""
+    results = {}
+    data = os.urandom(CIPHER_SAMPLE)
+    out = bytearray(CIPHER_SAMPLE)
+    for cls in (AESCipher, DESCipher, ChaCha20Cipher):
+        cipher = cls(os.urandom(8 if cls is DESCipher else 32))
+        if not cipher.authenticated_only:
+            encryptor = cipher.encryptor()
+            results[f"{cipher.name}-CBC-encrypt"] = \
+                CIPHER_SAMPLE / _best_of(lambda: encryptor.update_into(data, out))
+            results[f"{cipher.name}-CBC-decrypt"] = \
+                CIPHER_SAMPLE / _best_of(lambda: cipher.decryptor(encryptor.iv).update_into(data, out))
+
+        def authenticated():
+            encryptor = cipher.auth_encryptor()
+            encryptor.update_into(data, out)
+            encryptor.finalize()
+        # Decryption does the same work and verifies the tag instead
+        results[_auth_key(cls)] = CIPHER_SAMPLE / _best_of(authenticated)
+
+    text = _sample_text(COMPRESSION_SAMPLE)
+    for method in COMPRESSION_METHODS:
+        compressor = Compressor(method)
+        compressed = compressor.update(text) + compressor.finalize()
+        results[f"{method}-compress"] = COMPRESSION_SAMPLE / _best_of(
+            lambda: (lambda c: (c.update(text), c.finalize()))(Compressor(method)), rounds=1)
+        results[f"{method}-decompress"] = COMPRESSION_SAMPLE / _best_of(
+            lambda: (lambda d: (d.update(compressed), d.finalize()))(Decompressor(method)))
+
+    text = _sample_text(TEXT_SAMPLE, _PROSE_LINE)
+    vigenere = VigenereCipher("PLANNER")
+    playfair = PlayfairCipher("PLANNER")
+    results["VIGENERE-bytes"] = TEXT_SAMPLE / _best_of(lambda: vigenere.encrypt_bytes(text))
+    results["PLAYFAIR-bytes"] = TEXT_SAMPLE / _best_of(lambda: playfair.encrypt_bytes(text))
+    text = text.decode('ascii')
+    results["VIGENERE-text"] = TEXT_SAMPLE / _best_of(lambda: vigenere.encrypt(text), rounds=1)
+    results["PLAYFAIR-text"] = TEXT_SAMPLE / _best_of(lambda: playfair.encrypt(text), rounds=1)
+
+    results["write"] = _write_speed(os.path.dirname(os.path.abspath(profile_path())))
+    return results
+
+
+def _write_speed(directory):
+    """Bytes/s of an fsynced AtomicOutput write in directory"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, '.planner-write-test')
+    block = os.urandom(1024 * 1024)
+    start = time.perf_counter()
+    with AtomicOutput(path, FSYNC_FILE) as out:
+        for _ in range(WRITE_SAMPLE // len(block)):
+            out.write(block)
+    elapsed = time.perf_counter() - start
+    os.remove(path)
+    return WRITE_SAMPLE / max(elapsed, 1e-9)
+
+
+def _read_profile(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get('version') != PROFILE_VERSION or \
+            cached.get('host') != host_id():
+        return None
+    results = cached.get('results')
+    return results if isinstance(results, dict) else None
+
+
+def _write_profile(path, results):
+    """Write atomically; a profile that cannot be written only costs a re-calibration"""
+    try:
+        with AtomicOutput(path, FSYNC_NEVER) as out:
+            out.write(json.dumps({'version': PROFILE_VERSION, 'host': host_id(),
+                                  'measured': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                                  'results': results}, indent=1).encode('utf-8'))
+    except OSError:
+        pass
+
+
+def load_profile(refresh=False):
+    """Throughput profile of this host ({key: bytes/s}); calibrated once and cached"""
+    global _profile
+    with _lock:
+        if _profile is None or refresh:
+            path = profile_path()
+            results = None if refresh else _read_profile(path)
+            if results is None:
+                results = calibrate()
+                _write_profile(path, results)
+            _profile = results
+        return dict(_profile)
+
+
+class FileEstimate:
+    """Predicted cost of processing one file"""
+    def __init__(self, path, cipher, operation, mode, size):
+        self.path = path
+        self.cipher = cipher
+        self.operation = operation
+        self.mode = mode
+        self.size = size
+        self.output_size = size
+        self.seconds = 0.0
+        self.peak_memory = 0
+        self.chunks = 1  # tasks the file is split into (parallel mode)
+        self.splittable = False
+
+    def to_dict(self):
+        return {'path': self.path, 'cipher': self.cipher, 'operation': self.operation,
+                'mode': self.mode, 'size': self.size, 'output_size': self.output_size,
+                'seconds': round(self.seconds, 6), 'peak_memory': self.peak_memory,
+                'chunks': self.chunks}
+
+
+class Plan:
+    """Per-file estimates of a job, with totals, warnings and suggestions"""
+    def __init__(self, operation, workers, memory_budget=None, memory_limit=None, window=None):
+        self.operation = operation
+        self.workers = workers
+        self.memory_budget = memory_budget
+        self.memory_limit = memory_limit
+        self.window = window
+        self.estimates = []
+        self.warnings = []
+        self.suggestions = []
+
+    def totals(self):
+        """{(cipher, operation, mode): [files, bytes in, bytes out, seconds]}"""
+        totals = {}
+        for e in self.estimates:
+            row = totals.setdefault((e.cipher, e.operation, e.mode), [0, 0, 0, 0.0])
+            row[0] += 1
+            row[1] += e.size
+            row[2] += e.output_size
+            row[3] += e.seconds
+        return totals
+
+    def tasks(self):
+        """(seconds, peak memory) of each unit of work the workers pick up"""
+        for e in self.estimates:
+            for _ in range(e.chunks):
+                yield e.seconds / e.chunks, e.peak_memory
+
+    def makespan(self):
+        """Predicted wall time: tasks, longest first, each go to the first free worker"""
+        # Threads share the CPUs; more workers than CPUs do not run faster
+        lanes = [0.0] * max(1, min(self.workers, os.cpu_count() or 1))
+        for seconds, _ in sorted(self.tasks(), reverse=True):
+            lanes[lanes.index(min(lanes))] += seconds
+        return max(lanes)
+
+    def peak_memory(self):
+        """Predicted peak: the largest tasks that can run at the same time"""
+        peaks = sorted((peak for _, peak in self.tasks()), reverse=True)
+        return sum(peaks[:max(1, self.workers)])
+
+    def to_dict(self):
+        return {'operation': self.operation, 'workers': self.workers,
+                'memory_budget': self.memory_budget, 'memory_limit': self.memory_limit,
+                'window': self.window, 'seconds': round(self.makespan(), 6),
+                'peak_memory': self.peak_memory(),
+                'bytes_in': sum(e.size for e in self.estimates),
+                'bytes_out': sum(e.output_size for e in self.estimates),
+                'files': [e.to_dict() for e in self.estimates],
+                'warnings': self.warnings, 'suggestions': self.suggestions}
+
+
+def _rate(profile, key):
+    if key not in profile:
+        raise ValueError(f"The throughput profile has no '{key}' measurement; "
+                         f"run 'planner.py calibrate --refresh'")
+    return profile[key]
+
+
+def _compression_ratios(paths, method):
+    """Compressed / original size of the largest inputs, sampled from their start
+
+    Returns ({path: ratio}, ratio for the other files).
+    """
+    ratios = {}
+    original = compressed = 0
+    for path in sorted(paths, key=os.path.getsize, reverse=True)[:RATIO_FILES]:
+        with open(path, 'rb') as f:
+            data = f.read(RATIO_SAMPLE)
+        if not data:
+            continue
+        compressor = Compressor(method)
+        size = len(compressor.update(data)) + len(compressor.finalize())
+        ratios[path] = size / len(data)
+        original += len(data)
+        compressed += size
+    return ratios, compressed / original if original else 1.0
+
+
+def _file_cipher_estimate(profile, path, size, cipher, operation, path_mode, memory_budget,
+                          compression, authenticated, ratio, split_size):
+    """FileEstimate for AES, DES or ChaCha20; header is read for decryption"""
+    cls = CIPHERS[cipher]
+    header = None
+    if operation == "decrypt":
+        header = peek_header(path)
+        if header is not None:
+            cipher, cls = header.cipher, CIPHERS.get(header.cipher, cls)
+            compression = header.compression
+            authenticated = header.mode != "CBC"
+    authenticated = authenticated or cls.authenticated_only
+    if header is None:
+        # The header the encryption would write, or a legacy headerless file
+        prefix = cls.auth_nonce_size if authenticated else cls.block_size
+        if operation == "encrypt":
+            mode = cls.auth_mode if authenticated else "CBC"
+            prefix += len(FileHeader(cipher, mode, compression, key_fingerprint='0' * 16,
+                                     original_size=size).to_bytes())
+    else:
+        prefix = len(header.raw) + (cls.auth_nonce_size if authenticated else cls.block_size)
+
+    if path_mode == PATH_WHOLE and not (authenticated or compression):
+        # cipher.encrypt_file(f.read()), whatever the file's size
+        mode, peak = "whole", size * WHOLE_FILE_FACTOR
+    else:
+        mode, _, peak = plan_file(size, memory_budget,
+                                  DEFAULT_CHUNK_SIZE if path_mode == PATH_STREAM else None,
+                                  True, compression, authenticated, header)
+    tag = (HMAC_TAG_SIZE if cls.auth_mode == "CBC-HMAC" else GCM_TAG_SIZE) if authenticated else 0
+    cipher_key = _auth_key(cls) if authenticated else f"{cipher}-CBC-{operation}"
+
+    if operation == "encrypt":
+        payload = int(size * ratio) if compression else size
+        if not authenticated:
+            payload += cls.block_size - payload % cls.block_size
+        output_size = prefix + payload + tag
+        seconds = payload / _rate(profile, cipher_key)
+        if compression:
+            seconds += size / _rate(profile, f"{compression}-compress")
+    else:
+        payload = max(size - prefix - tag, 0)
+        if header is not None and header.original_size is not None:
+            output_size = header.original_size
+        elif compression:
+            output_size = payload  # unknown without decompressing; assume no gain
+        else:
+            output_size = max(payload - 1, 0)  # at least one byte of padding
+        seconds = payload / _rate(profile, cipher_key)
+        if compression:
+            seconds += output_size / _rate(profile, f"{compression}-decompress")
+
+    estimate = FileEstimate(path, cipher, operation, mode, size)
+    estimate.output_size = output_size
+    estimate.seconds = seconds + output_size / _rate(profile, "write")
+    estimate.peak_memory = peak
+    # Only plain CBC decryption can start in the middle of a file
+    estimate.splittable = (operation == "decrypt" and not authenticated and not compression
+                           and size > SPLIT_CHUNK_SIZE)
+    if path_mode == PATH_PARALLEL or (path_mode == PATH_AUTO and size >= split_size):
+        if estimate.splittable:
+            estimate.mode = "split"
+            estimate.chunks = math.ceil(size / SPLIT_CHUNK_SIZE)
+            estimate.peak_memory = SPLIT_CHUNK_SIZE * SPLIT_FACTOR
+    return estimate
+
+
+def _classical_estimate(profile, path, size, cipher, operation, path_mode):
+    """FileEstimate for Vigenère or Playfair (process_text_file, scheduler or the str API)"""
+    if path_mode == PATH_TEXT:
+        mode, rate, peak = "text", _rate(profile, f"{cipher}-text"), size * STR_FACTOR
+    elif cipher == "PLAYFAIR":
+        mode, rate, peak = "whole", _rate(profile, "PLAYFAIR-bytes"), size * TEXT_FACTOR
+    else:
+        mode, rate, peak = "mmap", _rate(profile, "VIGENERE-bytes"), min(size * 4, VIGENERE_PEAK)
+    estimate = FileEstimate(path, cipher, operation, mode, size)
+    estimate.seconds = size / rate + size / _rate(profile, "write")
+    estimate.peak_memory = peak
+    estimate.splittable = cipher == "VIGENERE" and mode != "text" and size > SPLIT_CHUNK_SIZE
+    # Only the scheduler splits Vigenère files (batch.py handles the file
+    # ciphers alone), so auto mode stays on the memory-mapped path
+    if estimate.splittable and path_mode == PATH_PARALLEL:
+        # The letter-counting pass before the transform is a cheap translate()
+        estimate.mode = "split"
+        estimate.chunks = math.ceil(size / SPLIT_CHUNK_SIZE)
+        estimate.peak_memory = min(SPLIT_CHUNK_SIZE, VIGENERE_PEAK) * SPLIT_FACTOR
+    return estimate
+
+
+def plan_job(operation, inputs, cipher, path_mode=PATH_AUTO, workers=None, memory_budget=None,
+             memory_limit=None, window=None, compression=None, authenticated=False,
+             split_size=SPLIT_SIZE, profile=None):
+    """Estimate a job without running it; returns a Plan
+
+    cipher is a file cipher name, 'auto', 'VIGENERE' or 'PLAYFAIR'.
+    memory_budget is the per-file budget the tools would be given,
+    memory_limit the memory available to the whole job and window the time
+    available, in seconds; both only raise warnings.
+    """
+    if operation not in ("encrypt", "decrypt"):
+        raise ValueError(f"Unknown operation '{operation}'")
+    if path_mode not in PATHS:
+        raise ValueError(f"Unknown path '{path_mode}'. Choose from: {', '.join(PATHS)}")
+    classical = cipher in CLASSICAL_CIPHERS
+    if path_mode == PATH_TEXT and not classical:
+        raise ValueError("The text path only exists for Vigenère and Playfair")
+    if cipher == AUTO_CIPHER:
+        # Decryption reads the cipher from each header
+        cipher = fastest_cipher()
+        authenticated = authenticated or operation == "encrypt"
+    profile = profile or load_profile()
+    workers = workers or os.cpu_count() or 1
+    plan = Plan(operation, workers, memory_budget, memory_limit, window)
+    files = [path for path, _ in collect_files(inputs)]
+    ratios, default_ratio = {}, 1.0
+    if compression and operation == "encrypt":
+        ratios, default_ratio = _compression_ratios(files, compression)
+    budget_errors = {}
+    for path in files:
+        size = os.path.getsize(path)
+        try:
+            if classical:
+                estimate = _classical_estimate(profile, path, size, cipher, operation, path_mode)
+            else:
+                estimate = _file_cipher_estimate(profile, path, size, cipher, operation,
+                                                 path_mode, memory_budget, compression,
+                                                 authenticated, ratios.get(path, default_ratio),
+                                                 split_size)
+        except MemoryBudgetError as e:
+            # The same for most files; reported once
+            budget_errors[str(e)] = budget_errors.get(str(e), 0) + 1
+            continue
+        except (OSError, ValueError) as e:
+            plan.warnings.append(f"{path}: {e}")
+            continue
+        plan.estimates.append(estimate)
+    for message, count in budget_errors.items():
+        plan.warnings.append(f"{message} ({count} file(s) left out of the plan)")
+    _check(plan, profile)
+    return plan
+
+
+def _check(plan, profile):
+    """Add warnings for a plan that exceeds its budgets, and suggest modes that fit"""
+    budget = plan.memory_budget
+    limit = plan.memory_limit
+    per_task = limit // plan.workers if limit else None
+    for e in plan.estimates:
+        allowed = min(x for x in (budget, per_task) if x) if (budget or limit) else None
+        if allowed is None or e.peak_memory <= allowed:
+            continue
+        what = {"whole": "reads the whole file into memory",
+                "text": "decodes the whole file into a Python str",
+                "mmap": "streams the file"}.get(e.mode, f"runs in {e.mode} mode")
+        plan.warnings.append(f"{e.path}: {e.cipher} {e.operation} {what} and needs about "
+                             f"{format_size(e.peak_memory)}, over the {format_size(allowed)} "
+                             f"available per file")
+        if e.cipher == "PLAYFAIR":
+            plan.suggestions.append(f"{e.path}: Playfair has no streaming mode; split the "
+                                    f"text into files under {format_size(allowed // TEXT_FACTOR)}")
+        elif e.mode == "text":
+            plan.suggestions.append(f"{e.path}: use the bytes path (process_text_file, "
+                                    f"--path auto), which streams through memory maps in "
+                                    f"{format_size(VIGENERE_PEAK)}")
+        elif e.mode == "whole":
+            plan.suggestions.append(f"{e.path}: stream it with --memory-budget "
+                                    f"{_size_arg(allowed)} (or ${MEMORY_BUDGET_ENV})")
+
+    if limit and plan.peak_memory() > limit:
+        plan.warnings.append(f"{plan.workers} worker(s) together need about "
+                             f"{format_size(plan.peak_memory())}, over the "
+                             f"{format_size(limit)} memory limit")
+        # Only the file ciphers can stream within a per-file budget
+        if (budget is None or budget > per_task) and any(
+                e.cipher not in CLASSICAL_CIPHERS and e.peak_memory > per_task
+                for e in plan.estimates):
+            plan.suggestions.append(f"give each file --memory-budget {_size_arg(per_task)} "
+                                    f"so that {plan.workers} worker(s) fit in {format_size(limit)}")
+        largest = max(peak for _, peak in plan.tasks())
+        if largest <= limit:
+            plan.suggestions.append(f"use --workers {max(1, limit // largest)}")
+
+    if plan.window and plan.makespan() > plan.window:
+        plan.warnings.append(f"The job needs about {format_duration(plan.makespan())}, longer "
+                             f"than the {format_duration(plan.window)} window")
+        cpus = os.cpu_count() or 1
+        if plan.workers < cpus:
+            plan.suggestions.append(f"use --workers {cpus} (this host has {cpus} CPUs)")
+        slow = [e for e in plan.estimates if e.mode == "text"]
+        if slow:
+            speedup = profile[f"{slow[0].cipher}-bytes"] / profile[f"{slow[0].cipher}-text"]
+            plan.suggestions.append(f"{len(slow)} file(s) use the pure-Python str API; the bytes "
+                                    f"path (--path auto) is about {speedup:.0f}x faster")
+        unsplit = [e for e in plan.estimates if e.splittable and e.chunks == 1]
+        if unsplit and cpus > 1:
+            # --split-size only applies to the file ciphers (batch.py)
+            lower = any(e.cipher not in CLASSICAL_CIPHERS for e in unsplit)
+            plan.suggestions.append(f"{len(unsplit)} large file(s) could be split across workers "
+                                    f"(--path parallel{', or a lower --split-size' if lower else ''})")
+        if any(e.cipher == "DES" for e in plan.estimates) and plan.operation == "encrypt":
+            plan.suggestions.append(f"--cipher {AUTO_CIPHER} picks the fastest authenticated "
+                                    f"cipher on this host")
+
+
+def _print_plan(plan):
+    rows = sorted(plan.totals().items())
+    print(f"{'cipher':<10} {'operation':<9} {'mode':<10} {'files':>6} {'input':>10} "
+          f"{'output':>10} {'cpu time':>9}")
+    for (cipher, operation, mode), (files, size, output, seconds) in rows:
+        print(f"{cipher:<10} {operation:<9} {mode:<10} {files:>6} {format_size(size):>10} "
+              f"{format_size(output):>10} {format_duration(seconds):>9}")
+    print(f"Estimated time {format_duration(plan.makespan())} with {plan.workers} worker(s), "
+          f"peak memory {format_size(plan.peak_memory())}, output "
+          f"{format_size(sum(e.output_size for e in plan.estimates))}")
+    for warning in plan.warnings:
+        print(f"WARNING {warning}")
+    for suggestion in plan.suggestions:
+        print(f"SUGGEST {suggestion}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate time, peak memory and output size of "
+                                                 "a job before running it")
+    parser.add_argument('operation', choices=['encrypt', 'decrypt', 'calibrate'])
+    parser.add_argument('inputs', nargs='*', help="Files or directories to process")
+    parser.add_argument('--cipher', choices=list(CIPHERS) + [AUTO_CIPHER] + list(CLASSICAL_CIPHERS),
+                        default=AUTO_CIPHER, help="Cipher (default: %(default)s; decryption "
+                                                  "uses the cipher recorded in each header)")
+    parser.add_argument('--path', choices=PATHS, default=PATH_AUTO,
+                        help="Processing path to evaluate (default: what the tools choose)")
+    parser.add_argument('--compression', choices=COMPRESSION_METHODS)
+    parser.add_argument('--authenticated', action='store_true')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--memory-budget', type=parse_size, default=memory_budget_from_env(),
+                        help=f"Memory budget per file (default: ${MEMORY_BUDGET_ENV} or none)")
+    parser.add_argument('--memory', type=parse_size,
+                        help="Memory available to the whole job, e.g. 4G")
+    parser.add_argument('--window', type=parse_duration, help="Time available, e.g. 30m or 2h")
+    parser.add_argument('--split-size', type=parse_size, default=SPLIT_SIZE,
+                        help="As for batch.py (default: 64M)")
+    parser.add_argument('--refresh', action='store_true',
+                        help="Calibrate again, ignoring the cached profile")
+    parser.add_argument('--json', action='store_true', help="Print the plan as JSON")
+    args = parser.parse_args(argv)
+
+    profile = load_profile(args.refresh)
+    if args.operation == 'calibrate':
+        for key, rate in sorted(profile.items()):
+            print(f"{key:<20} {rate / 1024 / 1024:10.1f} MiB/s")
+        print(f"Profile: {profile_path()}")
+        return 0
+    if not args.inputs:
+        parser.error("no inputs given")
+    try:
+        plan = plan_job(args.operation, args.inputs, args.cipher, args.path, args.workers,
+                        args.memory_budget, args.memory, args.window, args.compression,
+                        args.authenticated, args.split_size, profile)
+    except (OSError, ValueError, MemoryBudgetError) as e:
+        print(f"Error: {e}")
+        return 1
+    if args.json:
+        print(json.dumps(plan.to_dict(), indent=1))
+    else:
+        _print_plan(plan)
+    return 1 if plan.warnings else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,16 +3,43 @@ Playfair Cipher Implementation
 Classical digraph substitution cipher using a 5x5 matrix
 """
 
+import operator
+import re
+
+from table_artifact import (KIND_PLAYFAIR, load_artifact, parse_playfair_matrix,
+                            playfair_positions, read_table_file)
+
+# The bytes API works through inputs in pieces of this size
+BYTES_CHUNK_SIZE = 1024 * 1024
+# Upper-case letters and J -> I; everything else is deleted first
+_TO_PLAYFAIR = bytes.maketrans(b'abcdefghijklmnopqrstuvwxyzJ', b'ABCDEFGHIIKLMNOPQRSTUVWXYZI')
+_NON_LETTERS = bytes(b for b in range(256) if not chr(b).isascii() or not chr(b).isalpha())
+_DOUBLED = re.compile(rb'(?=(.)\1)', re.DOTALL)
+
 
 class PlayfairCipher:
-    def __init__(self, key=None, matrix=None):
+    preserves_length = False  # encryption pads and splits doubled letters
+    
+    def __init__(self, key=None, matrix=None, positions=None):
         """Initialize Playfair cipher with a key or matrix"""
         if matrix is not None:
-            self.matrix = matrix
             self.key = ""
         else:
             self.key = key.upper().replace('J', 'I')
-            self.matrix = self._create_matrix()
+            matrix = self._create_matrix()
+        # Frozen here, with the digraph tables built up front, so an instance
+        # holds no mutable state and can be shared between threads. positions
+        # is never modified after this point.
+        self.matrix = tuple(tuple(row) for row in matrix)
+        self.positions = positions if positions is not None else playfair_positions(self.matrix)
+        letters = [char for row in self.matrix for char in row]
+        # Byte -> index of the letter in the matrix; 25 for anything else
+        indexes = bytearray([25]) * 256
+        for i, char in enumerate(letters):
+            indexes[ord(char)] = i
+        self._letter_indexes = bytes(indexes)
+        self._digraph_tables = (self._build_digraph_table(letters, False),
+                                self._build_digraph_table(letters, True))
     
     def _create_matrix(self):
         """Create 5x5 Playfair matrix from key"""
@@ -38,11 +65,7 @@ class PlayfairCipher:
     
     def _find_position(self, char):
         """Find position of character in matrix"""
-        for i, row in enumerate(self.matrix):
-            for j, c in enumerate(row):
-                if c == char:
-                    return i, j
-        return None
+        return self.positions.get(char)
     
     def _prepare_text(self, text):
         """Prepare text for encryption (remove spaces, handle duplicates)"""
@@ -72,7 +95,10 @@ class PlayfairCipher:
     
     def encrypt(self, plaintext):
         """Encrypt plaintext using Playfair cipher"""
-        plaintext = self._prepare_text(plaintext)
+        return self.encrypt_prepared(self._prepare_text(plaintext))
+    
+    def encrypt_prepared(self, plaintext):
+        """Encrypt text already split into digraphs by _prepare_text"""
         ciphertext = ""
         
         for i in range(0, len(plaintext), 2):
@@ -111,19 +137,90 @@ class PlayfairCipher:
         
         return plaintext
     
+    def encrypt_bytes(self, data):
+        """Encrypt ASCII text held in bytes, bytearray, memoryview or mmap; returns bytes
+
+        Gives the same result as encrypt() without decoding the text to a
+        str. Characters other than letters are ignored.
+        """
+        return self.encrypt_prepared_bytes(self._prepare_bytes(data))
+    
+    def encrypt_prepared_bytes(self, data):
+        """Encrypt letters already split into digraphs by _prepare_bytes"""
+        return self._apply_digraphs(data, decrypt=False)
+    
+    def decrypt_bytes(self, data):
+        """Decrypt ASCII ciphertext held in a bytes-like object or mmap; returns bytes
+
+        Characters other than letters (e.g. line breaks) are ignored.
+        """
+        return self._apply_digraphs(self._letters(data), decrypt=True)
+    
+    def _letters(self, data):
+        """Upper-case letters of data with J merged into I, read piece by piece"""
+        pieces = []
+        with memoryview(data) as raw, raw.cast('B') as view:
+            for start in range(0, len(view), BYTES_CHUNK_SIZE):
+                chunk = bytes(view[start:start + BYTES_CHUNK_SIZE])
+                if not chunk.isascii():
+                    raise ValueError(f"Input is not ASCII text (near byte {start})")
+                pieces.append(chunk.translate(_TO_PLAYFAIR, _NON_LETTERS))
+        return b''.join(pieces)
+    
+    def _prepare_bytes(self, data):
+        """Bytes counterpart of _prepare_text: letters in digraphs, X between doubled letters"""
+        letters = self._letters(data)
+        parts = []
+        start = 0  # where the current digraph starts
+        for match in _DOUBLED.finditer(letters):
+            i = match.start()
+            if i >= start and (i - start) % 2 == 0:
+                # letters[i] and letters[i + 1] would form a digraph
+                parts.append(letters[start:i + 1])
+                parts.append(b'X')
+                start = i + 1
+        parts.append(letters[start:])
+        if (len(letters) + len(parts) // 2) % 2:
+            parts.append(b'X')
+        return b''.join(parts)
+    
+    def _apply_digraphs(self, letters, decrypt):
+        if len(letters) % 2:
+            raise ValueError("Playfair text must have an even number of letters")
+        rows = self._digraph_table(decrypt)
+        pieces = []
+        with memoryview(letters) as raw, raw.cast('B') as view:
+            for start in range(0, len(view), BYTES_CHUNK_SIZE):
+                indexes = bytes(view[start:start + BYTES_CHUNK_SIZE]).translate(self._letter_indexes)
+                try:
+                    pieces.append(b''.join(map(operator.getitem, map(rows.__getitem__, indexes[0::2]),
+                                               indexes[1::2])))
+                except IndexError:
+                    raise ValueError("Text contains a letter that is not in the Playfair matrix") from None
+        return b''.join(pieces)
+    
+    def _digraph_table(self, decrypt):
+        """Result of every digraph: row i, column j holds the result of matrix letters i and j"""
+        return self._digraph_tables[decrypt]
+    
+    def _build_digraph_table(self, letters, decrypt):
+        transform = self.decrypt if decrypt else self.encrypt_prepared
+        return tuple(tuple(transform(a + b).encode('ascii') for b in letters) for a in letters)
+    
     @classmethod
     def from_matrix(cls, table_content):
-        """Create PlayfairCipher from a table file content"""
-        # Parse the table - expecting 25 characters (5x5 matrix)
-        # Can be formatted as lines or continuous text
-        chars = ''.join(c.upper() for c in table_content if c.isalpha())
-        
-        if len(chars) != 25:
-            raise ValueError(f"Table must contain exactly 25 alphabetic characters, got {len(chars)}")
-        
-        # Create 5x5 matrix
-        matrix = []
-        for i in range(5):
-            matrix.append(list(chars[i*5:(i+1)*5]))
-        
-        return cls(matrix=matrix)
+        """Create PlayfairCipher from a table file content
+
+        Raises ValueError unless the table holds each letter except J exactly
+        once (5x5, as lines or continuous text).
+        """
+        return cls(matrix=parse_playfair_matrix(table_content))
+    
+    @classmethod
+    def from_matrix_file(cls, path):
+        """Create PlayfairCipher from a text matrix or a compiled table artifact"""
+        artifact, table_content = read_table_file(path)
+        if artifact is not None:
+            matrix, positions = load_artifact(artifact, KIND_PLAYFAIR)
+            return cls(matrix=matrix, positions=positions)
+        return cls.from_matrix(table_content)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Random-Access Reads of CBC Files
+CBC decryption of block i needs only ciphertext blocks i-1 and i, so any
+byte range of an AES or DES file ([header]IV||ciphertext, as written by
+encrypt_file and by encrypt_path without compression or authentication)
+can be decrypted on its own. CBCRangeReader seeks to the blocks a range
+covers, plus the block before them as IV, and decrypts only those; the
+padding is read only when a range reaches the end of the file. Previewing,
+head / tail and spot checks of huge files cost O(range), not O(file).
+
+    python range_reader.py head big.enc --cipher AES --key aes_key.txt -n 20
+    python range_reader.py tail big.enc --cipher AES --key aes_key.txt -c 4K
+    python range_reader.py range big.enc --cipher DES --key des_key.txt \\
+        --offset 1G --length 64K > slice.bin
+"""
+
+import argparse
+import io
+import os
+import sys
+
+from Crypto.Cipher import AES, DES
+from Crypto.Util.Padding import unpad
+
+from file_header import read_header
+from file_ops import check_header, load_cipher, parse_size
+
+# Block ciphers whose plain CBC files can be read at random
+RANGE_ALGORITHMS = {"AES": AES, "DES": DES}
+# Bytes read per step when head / tail search for line ends
+LINE_SCAN_SIZE = 64 * 1024
+
+
+class CBCRangeReader(io.RawIOBase):
+    """A seekable, read-only view of the plaintext of a CBC-encrypted file
+
+    Wrap it in io.BufferedReader or io.TextIOWrapper for buffered or text
+    reads. read_range() decrypts a byte range without moving the position.
+    """
+    def __init__(self, cipher, path):
+        super().__init__()
+        if cipher.name not in RANGE_ALGORITHMS:
+            raise ValueError(f"Random access needs AES or DES in CBC mode, not {cipher.name}")
+        self.algorithm = RANGE_ALGORITHMS[cipher.name]
+        self.key = cipher.key
+        self.block_size = self.algorithm.block_size
+        self._file = open(path, 'rb')
+        try:
+            self.header = read_header(self._file)
+            if self.header is not None:
+                check_header(cipher, self.header)
+                if self.header.mode != "CBC":
+                    raise ValueError(f"'{path}' uses {self.header.mode}; random access needs "
+                                     f"a plain CBC file")
+                if self.header.compression:
+                    raise ValueError(f"'{path}' is {self.header.compression}-compressed; random "
+                                     f"access needs an uncompressed file")
+            # Blocks are numbered from the IV (block 0) on
+            self._start = self._file.tell()
+            length = os.fstat(self._file.fileno()).st_size - self._start
+            if length < 2 * self.block_size or length % self.block_size:
+                raise ValueError(f"'{path}' is not a CBC file: its ciphertext is not a "
+                                 f"whole number of blocks")
+        except BaseException:
+            self._file.close()
+            raise
+        self._blocks = length // self.block_size - 1  # ciphertext blocks after the IV
+        self._size = None
+        self._pos = 0
+
+    @property
+    def size(self):
+        """Length of the plaintext; decrypts the last block to read the padding"""
+        if self._size is None:
+            last = self._decrypt_blocks(self._blocks - 1, self._blocks)
+            padding = self.block_size - len(unpad(last, self.block_size))
+            self._size = self._blocks * self.block_size - padding
+            if self.header is not None and self.header.original_size not in (None, self._size):
+                raise ValueError(f"The file holds {self._size} bytes but the header records "
+                                 f"{self.header.original_size}; it is truncated or corrupted")
+        return self._size
+
+    def _decrypt_blocks(self, first, end):
+        """Decrypt ciphertext blocks first..end-1, reading block first-1 as their IV"""
+        bs = self.block_size
+        self._file.seek(self._start + first * bs)
+        data = self._file.read((end - first + 1) * bs)
+        if len(data) != (end - first + 1) * bs:
+            raise ValueError("The file changed while it was being read")
+        with memoryview(data) as view:
+            return self.algorithm.new(self.key, self.algorithm.MODE_CBC,
+                                      view[:bs]).decrypt(view[bs:])
+
+    def read_range(self, offset, length):
+        """Decrypt plaintext bytes [offset, offset + length), clipped to the end"""
+        if offset < 0 or length < 0:
+            raise ValueError("Offset and length must not be negative")
+        bs = self.block_size
+        end = offset + length
+        if end > (self._blocks - 1) * bs:
+            # The range reaches the last block, which holds the padding
+            end = min(end, self.size)
+        if offset >= end:
+            return b''
+        first = offset // bs
+        plaintext = self._decrypt_blocks(first, (end + bs - 1) // bs)
+        return plaintext[offset - first * bs:end - first * bs]
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        with memoryview(b) as raw, raw.cast('B') as view:
+            data = self.read_range(self._pos, len(view))
+            view[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def readall(self):
+        return self.read(max(self.size - self._pos, 0))
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        elif whence != os.SEEK_SET:
+            raise ValueError(f"Invalid whence ({whence})")
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        self._pos = offset
+        return offset
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def read_range(cipher, path, offset, length):
+    """Decrypt bytes [offset, offset + length) of the plaintext of a CBC file"""
+    with CBCRangeReader(cipher, path) as reader:
+        return reader.read_range(offset, length)
+
+
+def head_lines(reader, count):
+    """The first count lines of the plaintext"""
+    if count <= 0:
+        return b''
+    data = b''
+    while data.count(b'\n') < count:
+        chunk = reader.read_range(len(data), LINE_SCAN_SIZE)
+        if not chunk:
+            return data
+        data += chunk
+    end = -1
+    for _ in range(count):
+        end = data.find(b'\n', end + 1)
+    return data[:end + 1]
+
+
+def tail_lines(reader, count):
+    """The last count lines of the plaintext"""
+    if count <= 0:
+        return b''
+    data = b''
+    pos = reader.size
+    # A final newline ends the last line rather than starting another one
+    while pos > 0 and data.count(b'\n', 0, len(data) - 1) < count:
+        start = max(pos - LINE_SCAN_SIZE, 0)
+        data = reader.read_range(start, pos - start) + data
+        pos = start
+    cut = len(data) - 1 if data.endswith(b'\n') else len(data)
+    for _ in range(count):
+        cut = data.rfind(b'\n', 0, cut)
+        if cut < 0:
+            return data
+    return data[cut + 1:]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decrypt part of an AES or DES CBC file "
+                                                 "without decrypting the rest")
+    parser.add_argument('command', choices=['head', 'tail', 'range'])
+    parser.add_argument('input')
+    parser.add_argument('--cipher', choices=list(RANGE_ALGORITHMS), required=True)
+    parser.add_argument('--key', required=True, help="Key file")
+    parser.add_argument('-n', '--lines', type=int, help="head / tail: number of lines "
+                                                         "(default: 10 unless -c is given)")
+    parser.add_argument('-c', '--bytes', type=parse_size, help="head / tail: number of bytes")
+    parser.add_argument('--offset', type=parse_size, default=0, help="range: first byte")
+    parser.add_argument('--length', type=parse_size, help="range: number of bytes (default: to the end)")
+    parser.add_argument('--output', help="Write here instead of standard output")
+    args = parser.parse_args(argv)
+
+    try:
+        cipher = load_cipher(args.cipher, args.key)
+        with CBCRangeReader(cipher, args.input) as reader:
+            if args.command == 'range':
+                length = args.length if args.length is not None else max(reader.size - args.offset, 0)
+                data = reader.read_range(args.offset, length)
+            elif args.bytes is not None:
+                start = 0 if args.command == 'head' else max(reader.size - args.bytes, 0)
+                data = reader.read_range(start, args.bytes)
+            else:
+                lines = 10 if args.lines is None else args.lines
+                data = (head_lines if args.command == 'head' else tail_lines)(reader, lines)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(data)
+    else:
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Streaming Re-encryption and Key Rotation
+Decrypts files with an old cipher/key and encrypts them with a new one chunk
+by chunk, so plaintext never touches disk. Runs files in parallel, records
+finished files in a checkpoint manifest so an interrupted run can resume,
+and reports progress and throughput. The manifest names the rotation it
+belongs to (ciphers, key fingerprints, inputs and target) and is only
+resumed by the same rotation; it is deleted once a run completes.
+
+Example (DES store to AES-256, in place):
+    python reencrypt.py --old-cipher DES --old-key old_des.txt \\
+        --new-cipher AES --new-key new_aes256.txt --in-place store/
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from atomic_output import DEFAULT_FSYNC, FSYNC_BATCH, FSYNC_POLICIES, AtomicOutput, SyncBatch
+from compression import COMPRESSION_METHODS, TransformChain
+from file_ops import (AUTO_CIPHER, CIPHERS, collect_files, format_size, load_cipher, open_decryptor,
+                      open_encryptor)
+from pipeline import PipelineExecutor
+from stream_cipher import DEFAULT_CHUNK_SIZE, run_transform
+
+MANIFEST_VERSION = 2
+
+
+def reencrypt_file(input_path, output_path, old_cipher, new_cipher, compression=None,
+                   authenticated=False, chunk_size=DEFAULT_CHUNK_SIZE, fsync=DEFAULT_FSYNC,
+                   sync_batch=None):
+    """Re-encrypt one file; returns (bytes_in, bytes_out)
+
+    The result is written to a temporary file next to output_path and
+    renamed into place on success (see atomic_output for fsync and
+    sync_batch), so output_path may equal input_path.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(input_path, 'rb') as src, \
+            AtomicOutput(output_path, fsync, sync_batch=sync_batch) as dst:
+        old_header, decryptor = open_decryptor(old_cipher, src, chunk_size)
+        prefix_len = src.tell()
+        original_size = old_header.original_size if old_header is not None else None
+        prefix, encryptor = open_encryptor(new_cipher, compression, authenticated, original_size)
+        dst.write(prefix)
+        transform = TransformChain([decryptor, encryptor])
+        bytes_in, bytes_out = run_transform(transform, src, dst, chunk_size,
+                                            executor=PipelineExecutor(chunk_size))
+    return bytes_in + prefix_len, bytes_out + len(prefix)
+
+
+def rotation_id(inputs, old_cipher, new_cipher, output_dir=None):
+    """What a checkpoint manifest belongs to; a manifest is only resumed by the same rotation"""
+    return {'old_cipher': old_cipher.name, 'old_key': old_cipher.fingerprint(),
+            'new_cipher': new_cipher.name, 'new_key': new_cipher.fingerprint(),
+            'inputs': sorted(os.path.abspath(path) for path in inputs),
+            'output_dir': os.path.abspath(output_dir) if output_dir else None}
+
+
+class CheckpointManifest:
+    """JSON record of finished files, rewritten atomically after each one
+
+    A manifest written for another rotation (or by an older version, which
+    did not record one) is ignored and replaced: its files are not skipped.
+    """
+    def __init__(self, path, rotation=None):
+        self.path = path
+        self.rotation = rotation
+        self.stale = False
+        self._lock = threading.Lock()
+        self.done = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            version = data.get('version')
+            if version not in (1, MANIFEST_VERSION):
+                raise ValueError(f"Unsupported checkpoint manifest version in '{path}'")
+            if version == MANIFEST_VERSION and data.get('rotation') == rotation:
+                self.done = data.get('done', {})
+            else:
+                self.stale = True
+
+    def is_done(self, rel_path):
+        return rel_path in self.done
+
+    def mark_done(self, rel_path, bytes_in, bytes_out):
+        with self._lock:
+            self.done[rel_path] = {'bytes_in': bytes_in, 'bytes_out': bytes_out,
+                                   'finished': time.strftime('%Y-%m-%dT%H:%M:%S')}
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'rotation': self.rotation, 'done': self.done},
+                      f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        """Delete the manifest once its rotation has completed"""
+        if self.path:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def reencrypt_batch(inputs, old_cipher, new_cipher, output_dir=None, manifest_path=None,
+                    workers=4, compression=None, authenticated=False, progress=print,
+                    fsync=FSYNC_BATCH):
+    """Re-encrypt many files in parallel; returns (files_done, failures)
+
+    Without output_dir files are replaced in place. Files already recorded in
+    the manifest are skipped, so re-running the same rotation after an
+    interruption resumes. A file is only recorded once it is in place and,
+    unless fsync='never', on disk; with fsync='batch' that happens when its
+    batch is committed. The manifest is deleted when every file succeeded.
+    """
+    manifest = CheckpointManifest(manifest_path,
+                                  rotation_id(inputs, old_cipher, new_cipher, output_dir))
+    if manifest.stale:
+        progress(f"Ignoring checkpoint '{manifest_path}': it belongs to a different rotation")
+    # Final path -> (rel, input size) of files waiting for their batch commit
+    uncommitted = {}
+
+    def committed(target):
+        with lock:
+            rel, bytes_in = uncommitted.pop(os.path.abspath(target))
+        manifest.mark_done(rel, bytes_in, os.path.getsize(target))
+
+    sync_batch = SyncBatch(on_commit=committed) if fsync == FSYNC_BATCH else None
+    files = collect_files(inputs)
+    # Never pick up our own checkpoint or leftover temporary files
+    skip = {os.path.abspath(manifest_path)} if manifest_path else set()
+    todo = [(path, rel) for path, rel in files
+            if os.path.abspath(path) not in skip and not rel.endswith('.partial')
+            and not manifest.is_done(rel)]
+    if len(todo) < len(files):
+        progress(f"Resuming: {len(files) - len(todo)} file(s) already done")
+
+    total_bytes = sum(os.path.getsize(path) for path, _ in todo)
+    stats = {'files': 0, 'bytes': 0}
+    failures = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+
+    def work(path, rel):
+        target = os.path.join(output_dir, rel) if output_dir else path
+        if sync_batch is None:
+            bytes_in, bytes_out = reencrypt_file(path, target, old_cipher, new_cipher,
+                                                 compression, authenticated, fsync=fsync)
+            manifest.mark_done(rel, bytes_in, bytes_out)
+            return bytes_in
+        # Register before the file is queued: a full batch may commit it right away
+        with lock:
+            uncommitted[os.path.abspath(target)] = (rel, os.path.getsize(path))
+        try:
+            bytes_in, _ = reencrypt_file(path, target, old_cipher, new_cipher, compression,
+                                         authenticated, fsync=fsync, sync_batch=sync_batch)
+        except BaseException:
+            with lock:
+                uncommitted.pop(os.path.abspath(target), None)
+            raise
+        return bytes_in
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(work, path, rel): rel for path, rel in todo}
+            for future in as_completed(futures):
+                rel = futures[future]
+                try:
+                    size = future.result()
+                except Exception as e:
+                    failures.append((rel, str(e)))
+                    progress(f"FAILED {rel}: {e}")
+                    continue
+                with lock:
+                    stats['files'] += 1
+                    stats['bytes'] += size
+                    elapsed = max(time.perf_counter() - start, 1e-9)
+                    progress(f"[{stats['files']}/{len(todo)}] {rel} "
+                             f"({format_size(stats['bytes'])} of {format_size(total_bytes)}, "
+                             f"{stats['bytes'] / elapsed / 1024 / 1024:.1f} MiB/s)")
+    finally:
+        if sync_batch is not None:
+            sync_batch.commit()
+    if not failures:
+        manifest.remove()
+    return stats['files'], failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-encrypt files from one cipher/key to another "
+                                                 "without writing plaintext to disk")
+    parser.add_argument('inputs', nargs='+', help="Files or directories to re-encrypt")
+    parser.add_argument('--old-cipher', choices=list(CIPHERS), required=True)
+    parser.add_argument('--old-key', required=True, help="Key file for the current encryption")
+    parser.add_argument('--new-cipher', choices=list(CIPHERS) + [AUTO_CIPHER], required=True)
+    parser.add_argument('--new-key', required=True, help="Key file for the new encryption")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--output-dir', help="Write re-encrypted files here (mirrors input layout)")
+    target.add_argument('--in-place', action='store_true', help="Replace each file atomically")
+    parser.add_argument('--manifest', default='reencrypt_checkpoint.json',
+                        help="Checkpoint manifest used to resume an interrupted run; deleted "
+                             "when the run completes (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--compression', choices=COMPRESSION_METHODS)
+    parser.add_argument('--authenticated', action='store_true',
+                        help="Write authenticated output (AES-GCM / DES CBC-HMAC; "
+                             "ChaCha20 always is)")
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default=FSYNC_BATCH,
+                        help="When re-encrypted files are forced to disk: never, after each "
+                             "file, or in batches (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    try:
+        old_cipher = load_cipher(args.old_cipher, args.old_key)
+        new_cipher = load_cipher(args.new_cipher, args.new_key)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 2
+
+    start = time.perf_counter()
+    done, failures = reencrypt_batch(args.inputs, old_cipher, new_cipher, args.output_dir,
+                                     args.manifest, args.workers, args.compression,
+                                     args.authenticated or args.new_cipher == AUTO_CIPHER,
+                                     fsync=args.fsync)
+    print(f"Re-encrypted {done} file(s) in {time.perf_counter() - start:.1f}s, "
+          f"{len(failures)} failure(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
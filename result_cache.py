@@ -0,0 +1,210 @@
+"""
+Result Cache for Batch Runs
+Persistent record of completed encrypt/decrypt operations, so repeated batch
+runs can skip files whose output is already current.
+
+An entry is keyed on input path, cipher, key fingerprint, operation, options
+and output path, and stores the input's size, mtime and a fast content hash
+together with the output's size and mtime. A file is skipped when its input
+is unchanged (same size and mtime, or same content hash after a touch) and
+its output still exists unmodified. Callers that read the input anyway
+stat it before processing and hash it in the same pass (new_content_hash),
+then pass both to record(); an input that changes while it is processed is
+not recorded. Entries carry an (unkeyed) checksum that detects corruption,
+not deliberate edits, the database is integrity-checked on open, and the
+least recently used entries are evicted beyond a size bound.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_MAX_ENTRIES = 100000
+_HASH_CHUNK = 1024 * 1024
+# Stored when the input was not hashed; a touched input is then a miss
+UNKNOWN_HASH = ''
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    input_path TEXT NOT NULL,
+    cipher TEXT NOT NULL,
+    key_fingerprint TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    options TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    input_size INTEGER NOT NULL,
+    input_mtime_ns INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    output_size INTEGER NOT NULL,
+    output_mtime_ns INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    checksum TEXT NOT NULL,
+    PRIMARY KEY (input_path, cipher, key_fingerprint, operation, options, output_path)
+)
+"""
+_KEY_COLUMNS = ('input_path', 'cipher', 'key_fingerprint', 'operation', 'options', 'output_path')
+_VALUE_COLUMNS = ('input_size', 'input_mtime_ns', 'content_hash', 'output_size', 'output_mtime_ns')
+_WHERE_KEY = " AND ".join(f"{column} = ?" for column in _KEY_COLUMNS)
+
+
+def new_content_hash():
+    """Hash object for content_hash, for callers that hash an input while reading it"""
+    return hashlib.blake2b(digest_size=16)
+
+
+def content_hash(path):
+    """Fast content hash of a file (BLAKE2b, 128-bit)"""
+    h = new_content_hash()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(_HASH_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _entry_key(input_path, cipher, key_fingerprint, operation, options, output_path):
+    return (os.path.abspath(input_path), cipher, key_fingerprint, operation, options,
+            os.path.abspath(output_path))
+
+
+def _checksum(values):
+    return hashlib.blake2b('\x1f'.join(str(v) for v in values).encode('utf-8'),
+                           digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """SQLite-backed cache of batch results; safe to share between threads"""
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = self._open()
+
+    def _open(self):
+        """Open the database, discarding it if it fails the integrity check"""
+        try:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            if conn.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+                raise sqlite3.DatabaseError("integrity check failed")
+            conn.execute(_SCHEMA)
+            return conn
+        except sqlite3.DatabaseError:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            for suffix in ('', '-journal', '-wal'):
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute(_SCHEMA)
+            return conn
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def lookup(self, input_path, cipher, key_fingerprint, operation, options, output_path,
+               verify_content=False):
+        """Return True if output_path is a current result for input_path
+
+        verify_content=True re-hashes the input even when size and mtime match.
+        """
+        key = _entry_key(input_path, cipher, key_fingerprint, operation, options, output_path)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_VALUE_COLUMNS)}, checksum FROM results WHERE " + _WHERE_KEY,
+                key).fetchone()
+        if row is None:
+            return False
+        values, checksum = row[:-1], row[-1]
+        if _checksum(key + tuple(values)) != checksum:
+            # Corrupted entry: drop it and treat as a miss. The checksum is not
+            # keyed, so it catches damage, not an entry rewritten on purpose
+            self._delete(key)
+            return False
+        input_size, input_mtime_ns, stored_hash, output_size, output_mtime_ns = values
+
+        try:
+            in_stat = os.stat(input_path)
+            out_stat = os.stat(output_path)
+        except FileNotFoundError:
+            return False
+        if out_stat.st_size != output_size or out_stat.st_mtime_ns != output_mtime_ns:
+            return False
+        if in_stat.st_size != input_size:
+            return False
+        if in_stat.st_mtime_ns != input_mtime_ns or verify_content:
+            # Touched (or verification requested): fall back to the content hash
+            if stored_hash == UNKNOWN_HASH or content_hash(input_path) != stored_hash:
+                return False
+            self._store(key, (input_size, in_stat.st_mtime_ns, stored_hash, output_size,
+                              output_mtime_ns))
+        else:
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE results SET last_used = ? WHERE " + _WHERE_KEY,
+                                   (time.time(),) + key)
+                self._conn.commit()
+        return True
+
+    def record(self, input_path, cipher, key_fingerprint, operation, options, output_path,
+               input_hash=None, input_stat=None):
+        """Record that output_path was produced from input_path
+
+        input_stat is os.stat(input_path) from before processing, and
+        input_hash the content hash of the bytes processed (UNKNOWN_HASH if
+        they were not hashed). Nothing is recorded if the input has changed
+        since input_stat. Without them the input is stat'ed and hashed now.
+        Returns True if the entry was stored.
+        """
+        key = _entry_key(input_path, cipher, key_fingerprint, operation, options, output_path)
+        current = os.stat(input_path)
+        if input_stat is None:
+            input_stat = current
+        elif (current.st_size, current.st_mtime_ns) != (input_stat.st_size, input_stat.st_mtime_ns):
+            return False
+        if input_hash is None:
+            input_hash = content_hash(input_path)
+        out_stat = os.stat(output_path)
+        values = (input_stat.st_size, input_stat.st_mtime_ns, input_hash,
+                  out_stat.st_size, out_stat.st_mtime_ns)
+        self._store(key, values)
+        return True
+
+    def _store(self, key, values):
+        row = key + values + (time.time(), _checksum(key + values))
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO results ({', '.join(_KEY_COLUMNS + _VALUE_COLUMNS)}, "
+                f"last_used, checksum) VALUES ({', '.join('?' * len(row))})", row)
+            self._evict()
+            self._conn.commit()
+
+    def _delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM results WHERE " + _WHERE_KEY, key)
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop least recently used entries beyond max_entries (lock held)"""
+        count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM results WHERE rowid IN "
+                "(SELECT rowid FROM results ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
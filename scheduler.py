@@ -0,0 +1,396 @@
+"""
+Hybrid Batch Scheduler
+Real batches mix a few very large files with many tiny ones. One task per
+file leaves workers idle while the large files finish, and one task per
+chunk costs more in overhead than the tiny files take to process. The
+scheduler does both:
+
+    large files     (split_size and up) are split into chunk tasks where
+                    the cipher mode allows it: CBC decryption of
+                    [header]IV||ciphertext (each chunk's IV is the
+                    ciphertext block before it) and Vigenère, whose chunks
+                    start at the key position given by the number of
+                    letters before them (counted in a first parallel pass)
+    small files     (below pack_size) are packed into combined tasks of up
+                    to pack_bytes / pack_files
+    everything else runs as one task per file, including CBC encryption,
+                    which is sequential by construction, and authenticated
+                    or compressed files
+
+Tasks go to per-worker queues largest first; a worker that runs out of work
+steals from the queue with the most work left. Workers are threads, since
+PyCryptodome releases the GIL while it encrypts.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from functools import partial
+from itertools import accumulate
+
+from Crypto.Cipher import AES, DES
+from Crypto.Util.Padding import unpad
+
+from atomic_output import DEFAULT_FSYNC, AtomicOutput
+from file_header import peek_header
+from file_ops import OperationReport, check_header
+
+SPLIT_SIZE = 64 * 1024 * 1024
+SPLIT_CHUNK_SIZE = 8 * 1024 * 1024
+PACK_SIZE = 256 * 1024
+PACK_BYTES = 4 * 1024 * 1024
+PACK_FILES = 64
+
+# Block ciphers whose plain CBC files can be decrypted in chunks
+_CBC_ALGORITHMS = {"AES": AES, "DES": DES}
+
+
+class WorkStealingPool:
+    """Runs (cost, function) tasks on worker threads that each own a queue
+
+    run() deals the tasks largest first, each to the queue with the least
+    work. A worker takes from the front of its own queue; an idle worker
+    steals from the back of the queue with the most work left. A running
+    task may submit() more tasks, which go to the front of its worker's
+    queue. Exceptions escaping a task are collected in errors.
+    """
+    def __init__(self, workers):
+        self.workers = max(1, workers)
+        self.errors = []
+        self.steals = 0
+        self._queues = [deque() for _ in range(self.workers)]
+        self._loads = [0] * self.workers  # queued cost per worker
+        self._pending = 0  # tasks queued or running
+        self._cond = threading.Condition()
+        self._local = threading.local()
+
+    def submit(self, cost, function):
+        """Queue a task; thread-safe, and may be called from a running task"""
+        with self._cond:
+            index = getattr(self._local, 'index', None)
+            if index is None:
+                index = min(range(self.workers), key=self._loads.__getitem__)
+                self._queues[index].append((cost, function))
+            else:
+                self._queues[index].appendleft((cost, function))
+            self._loads[index] += cost
+            self._pending += 1
+            self._cond.notify()
+
+    def run(self, tasks=()):
+        """Run tasks (and everything they submit) to completion; returns errors"""
+        for cost, function in sorted(tasks, key=lambda task: task[0], reverse=True):
+            self.submit(cost, function)
+        threads = [threading.Thread(target=self._worker, args=(i,), daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except BaseException:
+            self.cancel()
+            raise
+        return self.errors
+
+    def cancel(self):
+        """Drop all queued tasks; running ones finish"""
+        with self._cond:
+            for index, queue in enumerate(self._queues):
+                self._pending -= len(queue)
+                queue.clear()
+                self._loads[index] = 0
+            self._cond.notify_all()
+
+    def _take(self, index):
+        if self._queues[index]:
+            return self._queues[index].popleft(), index
+        victim = max(range(self.workers), key=lambda i: (self._loads[i], len(self._queues[i])))
+        if self._queues[victim]:
+            self.steals += 1
+            return self._queues[victim].pop(), victim
+        return None, None
+
+    def _worker(self, index):
+        self._local.index = index
+        while True:
+            with self._cond:
+                task, owner = self._take(index)
+                while task is None and self._pending:
+                    self._cond.wait()
+                    task, owner = self._take(index)
+                if task is None:
+                    return
+                self._loads[owner] -= task[0]
+            try:
+                task[1]()
+            except Exception as e:
+                with self._cond:
+                    self.errors.append(e)
+            finally:
+                with self._cond:
+                    self._pending -= 1
+                    if not self._pending:
+                        self._cond.notify_all()
+
+
+def pack(items, size_of, pack_bytes=PACK_BYTES, pack_files=PACK_FILES):
+    """Group small items into lists of at most pack_files items / about pack_bytes"""
+    group, total = [], 0
+    for item in items:
+        group.append(item)
+        total += size_of(item)
+        if len(group) >= pack_files or total >= pack_bytes:
+            yield group
+            group, total = [], 0
+    if group:
+        yield group
+
+
+class _SplitJob:
+    """One file processed as chunk tasks that write into a shared AtomicOutput
+
+    Chunks run in phases (a subclass lists one method per phase); the last
+    chunk of a phase starts the next one, and the last chunk of the last
+    phase completes the file and calls on_done(report, error).
+    """
+    phases = ()
+
+    def __init__(self, operation, input_path, output_path, offset, length, output_length,
+                 chunk_size, on_done, fsync, sync_batch):
+        self.input_path = input_path
+        self.offset = offset  # where the chunked data starts in the input
+        self.length = length
+        self.starts = range(0, length, chunk_size)
+        self.chunk_size = chunk_size
+        self.on_done = on_done
+        self.report = OperationReport(operation, "split", chunk_size)
+        self.report.bytes_in = os.path.getsize(input_path)
+        self.output = AtomicOutput(output_path, fsync, sync_batch=sync_batch)
+        self._error = None
+        self._lock = threading.Lock()
+        self._start_time = None
+        try:
+            self.output.truncate(output_length)
+        except BaseException:
+            self.output.discard()
+            raise
+
+    def start(self, submit):
+        """Submit the first phase's tasks through submit(cost, function)"""
+        self._submit = submit
+        self._start_time = time.perf_counter()
+        self._start_phase(0)
+
+    def _start_phase(self, phase):
+        self._remaining = len(self.starts)
+        run = self.phases[phase]
+        for i, start in enumerate(self.starts):
+            self._submit(min(self.chunk_size, self.length - start),
+                         partial(self._run, phase, run, i))
+
+    def _run(self, phase, run, i):
+        if self._error is None:
+            try:
+                run(self, i)
+            except Exception as e:
+                with self._lock:
+                    self._error = self._error or e
+        with self._lock:
+            self._remaining -= 1
+            last = not self._remaining
+        if not last:
+            return
+        if self._error is None and phase + 1 < len(self.phases):
+            self._start_phase(phase + 1)
+            return
+        try:
+            if self._error is not None:
+                raise self._error
+            self.report.bytes_out = self.complete()
+            self.output.commit()
+        except Exception as e:
+            self.output.discard()
+            self.report.elapsed = time.perf_counter() - self._start_time
+            self.on_done(self.report, e)
+            return
+        self.report.elapsed = time.perf_counter() - self._start_time
+        self.on_done(self.report, None)
+
+    def complete(self):
+        """Finish the output after the last chunk; returns its size"""
+        return self.length
+
+    def _read(self, start, size):
+        with open(self.input_path, 'rb') as f:
+            f.seek(self.offset + start)
+            return f.read(size)
+
+    def _write(self, start, data):
+        with open(self.output.tmp_path, 'r+b') as f:
+            f.seek(start)
+            f.write(data)
+
+
+class CBCDecryptJob(_SplitJob):
+    """Decrypts a plain CBC file ([header]IV||ciphertext) in parallel chunks"""
+    def __init__(self, cipher, input_path, output_path, header, chunk_size, on_done,
+                 fsync=DEFAULT_FSYNC, sync_batch=None):
+        self.algorithm = _CBC_ALGORITHMS[cipher.name]
+        self.key = cipher.key
+        self.header = header
+        block = self.algorithm.block_size
+        offset = (len(header.raw) if header is not None else 0) + block
+        length = os.path.getsize(input_path) - offset
+        self._padding = None
+        super().__init__("decrypt", input_path, output_path, offset, length, length,
+                         max(chunk_size - chunk_size % block, block), on_done, fsync, sync_batch)
+
+    def _decrypt(self, i):
+        block = self.algorithm.block_size
+        start = self.starts[i]
+        size = min(self.chunk_size, self.length - start)
+        # The block before the chunk is its IV (the file's IV for the first chunk)
+        data = self._read(start - block, size + block)
+        if len(data) != size + block:
+            raise ValueError(f"'{self.input_path}' changed while it was being read")
+        plaintext = self.algorithm.new(self.key, self.algorithm.MODE_CBC,
+                                       data[:block]).decrypt(memoryview(data)[block:])
+        if start + size == self.length:
+            self._padding = block - len(unpad(plaintext[-block:], block))
+        self._write(start, plaintext)
+
+    phases = (_decrypt,)
+
+    def complete(self):
+        size = self.length - self._padding
+        self.output.truncate(size)
+        if self.header is not None and self.header.original_size not in (None, size):
+            raise ValueError(f"Decrypted {size} bytes but the header records "
+                             f"{self.header.original_size}; the file is truncated or corrupted")
+        return size
+
+
+class VigenereJob(_SplitJob):
+    """Encrypts or decrypts a Vigenère text file in parallel chunks
+
+    The first phase counts the letters of every chunk, the second
+    transforms each chunk starting at the key offset of the letters before it.
+    """
+    def __init__(self, cipher, operation, input_path, output_path, chunk_size, on_done,
+                 fsync=DEFAULT_FSYNC, sync_batch=None):
+        self.cipher = cipher
+        self.transform = cipher.encrypt_bytes if operation == "encrypt" else cipher.decrypt_bytes
+        length = os.path.getsize(input_path)
+        self._counts = [0] * len(range(0, length, chunk_size))
+        self._offsets = None
+        super().__init__(operation, input_path, output_path, 0, length, length, chunk_size,
+                         on_done, fsync, sync_batch)
+
+    def _count(self, i):
+        self._counts[i] = self.cipher.count_letters(self._read(self.starts[i], self.chunk_size))
+
+    def _transform(self, i):
+        if self._offsets is None:
+            with self._lock:
+                if self._offsets is None:
+                    self._offsets = [0, *accumulate(self._counts)]
+        start = self.starts[i]
+        data = self._read(start, self.chunk_size)
+        out = bytearray(len(data))
+        self.transform(data, out=out, key_offset=self._offsets[i])
+        self._write(start, out)
+
+    phases = (_count, _transform)
+
+
+def split_job(cipher, operation, input_path, output_path, on_done, chunk_size=SPLIT_CHUNK_SIZE,
+              fsync=DEFAULT_FSYNC, sync_batch=None):
+    """A job that processes input_path in parallel chunks, or None if its mode is sequential
+
+    on_done(report, error) is called once the output is in place (or has
+    been discarded). Start the job with job.start(pool.submit).
+    """
+    if os.path.getsize(input_path) == 0:
+        return None
+    if getattr(cipher, 'preserves_length', False) and hasattr(cipher, 'count_letters'):
+        return VigenereJob(cipher, operation, input_path, output_path, chunk_size, on_done,
+                           fsync, sync_batch)
+    if operation != "decrypt" or getattr(cipher, 'name', None) not in _CBC_ALGORITHMS:
+        return None
+    header = peek_header(input_path)
+    if header is not None:
+        check_header(cipher, header)
+        if header.mode != "CBC" or header.compression:
+            return None
+    block = _CBC_ALGORITHMS[cipher.name].block_size
+    length = os.path.getsize(input_path) - (len(header.raw) if header is not None else 0) - block
+    if length <= 0 or length % block:
+        return None  # malformed; the whole-file path reports it
+    return CBCDecryptJob(cipher, input_path, output_path, header, chunk_size, on_done,
+                         fsync, sync_batch)
+
+
+def schedule_files(cipher, operation, pairs, workers=None, split_size=SPLIT_SIZE,
+                   pack_size=PACK_SIZE, fsync=DEFAULT_FSYNC, sync_batch=None):
+    """Process (input, output) path pairs with the hybrid scheduler
+
+    Works with every cipher: file ciphers run through encrypt_path /
+    decrypt_path, Vigenère and Playfair through process_text_file. Returns
+    ({output: OperationReport or (bytes_in, bytes_out)}, [(input, error)]).
+    """
+    from file_ops import decrypt_path, encrypt_path, process_text_file
+
+    results = {}
+    failures = []
+    lock = threading.Lock()
+    pool = WorkStealingPool(workers or os.cpu_count() or 1)
+
+    def whole(input_path, output_path):
+        try:
+            if hasattr(cipher, 'encrypt_bytes'):
+                result = process_text_file(cipher, operation, input_path, output_path,
+                                           fsync=fsync, sync_batch=sync_batch)
+            else:
+                process = encrypt_path if operation == "encrypt" else decrypt_path
+                result = process(cipher, input_path, output_path, track_memory=False,
+                                 fsync=fsync, sync_batch=sync_batch)
+        except Exception as e:
+            with lock:
+                failures.append((input_path, str(e)))
+            return
+        with lock:
+            results[output_path] = result
+
+    def large(input_path, output_path):
+        def done(report, error):
+            with lock:
+                if error is None:
+                    results[output_path] = report
+                else:
+                    failures.append((input_path, str(error)))
+        try:
+            job = split_job(cipher, operation, input_path, output_path, done,
+                            fsync=fsync, sync_batch=sync_batch)
+        except Exception as e:
+            with lock:
+                failures.append((input_path, str(e)))
+            return
+        if job is None:
+            whole(input_path, output_path)
+        else:
+            job.start(pool.submit)
+
+    def packed(group):
+        for input_path, output_path, _ in group:
+            whole(input_path, output_path)
+
+    sized = [(i, o, os.path.getsize(i)) for i, o in pairs]
+    tasks = [(size, partial(large if size >= split_size else whole, i, o))
+             for i, o, size in sized if size >= pack_size]
+    tasks += [(sum(size for _, _, size in group), partial(packed, group))
+              for group in pack((item for item in sized if item[2] < pack_size),
+                                lambda item: item[2])]
+    pool.run(tasks)
+    return results, failures
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Local Encryption Service
+Long-running asyncio server that keeps parsed keys, Playfair matrices and
+Vigenère tables in memory and serves encrypt/decrypt requests for every
+cipher over a Unix domain socket or localhost TCP, so small requests avoid
+interpreter startup, imports and key parsing. See service_client.py for the
+client and the wire format.
+
+Requests on one connection may be pipelined; each connection has a cap on
+requests in flight and the whole service a cap on concurrent cipher work.
+AES/DES/ChaCha20 payloads are the binary format of encrypt_file
+(IV||ciphertext, or nonce||ciphertext||tag for ChaCha20);
+Playfair and Vigenère payloads are ASCII text.
+
+Key and table files are only read from the key directory given at start.
+The Unix socket accepts connections from the service's own user only;
+TCP connections must first authenticate with the shared token.
+
+    python service.py --key-dir keys                   # Unix socket (default path)
+    python service.py --key-dir keys --tcp 8765 --token-file token.txt
+    python service.py --key-dir keys --metrics-port 9464   # plus Prometheus metrics over HTTP
+"""
+
+import argparse
+import asyncio
+import hmac
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from aes_cipher import AESCipher
+from chacha_cipher import ChaCha20Cipher
+from des_cipher import DESCipher
+from key_provider import DEFAULT_TTL, PROVIDER
+from metrics import METRICS, SnapshotWriter
+from playfair_cipher import PlayfairCipher
+from service_client import FRAME, MAX_MESSAGE_SIZE, default_address
+from vigenere_cipher import VigenereCipher
+
+DEFAULT_MAX_CONCURRENCY = os.cpu_count() or 4
+DEFAULT_MAX_IN_FLIGHT = 64
+DEFAULT_CACHE_ENTRIES = 256
+# Binary payloads up to this size are processed on the event loop; the
+# thread hand-off would cost more than the cipher work
+INLINE_LIMIT = 64 * 1024
+
+# Ciphers whose payloads are binary file data (encrypt_file / decrypt_file)
+BINARY_CIPHERS = {"AES": AESCipher, "DES": DESCipher, "CHACHA20": ChaCha20Cipher}
+CIPHER_NAMES = (*BINARY_CIPHERS, "Playfair", "Vigenere")
+
+
+class KeyAccessError(Exception):
+    """A key or table file is outside the key directory or cannot be loaded"""
+
+
+def _read_text(path):
+    with open(path, 'r', encoding='ascii') as f:
+        return f.read().strip()
+
+
+def build_cipher(name, key_file=None, table_file=None):
+    """Parse key/table files (text or compiled table artifacts) into a cipher object"""
+    if name in BINARY_CIPHERS:
+        if not key_file:
+            raise ValueError(f"{name} requires key_file")
+        return BINARY_CIPHERS[name].from_key_file(key_file)
+    if name == "Playfair":
+        if not table_file:
+            raise ValueError("Playfair requires table_file")
+        return PlayfairCipher.from_matrix_file(table_file)
+    if name == "Vigenere":
+        if not (key_file and table_file):
+            raise ValueError("Vigenere requires key_file and table_file")
+        return VigenereCipher.from_table_file(_read_text(key_file), table_file)
+    raise ValueError(f"Unknown cipher '{name}'")
+
+
+class CipherCache:
+    """Parsed ciphers by (cipher, key file, table file), reloaded when a file changes
+
+    Only files under key_dir are loaded. Requests name them relative to it
+    or by absolute path; any other path, and any file that fails to load,
+    raises KeyAccessError without details, so clients cannot probe files
+    the service can read but they cannot.
+    """
+    def __init__(self, key_dir, max_entries=DEFAULT_CACHE_ENTRIES):
+        self.key_dir = os.path.realpath(key_dir)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, path):
+        """Real path of a key or table file, which must lie under key_dir"""
+        if path is None:
+            return None
+        if not isinstance(path, str):
+            raise KeyAccessError("Key and table files must be given as paths")
+        real = os.path.realpath(os.path.join(self.key_dir, path))
+        if os.path.commonpath([real, self.key_dir]) != self.key_dir:
+            raise KeyAccessError("Key and table files must be in the service's key directory")
+        return real
+
+    def _stamp(self, name, key_file, table_file):
+        """(cache key, modification stamp) of a request's files"""
+        if name not in CIPHER_NAMES:
+            raise ValueError(f"Unknown cipher '{name}'")
+        key_file, table_file = self.resolve(key_file), self.resolve(table_file)
+        try:
+            stamp = tuple(os.stat(p).st_mtime_ns for p in (key_file, table_file) if p)
+        except OSError:
+            raise KeyAccessError(f"Cannot load the key or table for {name}") from None
+        return (name, key_file, table_file), stamp
+
+    def cached(self, name, key_file=None, table_file=None):
+        """The cached cipher if its files have not changed, else None; never loads a file"""
+        key, stamp = self._stamp(name, key_file, table_file)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                return entry[1]
+        return None
+
+    def get(self, name, key_file=None, table_file=None):
+        """The cipher for a request, loading its files (and running any key KDF) if needed"""
+        cipher = self.cached(name, key_file, table_file)
+        if cipher is not None:
+            return cipher
+        key, stamp = self._stamp(name, key_file, table_file)
+        name, key_file, table_file = key
+        try:
+            cipher = build_cipher(name, key_file, table_file)
+        except Exception:
+            raise KeyAccessError(f"Cannot load the key or table for {name}") from None
+        with self._lock:
+            self._entries[key] = (stamp, cipher)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return cipher
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def process(cipher, op, data):
+    """Run one encrypt/decrypt request against a cached cipher"""
+    if isinstance(cipher, tuple(BINARY_CIPHERS.values())):
+        return cipher.encrypt_file(data) if op == "encrypt" else cipher.decrypt_file(data)
+    text = data.decode('ascii')
+    result = cipher.encrypt(text) if op == "encrypt" else cipher.decrypt(text)
+    return result.encode('ascii')
+
+
+class EncryptionService:
+    """Serves framed requests; see service_client for the protocol"""
+    def __init__(self, key_dir, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, cache_entries=DEFAULT_CACHE_ENTRIES,
+                 metrics=METRICS, token=None):
+        self.ciphers = CipherCache(key_dir, cache_entries)
+        self.metrics = metrics
+        self.token = token
+        self.max_in_flight = max_in_flight
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency,
+                                        thread_name_prefix="service-worker")
+        self._work_slots = None
+        self._max_concurrency = max_concurrency
+
+    async def handle_connection(self, reader, writer):
+        sock = writer.get_extra_info('socket')
+        tcp = sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6)
+        if tcp:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        elif not _same_user(sock):
+            writer.close()
+            return
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        tasks = set()
+        try:
+            if tcp and not await self._authenticate(reader, writer):
+                return
+            while True:
+                try:
+                    prefix = await reader.readexactly(FRAME.size)
+                except asyncio.IncompleteReadError:
+                    break
+                head_len, payload_len = FRAME.unpack(prefix)
+                if head_len + payload_len > MAX_MESSAGE_SIZE:
+                    break
+                header = json.loads(await reader.readexactly(head_len))
+                payload = await reader.readexactly(payload_len)
+                if not isinstance(header, dict):
+                    break
+                # Stop reading once the connection has too many requests
+                # in flight; the client then blocks instead of us buffering
+                await in_flight.acquire()
+                task = asyncio.ensure_future(self._respond(header, payload, writer, in_flight))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    async def _authenticate(self, reader, writer):
+        """Read the 'auth' request a TCP connection must start with; True if its token matches"""
+        head_len, payload_len = FRAME.unpack(await reader.readexactly(FRAME.size))
+        if head_len + payload_len > MAX_MESSAGE_SIZE:
+            return False
+        header = json.loads(await reader.readexactly(head_len))
+        await reader.readexactly(payload_len)
+        if not isinstance(header, dict):
+            return False
+        token = header.get('token')
+        ok = (self.token is not None and header.get('op') == 'auth' and isinstance(token, str)
+              and hmac.compare_digest(token.encode('utf-8'), self.token.encode('utf-8')))
+        response = {'id': header.get('id'), 'ok': ok}
+        if not ok:
+            response['error'] = "Authentication failed"
+        head = json.dumps(response).encode('utf-8')
+        writer.write(FRAME.pack(len(head), 0) + head)
+        await writer.drain()
+        return ok
+
+    async def _respond(self, header, payload, writer, in_flight):
+        response = {'id': header.get('id'), 'ok': True}
+        result = b''
+        try:
+            result = await self._execute(header, payload)
+        except Exception as e:
+            response = {'id': header.get('id'), 'ok': False, 'error': str(e) or type(e).__name__}
+        try:
+            head = json.dumps(response).encode('utf-8')
+            writer.write(FRAME.pack(len(head), len(result)) + head + result)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            in_flight.release()
+
+    async def _execute(self, header, payload):
+        op = header.get('op')
+        if op == 'ping':
+            return b''
+        if op == 'metrics':
+            return self.metrics.prometheus_text().encode('utf-8')
+        if op not in ('encrypt', 'decrypt'):
+            raise ValueError(f"Unknown operation '{op}'")
+        name = header.get('cipher')
+        # Checked before it becomes a metric label: clients must not be able
+        # to add label values
+        if not isinstance(name, str) or name not in CIPHER_NAMES:
+            raise ValueError(f"Unknown cipher '{name}'")
+        key_file, table_file = header.get('key_file'), header.get('table_file')
+        loop = asyncio.get_running_loop()
+        async with self._work_slots:
+            with self.metrics.track(name, op) as record:
+                cipher = self.ciphers.cached(name, key_file, table_file)
+                if cipher is None:
+                    # Reading key files and deriving passphrase keys must not
+                    # block the other connections
+                    cipher = await loop.run_in_executor(self._pool, self.ciphers.get,
+                                                        name, key_file, table_file)
+                if name in BINARY_CIPHERS and len(payload) <= INLINE_LIMIT:
+                    result = process(cipher, op, payload)
+                else:
+                    result = await loop.run_in_executor(self._pool, process, cipher, op, payload)
+                record.bytes_in, record.bytes_out = len(payload), len(result)
+        return result
+
+    async def handle_metrics_http(self, reader, writer):
+        """Minimal HTTP endpoint answering every request with the Prometheus metrics"""
+        try:
+            while (await reader.readline()).strip():
+                pass  # skip the request line and headers
+            body = self.metrics.prometheus_text().encode('utf-8')
+            writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         + f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address, metrics_port=None):
+        """Serve forever on a Unix socket path or a (host, port) tuple
+
+        With metrics_port, Prometheus metrics are also served over HTTP on
+        localhost:metrics_port.
+        """
+        self._work_slots = asyncio.Semaphore(self._max_concurrency)
+        if metrics_port:
+            await asyncio.start_server(self.handle_metrics_http, '127.0.0.1', metrics_port)
+        if isinstance(address, tuple):
+            server = await asyncio.start_server(self.handle_connection, *address)
+        else:
+            if os.path.exists(address):
+                os.remove(address)  # stale socket from a previous run
+            # Create the socket owner-only from the start
+            umask = os.umask(0o177)
+            try:
+                server = await asyncio.start_unix_server(self.handle_connection, address)
+            finally:
+                os.umask(umask)
+        async with server:
+            await server.serve_forever()
+
+
+def _same_user(sock):
+    """False if the peer of a Unix socket connection is another user
+
+    Uses SO_PEERCRED where the platform has it; elsewhere the socket's
+    owner-only mode is the only check.
+    """
+    if sock is None or not hasattr(socket, 'SO_PEERCRED'):
+        return True
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    _, uid, _ = struct.unpack('3i', creds)
+    return uid == os.getuid()
+
+
+def _terminate(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local encryption service with warm keys and tables")
+    parser.add_argument('--socket', help="Unix socket path (default: per-user path in the temp dir)")
+    parser.add_argument('--key-dir', required=True,
+                        help="Directory holding the key and table files requests may use")
+    parser.add_argument('--tcp', type=int, metavar='PORT', help="Listen on localhost:PORT instead")
+    parser.add_argument('--token-file',
+                        help="File holding the token TCP clients must present (required with --tcp)")
+    parser.add_argument('--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help="Requests processed at once across all connections")
+    parser.add_argument('--max-in-flight', type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help="Pipelined requests accepted per connection")
+    parser.add_argument('--key-cache-ttl', type=float, default=DEFAULT_TTL,
+                        help="Seconds to keep passphrase-derived keys in memory (default: %(default)s)")
+    parser.add_argument('--metrics-port', type=int,
+                        help="Serve Prometheus metrics over HTTP on localhost:PORT")
+    parser.add_argument('--metrics-file',
+                        help="Write metrics here periodically (Prometheus text for *.prom, JSON otherwise)")
+    parser.add_argument('--metrics-interval', type=float, default=10.0,
+                        help="Seconds between metrics snapshots (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.key_dir):
+        parser.error(f"--key-dir {args.key_dir} is not a directory")
+    token = None
+    if args.tcp:
+        if not args.token_file:
+            parser.error("--tcp requires --token-file")
+        token = _read_text(args.token_file)
+        if not token:
+            parser.error(f"{args.token_file} is empty")
+
+    PROVIDER.ttl = args.key_cache_ttl
+    address = ('127.0.0.1', args.tcp) if args.tcp else (args.socket or default_address())
+    service = EncryptionService(args.key_dir, args.max_concurrency, args.max_in_flight, token=token)
+    print(f"Encryption service listening on {address}")
+    signal.signal(signal.SIGTERM, _terminate)
+    writer = SnapshotWriter(METRICS, args.metrics_file, args.metrics_interval).start() \
+        if args.metrics_file else None
+    try:
+        asyncio.run(service.serve(address, args.metrics_port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if writer is not None:
+            writer.stop()
+        if not isinstance(address, tuple) and os.path.exists(address):
+            os.remove(address)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Encryption Service Client
+Thin client for the local encryption service (service.py). Importing it
+loads only standard library modules (the command line also uses
+atomic_output, imported when it writes), so scripts pay no cipher import or
+key parsing cost: after connecting, each call is one round trip over a Unix domain
+socket (or localhost TCP, which needs the service's token).
+
+Example:
+    with ServiceClient() as client:
+        ct = client.encrypt("AES", b"secret data", key_file="aes_key.txt")
+        pt = client.decrypt("AES", ct, key_file="aes_key.txt")
+
+Wire format, in both directions: frame header (header length (4), payload
+length (4)) | JSON header | payload bytes. Requests carry an id that the
+response echoes; responses to pipelined requests may arrive out of order.
+A TCP connection starts with an 'auth' request carrying the token.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+
+FRAME = struct.Struct('>II')
+DEFAULT_TCP_PORT = 8765
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+PIPELINE_WINDOW = 16
+
+# Parameters naming files are sent as absolute paths, since the service
+# resolves relative paths against its key directory, not our working directory
+FILE_PARAMS = ('key_file', 'table_file')
+
+
+def default_address():
+    """Unix socket path per user, or localhost TCP where Unix sockets are unavailable"""
+    if hasattr(socket, 'AF_UNIX'):
+        return os.path.join(tempfile.gettempdir(), f"cryptography-project-{os.getuid()}.sock")
+    return ('127.0.0.1', DEFAULT_TCP_PORT)
+
+
+class ServiceError(Exception):
+    """Raised when the service reports an error for a request"""
+
+
+def _recv_exactly(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    pos = 0
+    while pos < n:
+        got = sock.recv_into(view[pos:])
+        if not got:
+            raise ConnectionError("Service closed the connection")
+        pos += got
+    return bytes(buf)
+
+
+def send_frame(sock, header, payload=b''):
+    head = json.dumps(header).encode('utf-8')
+    sock.sendall(FRAME.pack(len(head), len(payload)) + head + payload)
+
+
+def recv_frame(sock):
+    head_len, payload_len = FRAME.unpack(_recv_exactly(sock, FRAME.size))
+    if head_len + payload_len > MAX_MESSAGE_SIZE:
+        raise ConnectionError("Response exceeds the maximum message size")
+    header = json.loads(_recv_exactly(sock, head_len))
+    return header, _recv_exactly(sock, payload_len)
+
+
+class ServiceClient:
+    """Synchronous client holding one connection to the service
+
+    token is required for TCP connections.
+    """
+    def __init__(self, address=None, timeout=30.0, token=None):
+        address = address or default_address()
+        family = socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+        self._sock = socket.socket(family, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(address)
+        if family == socket.AF_INET:
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._ids = itertools.count(1)
+        if family == socket.AF_INET:
+            if token is None:
+                self.close()
+                raise ServiceError("TCP connections to the service need its token")
+            try:
+                self.request('auth', token=token)
+            except BaseException:
+                self.close()
+                raise
+
+    def close(self):
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _header(self, op, cipher, params):
+        header = {'id': next(self._ids), 'op': op}
+        if cipher:
+            header['cipher'] = cipher
+        for name, value in params.items():
+            if value is None:
+                continue
+            header[name] = os.path.abspath(value) if name in FILE_PARAMS else value
+        return header
+
+    def request(self, op, cipher=None, data=b'', **params):
+        """Send one request and wait for its result payload"""
+        return self.pipeline([(op, cipher, data, params)])[0]
+
+    def pipeline(self, requests):
+        """Send [(op, cipher, data, params)] without waiting for each reply; returns results in order
+
+        Raises ServiceError for the first failed request, after all
+        responses have been read.
+        """
+        headers = [self._header(op, cipher, params) for op, cipher, _, params in requests]
+        results = {}
+        for sent, (header, (_, _, data, _)) in enumerate(zip(headers, requests)):
+            # Keep at most PIPELINE_WINDOW requests outstanding; the service
+            # accepts more than that per connection, so it never stops
+            # reading while we are blocked sending
+            if sent - len(results) >= PIPELINE_WINDOW:
+                response, payload = recv_frame(self._sock)
+                results[response['id']] = (response, payload)
+            send_frame(self._sock, header, data)
+        while len(results) < len(headers):
+            response, payload = recv_frame(self._sock)
+            results[response['id']] = (response, payload)
+        out = []
+        for header in headers:
+            response, payload = results[header['id']]
+            if not response.get('ok'):
+                raise ServiceError(response.get('error', 'unknown error'))
+            out.append(payload)
+        return out
+
+    def encrypt(self, cipher, data, **params):
+        """Encrypt bytes (AES/DES/CHACHA20) or ASCII text bytes (Playfair/Vigenere)"""
+        return self.request('encrypt', cipher, data, **params)
+
+    def decrypt(self, cipher, data, **params):
+        """Decrypt bytes (AES/DES/CHACHA20) or ASCII text bytes (Playfair/Vigenere)"""
+        return self.request('decrypt', cipher, data, **params)
+
+    def ping(self):
+        self.request('ping')
+
+    def metrics(self):
+        """Return the service's metrics in Prometheus text format"""
+        return self.request('metrics').decode('utf-8')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Encrypt or decrypt a file through the local service")
+    parser.add_argument('operation', choices=['encrypt', 'decrypt', 'ping'])
+    parser.add_argument('input', nargs='?')
+    parser.add_argument('output', nargs='?')
+    parser.add_argument('--cipher', choices=['AES', 'DES', 'CHACHA20', 'Playfair', 'Vigenere'])
+    parser.add_argument('--key', dest='key_file', help="Key file (AES, DES, CHACHA20, Vigenere)")
+    parser.add_argument('--table', dest='table_file', help="Table file (Playfair, Vigenere)")
+    parser.add_argument('--socket', help="Unix socket path of the service")
+    parser.add_argument('--tcp', type=int, metavar='PORT', help="Connect to localhost:PORT instead")
+    parser.add_argument('--token-file', help="File holding the service's TCP token")
+    args = parser.parse_intermixed_args(argv)
+
+    address = ('127.0.0.1', args.tcp) if args.tcp else args.socket
+    try:
+        token = None
+        if args.token_file:
+            with open(args.token_file, 'r', encoding='ascii') as f:
+                token = f.read().strip()
+        with ServiceClient(address, token=token) as client:
+            if args.operation == 'ping':
+                client.ping()
+                print("Service is running")
+                return 0
+            if not (args.cipher and args.input and args.output):
+                parser.error("encrypt/decrypt need --cipher, an input and an output file")
+            with open(args.input, 'rb') as f:
+                data = f.read()
+            result = client.request(args.operation, args.cipher, data,
+                                    key_file=args.key_file, table_file=args.table_file)
+            from atomic_output import AtomicOutput  # keeps the module import standard-library only
+            with AtomicOutput(args.output, expected_size=len(result)) as f:
+                f.write(result)
+    except (OSError, ServiceError) as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
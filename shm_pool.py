@@ -0,0 +1,386 @@
+"""
+Shared-Memory Worker Pool
+Process pool for chunked parallel work with any of the four ciphers, without
+pickling payloads. Data lives in multiprocessing.shared_memory blocks (for
+in-memory work) or in memory-mapped files; workers receive only a region
+name, offset and length, and write their result straight into the output
+region. Each worker builds the cipher (AES/DES key, Playfair matrix,
+Vigenère table) once, when the pool starts.
+
+What runs in parallel:
+    AES/DES     CBC decryption of [header]IV||ciphertext (each chunk's IV is
+                the ciphertext block before it). CBC encryption is sequential
+                by construction and is not offered here.
+    Vigenère    encryption and decryption; each chunk starts at the key
+                position given by the number of letters before it, which the
+                workers count in a first parallel pass.
+    Playfair    encryption (the text is split into digraphs first) and
+                decryption, on even-length chunks.
+
+ThreadCipherPool does the same work with threads over plain in-memory
+buffers, sharing one cipher object (the cipher classes are immutable after
+construction). PyCryptodome releases the GIL, so AES/DES scale on threads
+in any build; the pure-Python classical ciphers scale only on a
+free-threaded (no-GIL) interpreter. cipher_pool() picks threads wherever
+they scale and processes otherwise.
+"""
+
+import mmap
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from multiprocessing import resource_tracker, shared_memory
+
+from Crypto.Cipher import AES, DES
+from Crypto.Util.Padding import unpad
+
+from aes_cipher import AESCipher
+from atomic_output import DEFAULT_FSYNC, AtomicOutput
+from des_cipher import DESCipher
+from file_header import MAGIC, MAX_HEADER_SIZE, FileHeader
+from file_ops import check_header
+from playfair_cipher import PlayfairCipher
+from stream_cipher import DEFAULT_CHUNK_SIZE
+from vigenere_cipher import VigenereCipher
+
+# How cipher_pool() runs the work: 'auto' picks threads where they scale
+POOL_MODES = ('auto', 'thread', 'process')
+
+_worker_cipher = None  # set in each worker by _init_worker
+
+
+def free_threaded():
+    """True on a free-threaded CPython build running with the GIL disabled"""
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def _cipher_state(cipher):
+    """Picklable description of a cipher, sent to each worker once"""
+    if isinstance(cipher, AESCipher):
+        return ('AES', cipher.key)
+    if isinstance(cipher, DESCipher):
+        return ('DES', cipher.key)
+    if isinstance(cipher, PlayfairCipher):
+        return ('Playfair', cipher.matrix)
+    if isinstance(cipher, VigenereCipher):
+        return ('Vigenere', cipher.key, cipher.table, cipher.inverse)
+    raise TypeError(f"Unsupported cipher {type(cipher).__name__}")
+
+
+def _make_cipher(state):
+    """What the workers transform with: (algorithm, key) for AES/DES, else a cipher object"""
+    kind = state[0]
+    if kind in ('AES', 'DES'):
+        return (AES if kind == 'AES' else DES, state[1])
+    if kind == 'Playfair':
+        return PlayfairCipher(matrix=state[1])
+    return VigenereCipher(state[1], state[2], state[3])
+
+
+def _init_worker(state):
+    global _worker_cipher
+    _worker_cipher = _make_cipher(state)
+
+
+class _Region:
+    """Attach to a shared memory block, memory-map a file or wrap an in-process
+    buffer ('mem', only for thread pools), exposing a memoryview"""
+    def __init__(self, source, writable):
+        kind, name = source
+        self._shm = self._file = self._mmap = None
+        if kind == 'shm':
+            self._shm = _attach(name)
+            self.view = self._shm.buf
+        elif kind == 'mem':
+            self.view = memoryview(name)
+        else:
+            self._file = open(name, 'r+b' if writable else 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+            self.view = memoryview(self._mmap)
+
+    def close(self):
+        self.view.release()
+        if self._shm is not None:
+            self._shm.close()
+        elif self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _attach(name):
+    """Attach to a block created (and later unlinked) by the pool's owner"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: workers share the owner's resource tracker (see
+        # SharedMemoryPool), where the block is already registered
+        return shared_memory.SharedMemory(name=name)
+
+
+def _work(task, cipher=None):
+    """Run one task in a worker; returns an int for 'count', else None
+
+    Process workers use the cipher built by _init_worker; thread workers
+    are passed theirs.
+    """
+    op, src, offset, length, dst, dst_offset, param = task
+    with _Region(src, False) as inp:
+        data = inp.view[offset:offset + length]
+        try:
+            if op == 'count':
+                return VigenereCipher.count_letters(data)
+            with _Region(dst, True) as out:
+                target = out.view[dst_offset:dst_offset + length]
+                try:
+                    _transform(op, data, target, param, cipher or _worker_cipher)
+                finally:
+                    target.release()
+        finally:
+            data.release()
+
+
+def _transform(op, data, out, param, cipher):
+    if isinstance(cipher, tuple):
+        algorithm, key = cipher
+        algorithm.new(key, algorithm.MODE_CBC, param).decrypt(data, output=out)
+        return
+    if isinstance(cipher, VigenereCipher):
+        # Start the key at this chunk's letter offset, writing straight into out
+        transform = cipher.encrypt_bytes if op == 'encrypt' else cipher.decrypt_bytes
+        transform(data, out=out, key_offset=param)
+        return
+    result = cipher.encrypt_prepared_bytes(data) if op == 'encrypt' else cipher.decrypt_bytes(data)
+    if len(result) != len(out):
+        raise ValueError("Playfair ciphertext must contain only letters")
+    out[:] = result
+
+
+class SharedMemoryPool:
+    """Process pool running one cipher over shared memory or memory-mapped files
+
+    Use as a context manager, or call close() when done.
+    """
+    def __init__(self, cipher, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.cipher = cipher
+        self.chunk_size = chunk_size
+        self._kind = _cipher_state(cipher)[0]
+        if os.name == 'posix':
+            # Start the shared memory resource tracker before the workers so
+            # they share ours instead of each starting their own
+            resource_tracker.ensure_running()
+        self._pool = multiprocessing.Pool(workers or os.cpu_count() or 1, initializer=_init_worker,
+                                          initargs=(_cipher_state(cipher),))
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def encrypt(self, data):
+        """Encrypt bytes (ASCII text for the classical ciphers); returns bytes"""
+        return self._run_bytes('encrypt', data)
+
+    def decrypt(self, data):
+        """Decrypt bytes (IV||ciphertext for AES/DES, ASCII text otherwise); returns bytes"""
+        return self._run_bytes('decrypt', data)
+
+    def process_file(self, op, input_path, output_path, fsync=DEFAULT_FSYNC, sync_batch=None):
+        """Encrypt or decrypt a file through memory maps; returns the output size
+
+        The workers write into a temporary file that replaces output_path
+        on success (see atomic_output).
+        """
+        data, prefix_len = self._prepare_input(op, input_path=input_path)
+        if data is not None:
+            # Playfair encryption rewrites the text first; stage it in shared memory
+            result = self._run_bytes('encrypt', data, prepared=True)
+            with AtomicOutput(output_path, fsync, len(result), sync_batch=sync_batch) as out:
+                out.write(result)
+            return len(result)
+        length = os.path.getsize(input_path) - prefix_len
+        if length < 0:
+            raise ValueError("Input is too short to contain an IV and ciphertext")
+        with AtomicOutput(output_path, fsync, sync_batch=sync_batch) as out:
+            out.truncate(length)
+            if length:
+                iv = None
+                if prefix_len:
+                    with open(input_path, 'rb') as f:
+                        f.seek(prefix_len - self._block_size())
+                        iv = f.read(self._block_size())
+                self._map(op, ('file', input_path), prefix_len, length, ('file', out.tmp_path), iv)
+            if self._kind in ('AES', 'DES'):
+                length = self._unpad_file(out.tmp_path, length)
+        return length
+
+    def _prepare_input(self, op, data=None, input_path=None):
+        """Validate input; returns (rewritten text or None, prefix length)"""
+        if self._kind in ('AES', 'DES'):
+            if op == 'encrypt':
+                raise ValueError("CBC encryption cannot be parallelised; use file_ops.encrypt_path")
+            if data is None:
+                with open(input_path, 'rb') as f:
+                    start = f.read(MAX_HEADER_SIZE)
+            else:
+                start = bytes(data[:MAX_HEADER_SIZE])
+            return None, self._cbc_prefix(start)
+        if self._kind == 'Playfair' and op == 'encrypt':
+            if data is None:
+                with open(input_path, 'rb') as f:
+                    data = f.read()
+            return self.cipher._prepare_bytes(data), 0
+        return None, 0
+
+    def _cbc_prefix(self, start):
+        """Length of the header (if any) plus IV at the start of a CBC file"""
+        if start[:len(MAGIC)] != MAGIC:
+            return self._block_size()
+        header = FileHeader.from_bytes(start)
+        check_header(self.cipher, header)
+        if header.mode != "CBC" or header.compression:
+            raise ValueError("Only plain CBC files can be decrypted in parallel; "
+                             "use file_ops.decrypt_path")
+        return len(header.raw) + self._block_size()
+
+    def _block_size(self):
+        return AES.block_size if self._kind == 'AES' else DES.block_size
+
+    def _run_bytes(self, op, data, prepared=False):
+        if not prepared:
+            rewritten, prefix_len = self._prepare_input(op, data=data)
+            if rewritten is not None:
+                data = rewritten
+        else:
+            prefix_len = 0
+        length = len(data) - prefix_len
+        if length <= 0:
+            if self._kind in ('AES', 'DES'):
+                raise ValueError("Input is too short to contain an IV and ciphertext")
+            return b''
+        result = self._run_buffers(op, data, prefix_len, length,
+                                   bytes(data[prefix_len - self._block_size():prefix_len])
+                                   if prefix_len else None)
+        if self._kind in ('AES', 'DES'):
+            return unpad(result, self._block_size())
+        return result
+
+    def _run_buffers(self, op, data, prefix_len, length, iv):
+        """Process data[prefix_len:] through shared memory; returns bytes"""
+        src = shared_memory.SharedMemory(create=True, size=length)
+        dst = shared_memory.SharedMemory(create=True, size=length)
+        try:
+            src.buf[:length] = memoryview(data)[prefix_len:]
+            self._map(op, ('shm', src.name), 0, length, ('shm', dst.name), iv)
+            return bytes(dst.buf[:length])
+        finally:
+            for block in (src, dst):
+                block.close()
+                block.unlink()
+
+    def _map(self, op, src, offset, length, dst, iv):
+        """Split [offset, offset + length) of src into chunks and process them in parallel"""
+        step = self.chunk_size
+        if self._kind in ('AES', 'DES'):
+            block = self._block_size()
+            if length % block:
+                raise ValueError("Ciphertext length is not a multiple of the block size")
+            step -= step % block
+        elif self._kind == 'Playfair':
+            if length % 2:
+                raise ValueError("Playfair ciphertext must have an even number of letters")
+            step -= step % 2
+        starts = list(range(0, length, step))
+        sizes = [min(step, length - start) for start in starts]
+
+        params = [None] * len(starts)
+        if self._kind in ('AES', 'DES'):
+            # Each chunk's IV is the last ciphertext block of the chunk before it
+            with _Region(src, False) as region:
+                for i, start in enumerate(starts):
+                    params[i] = iv if i == 0 else bytes(
+                        region.view[offset + start - block:offset + start])
+        elif self._kind == 'Vigenere':
+            counts = self._run_tasks([('count', src, offset + start, size, None, 0, None)
+                                            for start, size in zip(starts, sizes)])
+            total = 0
+            for i, count in enumerate(counts):
+                params[i] = total
+                total += count
+
+        self._run_tasks([(op, src, offset + start, size, dst, start, param)
+                               for start, size, param in zip(starts, sizes, params)])
+
+    def _run_tasks(self, tasks):
+        return self._pool.map(_work, tasks)
+
+    def _unpad_file(self, path, length):
+        """Strip PKCS#7 padding from a decrypted file in place"""
+        if length < self._block_size():
+            # Same error as the streaming decryptor for an empty ciphertext
+            raise ValueError("Ciphertext length is not a multiple of the block size")
+        with open(path, 'r+b') as f:
+            f.seek(length - self._block_size())
+            last = f.read(self._block_size())
+            size = length - (len(last) - len(unpad(last, self._block_size())))
+            f.truncate(size)
+        return size
+
+
+class ThreadCipherPool(SharedMemoryPool):
+    """Thread pool running one cipher over in-memory buffers or memory-mapped files
+
+    The same interface as SharedMemoryPool, without worker processes or
+    shared memory blocks: every thread uses this process's cipher object.
+    """
+    def __init__(self, cipher, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.cipher = cipher
+        self.chunk_size = chunk_size
+        state = _cipher_state(cipher)
+        self._kind = state[0]
+        # Playfair and Vigenère instances hold only frozen tables, so the
+        # threads share the caller's cipher instead of copies
+        self._worker_cipher = _make_cipher(state) if self._kind in ('AES', 'DES') else cipher
+        self._executor = ThreadPoolExecutor(workers or os.cpu_count() or 1,
+                                            thread_name_prefix='cipher-pool')
+
+    def close(self):
+        self._executor.shutdown()
+
+    def _run_buffers(self, op, data, prefix_len, length, iv):
+        result = bytearray(length)
+        self._map(op, ('mem', memoryview(data)[prefix_len:]), 0, length, ('mem', result), iv)
+        return bytes(result)
+
+    def _run_tasks(self, tasks):
+        return list(self._executor.map(partial(_work, cipher=self._worker_cipher), tasks))
+
+
+def cipher_pool(cipher, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, mode='auto'):
+    """A ThreadCipherPool or SharedMemoryPool for cipher
+
+    mode 'auto' uses threads for AES/DES, whose native code releases the
+    GIL, and for every cipher on a free-threaded interpreter; on a GIL
+    build the classical ciphers fall back to processes.
+    """
+    if mode not in POOL_MODES:
+        raise ValueError(f"Unknown pool mode '{mode}'; expected one of {', '.join(POOL_MODES)}")
+    if mode == 'auto':
+        threads = free_threaded() or _cipher_state(cipher)[0] in ('AES', 'DES')
+        mode = 'thread' if threads else 'process'
+    pool_class = ThreadCipherPool if mode == 'thread' else SharedMemoryPool
+    return pool_class(cipher, workers, chunk_size)
@@ -0,0 +1,292 @@
+"""
+Streaming Block Cipher Helpers
+Chunk-by-chunk CBC processing compatible with the IV||ciphertext file format,
+plus authenticated variants (GCM, ChaCha20-Poly1305, and CBC with encrypt-then-HMAC)
+"""
+
+import hashlib
+import hmac
+
+from Crypto.Cipher import ChaCha20_Poly1305
+from Crypto.Random import get_random_bytes
+from Crypto.Util.Padding import pad, unpad
+
+from compression import finalize_pieces, transform_pieces
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024  # 1 MiB
+GCM_NONCE_SIZE = 12
+GCM_TAG_SIZE = 16
+HMAC_TAG_SIZE = 32  # HMAC-SHA256
+
+
+class CBCEncryptor:
+    """Incremental CBC encryptor; output matches a single-shot encrypt_file"""
+    def __init__(self, algorithm, key, iv=None):
+        if iv is None:
+            self._cipher = algorithm.new(key, algorithm.MODE_CBC)
+        else:
+            self._cipher = algorithm.new(key, algorithm.MODE_CBC, iv)
+        self.block_size = algorithm.block_size
+        self.iv = self._cipher.iv
+        self._pending = b''
+
+    def update(self, data):
+        """Encrypt all complete blocks, buffering any partial block"""
+        if self._pending:
+            data = self._pending + bytes(data)
+        usable = len(data) - len(data) % self.block_size
+        self._pending = bytes(data[usable:])
+        if not usable:
+            return b''
+        return self._cipher.encrypt(memoryview(data)[:usable])
+
+    def update_into(self, data, out):
+        """Like update(), but writes into the preallocated buffer out; returns the length"""
+        if not self._pending and len(data) % self.block_size == 0:
+            self._cipher.encrypt(data, output=memoryview(out)[:len(data)])
+            return len(data)
+        ct = self.update(data)
+        out[:len(ct)] = ct
+        return len(ct)
+
+    def finalize(self):
+        """Pad and encrypt the buffered tail"""
+        ct = self._cipher.encrypt(pad(self._pending, self.block_size))
+        self._pending = b''
+        return ct
+
+
+class CBCDecryptor:
+    """Incremental CBC decryptor; the final block is held back for unpadding"""
+    def __init__(self, algorithm, key, iv):
+        self._cipher = algorithm.new(key, algorithm.MODE_CBC, iv)
+        self.block_size = algorithm.block_size
+        self._pending = b''
+
+    def update(self, data):
+        """Decrypt all blocks except the last complete one"""
+        bs = self.block_size
+        if len(self._pending) in (0, bs) and len(data) % bs == 0 and data:
+            out = bytearray(len(self._pending) + len(data) - bs)
+            self.update_into(data, out)
+            return out
+        if self._pending:
+            data = self._pending + data
+        keep = len(data) % bs or bs
+        if len(data) <= keep:
+            self._pending = bytes(data)
+            return b''
+        usable = len(data) - keep
+        self._pending = bytes(data[usable:])
+        return self._cipher.decrypt(memoryview(data)[:usable])
+
+    def update_into(self, data, out):
+        """Like update(), but writes into the preallocated buffer out; returns the length"""
+        bs = self.block_size
+        if len(self._pending) in (0, bs) and len(data) % bs == 0 and data:
+            # Common aligned case: decrypt the held-back block (none before
+            # the first chunk) and all but the last new block straight into
+            # out, without copying the input
+            view = memoryview(data)
+            target = memoryview(out)
+            held = len(self._pending)
+            if held:
+                self._cipher.decrypt(self._pending, output=target[:held])
+            if len(data) > bs:
+                self._cipher.decrypt(view[:-bs], output=target[held:held + len(data) - bs])
+            self._pending = bytes(view[-bs:])
+            return held + len(data) - bs
+        pt = self.update(data)
+        out[:len(pt)] = pt
+        return len(pt)
+
+    def finalize(self):
+        """Decrypt and unpad the held-back final block"""
+        if len(self._pending) != self.block_size:
+            raise ValueError("Ciphertext length is not a multiple of the block size")
+        pt = unpad(self._cipher.decrypt(self._pending), self.block_size)
+        self._pending = b''
+        return pt
+
+
+def _new_gcm(algorithm, key, nonce):
+    return algorithm.new(key, algorithm.MODE_GCM, nonce=nonce, mac_len=GCM_TAG_SIZE)
+
+
+def _new_chacha20_poly1305(algorithm, key, nonce):
+    return ChaCha20_Poly1305.new(key=key, nonce=nonce)
+
+
+class GCMEncryptor:
+    """Incremental GCM encryptor; finalize() returns the authentication tag"""
+    _new_cipher = staticmethod(_new_gcm)
+
+    def __init__(self, algorithm, key, aad=b''):
+        self.nonce = get_random_bytes(GCM_NONCE_SIZE)
+        self._cipher = self._new_cipher(algorithm, key, self.nonce)
+        self._cipher.update(aad)
+
+    def update(self, data):
+        return self._cipher.encrypt(data)
+
+    def update_into(self, data, out):
+        """Like update(), but writes into the preallocated buffer out; returns the length"""
+        self._cipher.encrypt(data, output=memoryview(out)[:len(data)])
+        return len(data)
+
+    def finalize(self):
+        return self._cipher.digest()
+
+
+class GCMDecryptor:
+    """Incremental GCM decryptor; the trailing tag is held back and verified in finalize()"""
+    _new_cipher = staticmethod(_new_gcm)
+
+    def __init__(self, algorithm, key, nonce, aad=b''):
+        self._cipher = self._new_cipher(algorithm, key, nonce)
+        self._cipher.update(aad)
+        self._pending = b''
+
+    def update(self, data):
+        out = bytearray(len(self._pending) + len(data))
+        del out[self.update_into(data, out):]
+        return out
+
+    def update_into(self, data, out):
+        """Like update(), but writes into the preallocated buffer out; returns the length"""
+        n = len(data)
+        if n < GCM_TAG_SIZE:
+            data = self._pending + data
+            self._pending = data[-GCM_TAG_SIZE:]
+            released = data[:-GCM_TAG_SIZE]
+            if released:
+                self._cipher.decrypt(released, output=memoryview(out)[:len(released)])
+            return len(released)
+        # Everything held back so far is released, and the input's last
+        # GCM_TAG_SIZE bytes are held back in its place
+        view = memoryview(data)
+        target = memoryview(out)
+        held = len(self._pending)
+        if held:
+            self._cipher.decrypt(self._pending, output=target[:held])
+        if n > GCM_TAG_SIZE:
+            self._cipher.decrypt(view[:n - GCM_TAG_SIZE], output=target[held:held + n - GCM_TAG_SIZE])
+        self._pending = bytes(view[n - GCM_TAG_SIZE:])
+        return held + n - GCM_TAG_SIZE
+
+    def finalize(self):
+        """Verify the tag; raises ValueError if the data was modified"""
+        if len(self._pending) != GCM_TAG_SIZE:
+            raise ValueError("Ciphertext is too short to contain an authentication tag")
+        self._cipher.verify(self._pending)
+        return b''
+
+
+class ChaCha20Poly1305Encryptor(GCMEncryptor):
+    """Incremental ChaCha20-Poly1305 encryptor (same nonce, tag and interface as GCM)"""
+    _new_cipher = staticmethod(_new_chacha20_poly1305)
+
+
+class ChaCha20Poly1305Decryptor(GCMDecryptor):
+    """Incremental ChaCha20-Poly1305 decryptor; the tag is verified in finalize()"""
+    _new_cipher = staticmethod(_new_chacha20_poly1305)
+
+
+def derive_mac_key(key):
+    """Derive a separate HMAC key from a cipher key"""
+    return hashlib.sha256(b'cryptography-project encrypt-then-mac\x00' + key).digest()
+
+
+class HMACEncryptor:
+    """CBC encryption followed by HMAC-SHA256 over aad || IV || ciphertext"""
+    def __init__(self, algorithm, key, aad=b''):
+        self._inner = CBCEncryptor(algorithm, key)
+        self.nonce = self._inner.iv
+        self._mac = hmac.new(derive_mac_key(key), aad + self.nonce, hashlib.sha256)
+
+    def update(self, data):
+        ct = self._inner.update(data)
+        self._mac.update(ct)
+        return ct
+
+    def update_into(self, data, out):
+        """Like update(), but writes into the preallocated buffer out; returns the length"""
+        n = self._inner.update_into(data, out)
+        self._mac.update(memoryview(out)[:n])
+        return n
+
+    def finalize(self):
+        ct = self._inner.finalize()
+        self._mac.update(ct)
+        return ct + self._mac.digest()
+
+
+class HMACDecryptor:
+    """Verifies HMAC-SHA256 while CBC-decrypting; the tag is checked before unpadding"""
+    def __init__(self, algorithm, key, iv, aad=b''):
+        self._inner = CBCDecryptor(algorithm, key, iv)
+        self._mac = hmac.new(derive_mac_key(key), aad + iv, hashlib.sha256)
+        self._pending = b''
+
+    def update(self, data):
+        data = self._pending + data
+        if len(data) <= HMAC_TAG_SIZE:
+            self._pending = data
+            return b''
+        self._pending = data[-HMAC_TAG_SIZE:]
+        ct = memoryview(data)[:-HMAC_TAG_SIZE]
+        self._mac.update(ct)
+        return self._inner.update(ct)
+
+    def finalize(self):
+        """Verify the tag, then decrypt the final block"""
+        if len(self._pending) != HMAC_TAG_SIZE:
+            raise ValueError("Ciphertext is too short to contain an authentication tag")
+        if not hmac.compare_digest(self._mac.digest(), self._pending):
+            raise ValueError("MAC check failed")
+        return self._inner.finalize()
+
+
+def run_transform(transform, src, dst, chunk_size=DEFAULT_CHUNK_SIZE, on_chunk=None, executor=None):
+    """Stream src through transform into dst, returning (bytes_in, bytes_out)
+
+    With an executor (see pipeline.PipelineExecutor) reading, transforming and
+    writing overlap; otherwise a simple read/transform/write loop is used.
+    """
+    if executor is not None:
+        return executor.run(transform, src, dst, on_chunk)
+    bytes_in, bytes_out = 0, 0
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            break
+        bytes_in += len(chunk)
+        for out in transform_pieces(transform, chunk):
+            dst.write(out)
+            bytes_out += len(out)
+        if on_chunk is not None:
+            on_chunk()
+    for out in finalize_pieces(transform):
+        dst.write(out)
+        bytes_out += len(out)
+    return bytes_in, bytes_out
+
+
+def encrypt_stream(algorithm, key, src, dst, chunk_size=DEFAULT_CHUNK_SIZE, on_chunk=None,
+                   executor=None):
+    """Encrypt src into dst as IV||ciphertext, returning (bytes_in, bytes_out)"""
+    encryptor = CBCEncryptor(algorithm, key)
+    dst.write(encryptor.iv)
+    bytes_in, bytes_out = run_transform(encryptor, src, dst, chunk_size, on_chunk, executor)
+    return bytes_in, bytes_out + len(encryptor.iv)
+
+
+def decrypt_stream(algorithm, key, src, dst, chunk_size=DEFAULT_CHUNK_SIZE, on_chunk=None,
+                   executor=None):
+    """Decrypt IV||ciphertext from src into dst, returning (bytes_in, bytes_out)"""
+    iv = src.read(algorithm.block_size)
+    if len(iv) != algorithm.block_size:
+        raise ValueError("Input is too short to contain an IV")
+    decryptor = CBCDecryptor(algorithm, key, iv)
+    bytes_in, bytes_out = run_transform(decryptor, src, dst, chunk_size, on_chunk, executor)
+    return bytes_in + len(iv), bytes_out
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Compiled Table Artifacts
+Validates a Vigenère table or Playfair matrix once and stores it as a small
+binary artifact with precomputed forward and inverse lookups and a checksum,
+so loading it skips text parsing.
+
+Layout: MAGIC (4) | version (1) | kind (1) | payload | SHA-256 of the preceding bytes (32)
+    Vigenère payload: forward table (26 x 26) | inverse table (26 x 26)
+    Playfair payload: matrix (5 x 5) | position of each letter A-Z (26, 0xFF for J)
+Table entries are letter indexes (0 = A); positions are row * 5 + column.
+
+Usage:
+    python table_artifact.py vigenere vigenere_table.txt -o vigenere_table.ctab
+    python table_artifact.py playfair playfair_table.txt -o playfair_table.ctab
+"""
+
+import argparse
+import hashlib
+import sys
+
+MAGIC = b'CTAB'
+VERSION = 1
+KIND_VIGENERE = 1
+KIND_PLAYFAIR = 2
+ARTIFACT_SUFFIX = '.ctab'
+
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+PLAYFAIR_ALPHABET = "ABCDEFGHIKLMNOPQRSTUVWXYZ"  # No J
+
+_HEADER_SIZE = 6
+_CHECKSUM_SIZE = 32
+_NO_POSITION = 0xFF
+
+
+def _describe_mismatch(letters, expected):
+    missing = sorted(set(expected) - set(letters))
+    duplicates = sorted({c for c in letters if letters.count(c) > 1})
+    parts = []
+    if missing:
+        parts.append(f"missing {''.join(missing)}")
+    if duplicates:
+        parts.append(f"repeated {''.join(duplicates)}")
+    extra = sorted(set(letters) - set(expected))
+    if extra:
+        parts.append(f"unexpected {''.join(extra)}")
+    return ", ".join(parts)
+
+
+def parse_vigenere_table(table_content):
+    """Parse and validate a 26x26 text table; returns 26 rows of letters"""
+    chars = ''.join(c.upper() for c in table_content if c.isalpha())
+    if len(chars) != 676:  # 26x26
+        raise ValueError(f"Table must contain exactly 676 alphabetic characters (26x26), got {len(chars)}")
+    rows = [list(chars[i * 26:(i + 1) * 26]) for i in range(26)]
+    validate_vigenere_table(rows)
+    return rows
+
+
+def validate_vigenere_table(rows):
+    """Raise ValueError unless every row is a permutation of A-Z"""
+    if len(rows) != 26:
+        raise ValueError(f"Table must have 26 rows, got {len(rows)}")
+    for i, row in enumerate(rows):
+        if sorted(row) != list(ALPHABET):
+            raise ValueError(f"Table row {i + 1} is not a permutation of A-Z "
+                             f"({_describe_mismatch(''.join(row), ALPHABET)})")
+
+
+def vigenere_inverse(rows):
+    """Inverse lookup: inverse[row][letter index] is the column holding that letter"""
+    validate_vigenere_table(rows)
+    inverse = []
+    for row in rows:
+        columns = [0] * 26
+        for col, char in enumerate(row):
+            columns[ord(char) - ord('A')] = col
+        inverse.append(columns)
+    return inverse
+
+
+def parse_playfair_matrix(table_content):
+    """Parse and validate a 5x5 text matrix; returns 5 rows of letters"""
+    chars = ''.join(c.upper() for c in table_content if c.isalpha())
+    if len(chars) != 25:
+        raise ValueError(f"Table must contain exactly 25 alphabetic characters, got {len(chars)}")
+    matrix = [list(chars[i * 5:(i + 1) * 5]) for i in range(5)]
+    validate_playfair_matrix(matrix)
+    return matrix
+
+
+def validate_playfair_matrix(matrix):
+    """Raise ValueError unless the matrix holds each letter except J exactly once"""
+    letters = ''.join(''.join(row) for row in matrix)
+    if len(matrix) != 5 or any(len(row) != 5 for row in matrix) or \
+            sorted(letters) != list(PLAYFAIR_ALPHABET):
+        raise ValueError(f"Playfair matrix must contain each letter except J exactly once "
+                         f"({_describe_mismatch(letters, PLAYFAIR_ALPHABET) or 'not 5x5'})")
+
+
+def playfair_positions(matrix):
+    """Map each letter in the matrix to its (row, column)"""
+    validate_playfair_matrix(matrix)
+    return {char: (r, c) for r, row in enumerate(matrix) for c, char in enumerate(row)}
+
+
+def _letters(indexes):
+    """Letters for a run of stored letter indexes"""
+    if any(i >= len(ALPHABET) for i in indexes):
+        raise ValueError("letter index out of range")
+    return [ALPHABET[i] for i in indexes]
+
+
+def _inverse_bytes(rows):
+    return bytes(col for columns in vigenere_inverse(rows) for col in columns)
+
+
+def _position_bytes(matrix):
+    positions = playfair_positions(matrix)
+    return bytes(positions[c][0] * 5 + positions[c][1] if c in positions else _NO_POSITION
+                 for c in ALPHABET)
+
+
+def _seal(kind, payload):
+    body = MAGIC + bytes([VERSION, kind]) + payload
+    return body + hashlib.sha256(body).digest()
+
+
+def compile_vigenere(table_content):
+    """Validate a Vigenère text table and return its compiled artifact"""
+    rows = parse_vigenere_table(table_content)
+    forward = bytes(ord(c) - ord('A') for row in rows for c in row)
+    return _seal(KIND_VIGENERE, forward + _inverse_bytes(rows))
+
+
+def compile_playfair(table_content):
+    """Validate a Playfair text matrix and return its compiled artifact"""
+    matrix = parse_playfair_matrix(table_content)
+    forward = bytes(ord(c) - ord('A') for row in matrix for c in row)
+    return _seal(KIND_PLAYFAIR, forward + _position_bytes(matrix))
+
+
+def is_artifact(data):
+    """True if data starts with a full artifact header (magic, version, known kind)
+
+    A text table only ever holds printable characters there, so one that
+    happens to begin with the magic is still read as text.
+    """
+    return (len(data) >= _HEADER_SIZE and data[:len(MAGIC)] == MAGIC
+            and data[4] == VERSION and data[5] in (KIND_VIGENERE, KIND_PLAYFAIR))
+
+
+def load_artifact(data, expected_kind):
+    """Verify an artifact and return its tables
+
+    Vigenère: (table rows, inverse rows); Playfair: (matrix, positions).
+    The tables are validated like text tables and the stored lookups must
+    match them, so a well-formed but wrong artifact is rejected too.
+    """
+    if len(data) < _HEADER_SIZE + _CHECKSUM_SIZE or data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a compiled table artifact")
+    body, checksum = data[:-_CHECKSUM_SIZE], data[-_CHECKSUM_SIZE:]
+    if hashlib.sha256(body).digest() != checksum:
+        raise ValueError("Compiled table artifact is corrupted (checksum mismatch)")
+    version, kind = body[4], body[5]
+    if version != VERSION:
+        raise ValueError(f"Unsupported compiled table version {version}")
+    if kind != expected_kind:
+        raise ValueError("Compiled table artifact is for a different cipher")
+    payload = body[_HEADER_SIZE:]
+    if kind == KIND_VIGENERE:
+        if len(payload) != 2 * 676:
+            raise ValueError("Corrupt compiled Vigenère table")
+        try:
+            rows = [_letters(payload[r * 26:(r + 1) * 26]) for r in range(26)]
+            if payload[676:] != _inverse_bytes(rows):
+                raise ValueError("the inverse table does not match")
+        except ValueError as e:
+            raise ValueError(f"Corrupt compiled Vigenère table: {e}") from e
+        inverse = [list(payload[676 + r * 26:676 + (r + 1) * 26]) for r in range(26)]
+        return rows, inverse
+    if len(payload) != 25 + 26:
+        raise ValueError("Corrupt compiled Playfair matrix")
+    try:
+        matrix = [_letters(payload[r * 5:(r + 1) * 5]) for r in range(5)]
+        if payload[25:] != _position_bytes(matrix):
+            raise ValueError("the letter positions do not match")
+    except ValueError as e:
+        raise ValueError(f"Corrupt compiled Playfair matrix: {e}") from e
+    positions = {ALPHABET[i]: divmod(p, 5) for i, p in enumerate(payload[25:]) if p != _NO_POSITION}
+    return matrix, positions
+
+
+def read_table_file(path):
+    """Read a table file; returns (artifact bytes, None) or (None, text content)"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if is_artifact(data):
+        return data, None
+    return None, data.decode('ascii').strip()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate a Vigenère table or Playfair matrix "
+                                                 "and compile it into a fast-loading artifact")
+    parser.add_argument('cipher', choices=['vigenere', 'playfair'])
+    parser.add_argument('table', help="Text table file")
+    parser.add_argument('-o', '--output', help="Artifact path (default: table name with .ctab)")
+    args = parser.parse_args(argv)
+
+    output = args.output or args.table.rsplit('.', 1)[0] + ARTIFACT_SUFFIX
+    try:
+        with open(args.table, 'r', encoding='ascii') as f:
+            content = f.read()
+        compile_table = compile_vigenere if args.cipher == 'vigenere' else compile_playfair
+        artifact = compile_table(content)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return 1
+    with open(output, 'wb') as f:
+        f.write(artifact)
+    print(f"Compiled {args.table} -> {output} ({len(artifact)} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,12 +3,40 @@ Vigenère Cipher Implementation
 Classical polyalphabetic substitution cipher
 """
 
+import re
+from itertools import accumulate
+
+from table_artifact import (KIND_VIGENERE, load_artifact, parse_vigenere_table,
+                            read_table_file, vigenere_inverse)
+
+# The bytes API works through inputs in pieces of this size
+BYTES_CHUNK_SIZE = 1024 * 1024
+_TO_UPPER = bytes.maketrans(b'abcdefghijklmnopqrstuvwxyz', b'ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+_NON_UPPER = bytes(b for b in range(256) if not ord('A') <= b <= ord('Z'))
+_NON_LETTERS = _NON_UPPER.translate(None, b'abcdefghijklmnopqrstuvwxyz')
+_SEPARATORS = re.compile(rb'([^A-Z]+)')
+
 
 class VigenereCipher:
-    def __init__(self, key, table=None):
-        """Initialize Vigenère cipher with a key and optional custom table"""
+    preserves_length = True  # ciphertext is as long as the plaintext
+    
+    def __init__(self, key, table=None, inverse=None):
+        """Initialize Vigenère cipher with a key and optional custom table
+
+        The table must have rows that are permutations of A-Z; inverse (the
+        decryption lookup) is computed from it unless given. All tables are
+        built here and frozen into tuples, so an instance holds no mutable
+        state and can be shared between threads.
+        """
         self.key = key.upper()
-        self.table = table if table is not None else self._create_standard_table()
+        table = table if table is not None else self._create_standard_table()
+        inverse = inverse if inverse is not None else vigenere_inverse(table)
+        self.table = tuple(tuple(row) for row in table)
+        self.inverse = tuple(tuple(row) for row in inverse)
+        # (encryption, decryption) byte tables; None if the key cannot use them
+        self._byte_tables = None
+        if self.key and all('A' <= char <= 'Z' for char in self.key):
+            self._byte_tables = (self._build_byte_tables(False), self._build_byte_tables(True))
     
     def _create_standard_table(self):
         """Create standard Vigenère table (26x26)"""
@@ -60,30 +88,111 @@ class VigenereCipher:
         
         for i, char in enumerate(ciphertext):
             if char.isalpha():
-                # Use table for decryption - find column in row
+                # Inverse table gives the column holding the ciphertext character
                 row = ord(key[i]) - ord('A')
-                # Find which column gives us the ciphertext character
-                for col in range(26):
-                    if self.table[row][col] == char:
-                        plaintext += chr(col + ord('A'))
-                        break
+                col = self.inverse[row][ord(char) - ord('A')]
+                plaintext += chr(col + ord('A'))
             else:
                 plaintext += char
         
         return plaintext
     
+    def encrypt_bytes(self, data, out=None, key_offset=0):
+        """Encrypt ASCII text held in bytes, bytearray, memoryview or mmap
+
+        Gives the same result as encrypt() without decoding the text to a
+        str. Returns bytes, or writes into out (any writable buffer of the
+        same length, e.g. an mmap of the output file) and returns out. data
+        and out may be the same buffer. key_offset is the number of letters
+        that came before data, for encrypting a text piece by piece.
+        """
+        return self._transform_bytes(data, out, key_offset, decrypt=False)
+    
+    def decrypt_bytes(self, data, out=None, key_offset=0):
+        """Decrypt ASCII text held in a bytes-like object or mmap (see encrypt_bytes)"""
+        return self._transform_bytes(data, out, key_offset, decrypt=True)
+    
+    @staticmethod
+    def count_letters(data):
+        """Number of letters (which advance the key) in a bytes-like text piece
+
+        The key_offset of a piece is the count of all pieces before it.
+        """
+        with memoryview(data) as raw, raw.cast('B') as view:
+            return sum(len(bytes(view[start:start + BYTES_CHUNK_SIZE]).translate(None, _NON_LETTERS))
+                       for start in range(0, len(view), BYTES_CHUNK_SIZE))
+    
+    def _tables_for(self, decrypt):
+        """One 256-byte translation table per key letter"""
+        if self._byte_tables is None:
+            raise ValueError("Vigenère key must consist of letters A-Z")
+        return self._byte_tables[decrypt]
+    
+    def _build_byte_tables(self, decrypt):
+        tables = []
+        for char in self.key:
+            row = ord(char) - ord('A')
+            table = bytearray(range(256))
+            for col in range(26):
+                if decrypt:
+                    table[ord('A') + col] = ord('A') + self.inverse[row][col]
+                else:
+                    table[ord('A') + col] = ord(self.table[row][col])
+            tables.append(bytes(table))
+        return tuple(tables)
+    
+    def _transform_bytes(self, data, out, key_offset, decrypt):
+        tables = self._tables_for(decrypt)
+        with memoryview(data) as raw, raw.cast('B') as view:
+            if out is None:
+                return b''.join(self._transform_chunks(view, tables, key_offset))
+            with memoryview(out) as raw_out, raw_out.cast('B') as target:
+                if len(target) != len(view):
+                    raise ValueError(f"Output buffer holds {len(target)} bytes, need {len(view)}")
+                start = 0
+                for done in self._transform_chunks(view, tables, key_offset):
+                    target[start:start + len(done)] = done
+                    start += len(done)
+            return out
+    
+    @staticmethod
+    def _transform_chunks(view, tables, key_offset):
+        """Yield the transformed text chunk by chunk"""
+        key_len = len(tables)
+        offset = key_offset % key_len
+        for start in range(0, len(view), BYTES_CHUNK_SIZE):
+            chunk = bytes(view[start:start + BYTES_CHUNK_SIZE])
+            if not chunk.isascii():
+                raise ValueError(f"Input is not ASCII text (near byte {start})")
+            upper = chunk.translate(_TO_UPPER)
+            letters = upper.translate(None, _NON_UPPER)
+            done = bytearray(letters)
+            # Letters i, i + key_len, ... share a key letter: one translate each
+            for r in range(min(key_len, len(letters))):
+                done[r::key_len] = letters[r::key_len].translate(tables[(offset + r) % key_len])
+            offset = (offset + len(letters)) % key_len
+            if len(letters) != len(upper):
+                # Put the non-letters back between the runs of letters
+                parts = _SEPARATORS.split(upper)
+                ends = list(accumulate(map(len, parts[0::2])))
+                parts[0::2] = map(done.__getitem__, map(slice, [0] + ends[:-1], ends))
+                done = b''.join(parts)
+            yield done
+    
     @classmethod
     def from_table(cls, key, table_content):
-        """Create VigenereCipher from a table file content"""
-        # Parse the table - expecting 26x26 characters
-        chars = ''.join(c.upper() for c in table_content if c.isalpha())
-        
-        if len(chars) != 676:  # 26x26
-            raise ValueError(f"Table must contain exactly 676 alphabetic characters (26x26), got {len(chars)}")
-        
-        # Create 26x26 table
-        table = []
-        for i in range(26):
-            table.append(list(chars[i*26:(i+1)*26]))
-        
-        return cls(key, table)
+        """Create VigenereCipher from a table file content
+
+        Raises ValueError unless the table is 26x26 with every row a
+        permutation of A-Z.
+        """
+        return cls(key, parse_vigenere_table(table_content))
+    
+    @classmethod
+    def from_table_file(cls, key, path):
+        """Create VigenereCipher from a text table or a compiled table artifact"""
+        artifact, table_content = read_table_file(path)
+        if artifact is not None:
+            table, inverse = load_artifact(artifact, KIND_VIGENERE)
+            return cls(key, table, inverse)
+        return cls.from_table(key, table_content)
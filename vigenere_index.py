@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Letter-Count Index for Random-Access Vigenère
+The key position at any byte of a Vigenère text is the number of letters
+before it, so decrypting a slice from the middle of a file normally means
+counting from the start. A sidecar index ('<file>.vidx') records the
+cumulative letter count every interval bytes; a reader restores the key
+position from the nearest checkpoint before an offset, counts the few
+letters after it and decrypts only the window asked for.
+
+Vigenère maps letters to letters and keeps everything else, so plaintext
+and ciphertext have the same letter counts: one index serves both, and it
+can be built without the key. process_text_file builds it during
+encryption or decryption (index_interval=...), or it can be built
+afterwards:
+
+    python vigenere_index.py build archive.txt.enc
+    python vigenere_index.py read archive.txt.enc --key LEMON --offset 1G --length 4K
+    python vigenere_index.py grep 'ACCOUNT \\d+' archive.txt.enc --key LEMON
+
+The index records the size and modification time of its file and is
+rejected once the file changes.
+"""
+
+import argparse
+import io
+import mmap
+import os
+import re
+import struct
+import sys
+
+from atomic_output import DEFAULT_FSYNC, AtomicOutput
+from file_ops import parse_size
+from vigenere_cipher import BYTES_CHUNK_SIZE, VigenereCipher
+
+INDEX_SUFFIX = '.vidx'
+DEFAULT_INTERVAL = BYTES_CHUNK_SIZE
+MAGIC = b'VIDX'
+VERSION = 1
+_HEADER = struct.Struct('<4sBIQQ')  # magic, version, interval, file size, file mtime_ns
+# grep decrypts this much at a time
+GREP_WINDOW = 4 * 1024 * 1024
+
+
+def index_path(path):
+    """Location of the sidecar index of path"""
+    return path + INDEX_SUFFIX
+
+
+class LetterIndex:
+    """Cumulative letter counts at every interval bytes of a text file
+
+    counts[i] is the number of letters before byte i * interval.
+    """
+    def __init__(self, interval, counts, size, mtime_ns=0):
+        if interval <= 0:
+            raise ValueError("Index interval must be positive")
+        self.interval = interval
+        self.counts = counts
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    def checkpoint(self, offset):
+        """(offset, letters before it) of the last checkpoint at or before offset"""
+        i = min(offset // self.interval, len(self.counts) - 1)
+        return i * self.interval, self.counts[i]
+
+    def matches(self, path):
+        """True if path is still the file the index was built for"""
+        st = os.stat(path)
+        return st.st_size == self.size and st.st_mtime_ns == self.mtime_ns
+
+    def to_bytes(self):
+        return (_HEADER.pack(MAGIC, VERSION, self.interval, self.size, self.mtime_ns)
+                + struct.pack(f'<{len(self.counts)}Q', *self.counts))
+
+    @classmethod
+    def from_bytes(cls, data):
+        if len(data) < _HEADER.size:
+            raise ValueError("Letter index is truncated")
+        magic, version, interval, size, mtime_ns = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not a Vigenère letter index")
+        if version != VERSION:
+            raise ValueError(f"Unsupported letter index version {version}")
+        if interval == 0:
+            raise ValueError("Letter index is corrupted (checkpoint interval is 0)")
+        count = (len(data) - _HEADER.size) // 8
+        if count != max(-(-size // interval), 1) or (len(data) - _HEADER.size) % 8:
+            raise ValueError("Letter index is truncated or corrupted")
+        return cls(interval, list(struct.unpack_from(f'<{count}Q', data, _HEADER.size)),
+                   size, mtime_ns)
+
+    def write(self, path, fsync=DEFAULT_FSYNC):
+        with AtomicOutput(path, fsync) as out:
+            out.write(self.to_bytes())
+
+    @classmethod
+    def read(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+
+class IndexBuilder:
+    """Builds a LetterIndex from the pieces of a text, in order
+
+    Feed it the plaintext or the ciphertext with update(); pieces may have
+    any length. finish(path) stamps the index with the file's size and
+    modification time.
+    """
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        if interval <= 0:
+            raise ValueError("Index interval must be positive")
+        self.interval = interval
+        self.counts = [0]
+        self.letters = 0  # letters seen so far, i.e. the key offset of the next piece
+        self.offset = 0
+
+    def update(self, data):
+        with memoryview(data) as raw, raw.cast('B') as view:
+            start = 0
+            while start < len(view):
+                # Stop at the next checkpoint
+                end = min(len(view), start + self.interval - self.offset % self.interval)
+                self.letters += VigenereCipher.count_letters(view[start:end])
+                self.offset += end - start
+                start = end
+                if self.offset % self.interval == 0:
+                    self.counts.append(self.letters)
+        return self.letters
+
+    def finish(self, path):
+        st = os.stat(path)
+        if st.st_size != self.offset:
+            raise ValueError(f"Indexed {self.offset} bytes but '{path}' holds {st.st_size}")
+        counts = self.counts[:max(-(-self.offset // self.interval), 1)]
+        return LetterIndex(self.interval, counts, st.st_size, st.st_mtime_ns)
+
+
+def build_index(path, interval=DEFAULT_INTERVAL, fsync=DEFAULT_FSYNC):
+    """Count the letters of path (plaintext or ciphertext) and write its sidecar index"""
+    builder = IndexBuilder(interval)
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                builder.update(data)
+    index = builder.finish(path)
+    index.write(index_path(path), fsync)
+    return index
+
+
+def load_index(path):
+    """The sidecar index of path, or None if it has none
+
+    Raises ValueError if the index no longer matches the file.
+    """
+    try:
+        index = LetterIndex.read(index_path(path))
+    except FileNotFoundError:
+        return None
+    if not index.matches(path):
+        raise ValueError(f"The letter index of '{path}' is out of date; rebuild it with "
+                         f"'vigenere_index.py build'")
+    return index
+
+
+class VigenereRangeReader(io.RawIOBase):
+    """A seekable, read-only view of a Vigenère file, decrypted window by window
+
+    Uses the sidecar index when there is one (pass index=False to ignore
+    it); without one the key position of a window is counted from the
+    start of the file, or from the end of the previous read when reading
+    forward. operation "encrypt" reads a plaintext file as its ciphertext
+    instead.
+    """
+    def __init__(self, cipher, path, index=None, operation="decrypt"):
+        super().__init__()
+        if operation not in ("encrypt", "decrypt"):
+            raise ValueError(f"Unknown operation '{operation}'")
+        self.cipher = cipher
+        self.transform = cipher.decrypt_bytes if operation == "decrypt" else cipher.encrypt_bytes
+        if index is None:
+            index = load_index(path)
+        self.index = index or None
+        self._file = open(path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        self._pos = 0
+        self._last = (0, 0)  # (offset, letters before it) after the latest read
+
+    def key_offset(self, offset):
+        """Letters before offset: the key position of a window starting there"""
+        start, letters = self.index.checkpoint(offset) if self.index is not None else (0, 0)
+        if start < self._last[0] <= offset:
+            # Sequential reads continue from where the previous window ended
+            start, letters = self._last
+        with memoryview(self._data) as view:
+            return letters + VigenereCipher.count_letters(view[start:offset])
+
+    def read_range(self, offset, length):
+        """Decrypt bytes [offset, offset + length), clipped to the end"""
+        if offset < 0 or length < 0:
+            raise ValueError("Offset and length must not be negative")
+        end = min(offset + length, self.size)
+        if offset >= end:
+            return b''
+        key_offset = self.key_offset(offset)
+        with memoryview(self._data) as view:
+            window = view[offset:end]
+            result = self.transform(window, key_offset=key_offset)
+            self._last = (end, key_offset + VigenereCipher.count_letters(window))
+            window.release()
+        return result
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        with memoryview(b) as raw, raw.cast('B') as view:
+            data = self.read_range(self._pos, len(view))
+            view[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        elif whence != os.SEEK_SET:
+            raise ValueError(f"Invalid whence ({whence})")
+        if offset < 0:
+            raise ValueError(f"Negative seek position {offset}")
+        self._pos = offset
+        return offset
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            if self.size:
+                self._data.close()
+            self._file.close()
+        super().close()
+
+
+def grep(reader, pattern, offset=0, length=None, window=GREP_WINDOW):
+    """Yield (byte offset, line) for decrypted lines matching the regex pattern
+
+    Only [offset, offset + length) is searched; lines are cut at its ends.
+    Matching ignores case, since Vigenère text decrypts to upper case.
+    """
+    regex = re.compile(pattern.encode('ascii') if isinstance(pattern, str) else pattern,
+                       re.IGNORECASE)
+    end = reader.size if length is None else min(offset + length, reader.size)
+    carry = b''
+    line_start = pos = offset
+    while pos < end:
+        size = min(window, end - pos)
+        lines = (carry + reader.read_range(pos, size)).split(b'\n')
+        pos += size
+        carry = lines.pop()  # an unfinished line, or b'' after a newline
+        for line in lines:
+            if regex.search(line):
+                yield line_start, line
+            line_start += len(line) + 1
+    if carry and regex.search(carry):
+        yield line_start, carry
+
+
+def _load_vigenere(key, table_path=None):
+    if table_path:
+        return VigenereCipher.from_table_file(key, table_path)
+    return VigenereCipher(key)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index Vigenère files for random access, and "
+                                                 "read or search them by offset")
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="Write the sidecar index of files (no key needed)")
+    build.add_argument('inputs', nargs='+')
+    build.add_argument('--interval', type=parse_size, default=DEFAULT_INTERVAL,
+                       help="Bytes between checkpoints (default: 1M)")
+    for name, text in (('read', "Decrypt a byte range"), ('grep', "Print matching decrypted lines")):
+        command = sub.add_parser(name, help=text)
+        if name == 'grep':
+            command.add_argument('pattern', help="Regular expression (case-insensitive)")
+        command.add_argument('input')
+        command.add_argument('--key', required=True, help="Vigenère key")
+        command.add_argument('--table', help="Custom table file or compiled table")
+        command.add_argument('--offset', type=parse_size, default=0)
+        command.add_argument('--length', type=parse_size, help="Bytes (default: to the end)")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'build':
+            for path in args.inputs:
+                index = build_index(path, args.interval)
+                print(f"{index_path(path)}: {len(index.counts)} checkpoint(s)")
+            return 0
+        cipher = _load_vigenere(args.key, args.table)
+        with VigenereRangeReader(cipher, args.input) as reader:
+            if args.command == 'read':
+                length = reader.size if args.length is None else args.length
+                sys.stdout.buffer.write(reader.read_range(args.offset, length))
+                sys.stdout.buffer.flush()
+                return 0
+            found = False
+            for offset, line in grep(reader, args.pattern, args.offset, args.length):
+                print(f"{offset}:{line.decode('ascii')}")
+                found = True
+            return 0 if found else 1
+    except (OSError, ValueError, re.error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())